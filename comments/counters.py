@@ -0,0 +1,136 @@
+"""
+Denormalized comment counters.
+
+Every comment stores how many direct replies and how many replies at any depth
+it has, plus how many admin replies (``CommentReply``) were posted to it. Every
+commented object (article, book, news item, review) stores its number of active
+comments. The receivers in ``comments.models`` keep them current with F()
+updates on create, delete and visibility changes. Writes that bypass signals,
+such as ``QuerySet.update()``, can leave them off;
+``python manage.py recount_comments`` recomputes them all in bulk.
+"""
+from django.apps import apps
+from django.db.models import F, Func, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+from django.utils import timezone
+
+# comment model label -> (field pointing at the commented object, CommentReply.comment_type)
+COMMENT_MODELS = {
+    'comments.blogcomment': ('article', 'blog'),
+    'comments.bookcomment': ('book', 'book'),
+    'comments.bookreviewcomment': ('review', 'bookreview'),
+    'comments.newscomment': ('news', 'news'),
+}
+
+
+def model_for_comment_type(comment_type):
+    for label, (_, model_comment_type) in COMMENT_MODELS.items():
+        if model_comment_type == comment_type:
+            return apps.get_model(label)
+    return None
+
+
+def object_id_for(comment_type, comment_id):
+    """Id of the object a ``comment_type`` comment was posted on, or ``None``."""
+    model = model_for_comment_type(comment_type)
+    if model is None:
+        return None
+    field = COMMENT_MODELS[model._meta.label_lower][0]
+    return model.objects.filter(pk=comment_id).values_list(f'{field}_id', flat=True).first()
+
+
+def _ancestor_ids(path):
+    return [int(segment) for segment in path.split('/')] if path else []
+
+
+def _add(queryset, **deltas):
+    """
+    Add ``deltas`` to counters of the comments in ``queryset``. Moves their
+    ``updated_at`` too, since ``has_replies`` in ``?since=`` syncs derives
+    from the counters.
+    """
+    queryset.update(updated_at=timezone.now(), **{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def _adjust_target(comment, delta):
+    field = COMMENT_MODELS[comment._meta.label_lower][0]
+    target_model = comment._meta.get_field(field).related_model
+    target_model.objects.filter(pk=getattr(comment, f'{field}_id')).update(
+        comment_count=F('comment_count') + delta
+    )
+
+
+def comment_added(comment):
+    """Count a new comment. Called once its path is set."""
+    model = type(comment)
+    if comment.parent_id:
+        _add(model.objects.filter(pk=comment.parent_id), direct_reply_count=1)
+        _add(model.objects.filter(pk__in=_ancestor_ids(comment.path)[:-1]), descendant_count=1)
+    if comment.is_active:
+        _adjust_target(comment, 1)
+
+
+def comment_removed(comment):
+    """Undo ``comment_added``. Runs once per comment, also for cascaded replies."""
+    model = type(comment)
+    if comment.parent_id:
+        _add(model.objects.filter(pk=comment.parent_id), direct_reply_count=-1)
+        _add(model.objects.filter(pk__in=_ancestor_ids(comment.path)[:-1]), descendant_count=-1)
+    if comment.is_active:
+        _adjust_target(comment, -1)
+
+
+def comment_moved(comment, old_path):
+    """Move ``comment`` and its replies from under ``old_path`` to ``comment.path``."""
+    model = type(comment)
+    old_ancestors = _ancestor_ids(old_path)[:-1]
+    new_ancestors = _ancestor_ids(comment.path)[:-1]
+    moved = 1 + model.objects.filter(pk=comment.pk).values_list('descendant_count', flat=True).get()
+    if old_ancestors:
+        _add(model.objects.filter(pk=old_ancestors[-1]), direct_reply_count=-1)
+        _add(model.objects.filter(pk__in=old_ancestors), descendant_count=-moved)
+    if new_ancestors:
+        _add(model.objects.filter(pk=new_ancestors[-1]), direct_reply_count=1)
+        _add(model.objects.filter(pk__in=new_ancestors), descendant_count=moved)
+
+
+def visibility_changed(comment):
+    _adjust_target(comment, 1 if comment.is_active else -1)
+
+
+def admin_reply_changed(reply, delta):
+    model = model_for_comment_type(reply.comment_type)
+    if model is not None:
+        _add(model.objects.filter(pk=reply.comment_id), admin_reply_count=delta)
+
+
+def _count(queryset):
+    return Coalesce(Subquery(queryset.order_by().annotate(n=Func('pk', function='COUNT')).values('n')), 0)
+
+
+def recount():
+    """
+    Recompute every counter from the comment tables in one UPDATE per model.
+    Only rows whose counters were off are written (and, for comments, get a
+    new ``updated_at``). Returns the number of rows corrected per model label.
+    """
+    comment_reply = apps.get_model('library_admin', 'CommentReply')
+    updated = {}
+    for label, (field, comment_type) in COMMENT_MODELS.items():
+        model = apps.get_model(label)
+        counts = {
+            'direct_reply_count': _count(model.objects.filter(parent=OuterRef('pk'))),
+            'descendant_count': _count(model.objects.filter(
+                path__gt=OuterRef('path'), path__lt=Concat(OuterRef('path'), Value('0')),
+            )),
+            'admin_reply_count': _count(
+                comment_reply.objects.filter(comment_type=comment_type, comment_id=OuterRef('pk'))
+            ),
+        }
+        updated[model._meta.label] = model.objects.exclude(**counts).update(updated_at=timezone.now(), **counts)
+        target_model = model._meta.get_field(field).related_model
+        comment_count = _count(model.objects.filter(**{field: OuterRef('pk')}, is_active=True))
+        updated[target_model._meta.label] = target_model.objects.exclude(comment_count=comment_count).update(
+            comment_count=comment_count,
+        )
+    return updated
@@ -0,0 +1,87 @@
+"""
+Cross-type comment listings for the admin comments dashboard.
+
+Pages are read from ``CommentIndex`` with one indexed, keyset paginated query
+(``library_admin.pagination``) ordered newest first, whatever the filters: top
+level comments, a single user's history, or the moderation queue of hidden
+comments and replies. The page's comments are then fetched by id, one query
+per comment type on the page, with the commented object's title, the username
+and the stored reply counters joined in.
+"""
+from django.db.models import F
+
+from library_admin.models import CommentReply
+from library_admin.pagination import keyset_page, parse_limit
+
+from .models import COMMENT_TYPES, CommentIndex
+
+TARGET_TITLES = {
+    'blog': 'article__title',
+    'book': 'book__title',
+    'bookreview': 'review__book__title',
+    'news': 'news__title',
+}
+TYPE_LABELS = dict(CommentReply.COMMENT_TYPE_CHOICES)
+
+VISIBILITY = {'all': None, 'active': True, 'hidden': False}
+
+COLUMNS = (
+    'id', 'date', 'name', 'user_id', 'username', 'comment', 'rating', 'is_active',
+    'parent_id', 'target_title', 'descendant_count', 'admin_reply_count',
+)
+
+DEFAULT_LIMIT = 50
+
+
+def index_queryset(request, default_scope='all'):
+    """``CommentIndex`` rows matching the dashboard filters in ``request``."""
+    entries = CommentIndex.objects.all()
+    if request.GET.get('scope', default_scope) == 'top':
+        entries = entries.filter(parent_id__isnull=True)
+    comment_type = request.GET.get('type', 'all')
+    if comment_type in COMMENT_TYPES:
+        entries = entries.filter(comment_type=comment_type)
+    is_active = VISIBILITY.get(request.GET.get('visibility', 'all'))
+    if is_active is not None:
+        entries = entries.filter(is_active=is_active)
+    user_id = request.GET.get('user', '')
+    if user_id.isdigit():
+        entries = entries.filter(user_id=int(user_id))
+    return entries
+
+
+def _load_comments(entries):
+    """Fetch the comments behind ``entries``, one query per comment type."""
+    ids_by_type = {}
+    for entry in entries:
+        ids_by_type.setdefault(entry['comment_type'], []).append(entry['comment_id'])
+    comments = {}
+    for comment_type, ids in ids_by_type.items():
+        rows = COMMENT_TYPES[comment_type].objects.filter(pk__in=ids).annotate(
+            username=F('user__username'),
+            target_title=F(TARGET_TITLES[comment_type]),
+        ).values(*COLUMNS)
+        for row in rows:
+            row['type'] = comment_type
+            row['type_label'] = TYPE_LABELS[comment_type]
+            comments[comment_type, row['id']] = row
+    return comments
+
+
+def load_page(request, default_scope='all'):
+    """
+    Return ``(rows, next_cursor)`` for the dashboard page in ``request``.
+
+    Filters: ``?type=`` (a comment type or ``all``), ``?visibility=``
+    (``all``, ``active`` or ``hidden``), ``?user=`` (a user id) and
+    ``?scope=`` (``all`` lists replies too, ``top`` only top-level comments;
+    ``default_scope`` applies when it is missing). Raises ``InvalidCursor``
+    for a malformed ``?cursor=``.
+    """
+    entries = index_queryset(request, default_scope).values('id', 'comment_type', 'comment_id')
+    entries, next_cursor = keyset_page(
+        request, entries, 'dashboard', 'date', descending=True, limit=parse_limit(request, DEFAULT_LIMIT),
+    )
+    comments = _load_comments(entries)
+    rows = [comments[key] for key in ((entry['comment_type'], entry['comment_id']) for entry in entries) if key in comments]
+    return rows, next_cursor
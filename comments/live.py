@@ -0,0 +1,234 @@
+"""
+Live comment updates for the public comment section.
+
+Comment and admin reply writes are published as small JSON deltas on a channel
+per commented object (``<comment_type>:<object_id>``) once their transaction
+commits. ``stream()`` relays one channel as Server-Sent Events for the async
+``comment_stream`` view. The broker is picked by ``COMMENT_STREAM_BROKER``:
+the default ``InProcessBroker`` only reaches streams served by the same
+process, so deployments running several ASGI workers switch to
+``RedisBroker`` (needs the ``redis`` package and
+``COMMENT_STREAM_REDIS_URL``).
+
+Events, all carrying the comment ``id`` and its top-level ``thread_id``:
+
+* ``comment``: a comment or reply was posted or changed, as serialized by
+  ``threads.describe_changes``: ids only when it is hidden.
+* ``comment_deleted``: sent once per deleted comment, replies included.
+* ``admin_reply`` and ``admin_reply_deleted``: an admin reply to the top-level
+  comment ``thread_id`` was saved or deleted. A hidden one, or one to a hidden
+  comment, is sent as ids only (``threads.describe_admin_reply``).
+* ``resync``: this stream fell behind and dropped events, so reload the list.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import cache, partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from . import counters, threads
+
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 5000
+QUEUE_SIZE = 100
+CHANNEL_PREFIX = 'comments:'
+
+
+def channel_for(comment_type, object_id):
+    return f"{comment_type}:{object_id}"
+
+
+class _LocalSubscription:
+    def __init__(self, broker, channel):
+        self._broker = broker
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def deliver(self, event):
+        # Publishers run in worker threads; hand the event to the stream's loop.
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # The loop is gone; close() is on its way.
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A stalled reader: drop what it missed and have it reload.
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait({'type': 'resync'})
+
+    async def get(self, timeout):
+        """The next event, or ``None`` after ``timeout`` seconds without one."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self._broker._unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fan events out to the streams served by this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def has_subscribers(self, channel):
+        with self._lock:
+            return bool(self._subscriptions.get(channel))
+
+    def subscribe(self, channel):
+        """Subscribe to ``channel``. Must be called from the stream's event loop."""
+        subscription = _LocalSubscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            channel_subscriptions = self._subscriptions.get(subscription.channel)
+            if channel_subscriptions is not None:
+                channel_subscriptions.discard(subscription)
+                if not channel_subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+
+class _RedisSubscription:
+    def __init__(self, url, channel):
+        from redis import asyncio as aioredis
+
+        self._client = aioredis.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._channel = channel
+        self._subscribed = False
+
+    async def get(self, timeout):
+        if not self._subscribed:
+            await self._pubsub.subscribe(self._channel)
+            self._subscribed = True
+        message = await self._pubsub.get_message(timeout=timeout)
+        return json.loads(message['data']) if message else None
+
+    async def close(self):
+        await self._pubsub.aclose()
+        await self._client.aclose()
+
+
+class RedisBroker:
+    """Fan events out through Redis pub/sub, across processes and hosts."""
+
+    def __init__(self, url=None):
+        import redis
+
+        self._url = url or settings.COMMENT_STREAM_REDIS_URL
+        self._client = redis.Redis.from_url(self._url)
+
+    def publish(self, channel, event):
+        self._client.publish(CHANNEL_PREFIX + channel, json.dumps(event))
+
+    def has_subscribers(self, channel):
+        return any(count for _, count in self._client.pubsub_numsub(CHANNEL_PREFIX + channel))
+
+    def subscribe(self, channel):
+        return _RedisSubscription(self._url, CHANNEL_PREFIX + channel)
+
+
+@cache
+def get_broker():
+    return import_string(getattr(settings, 'COMMENT_STREAM_BROKER', 'comments.live.InProcessBroker'))()
+
+
+def _format(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream(channel):
+    """Server-Sent Events for ``channel``, with a keepalive comment when idle."""
+    subscription = get_broker().subscribe(channel)
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        # Sent once subscribed: a reconnecting client reloads what it missed.
+        yield _format('ready', {})
+        while True:
+            event = await subscription.get(HEARTBEAT_SECONDS)
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                data = dict(event)  # Shared with the other subscribers.
+                yield _format(data.pop('type'), data)
+    finally:
+        await subscription.close()
+
+
+def _publish(comment_type, object_id, build_event):
+    """
+    Publish the event returned by ``build_event()`` once the transaction
+    commits, if anyone is listening then; it is only built in that case.
+    """
+    def publish():
+        broker = get_broker()
+        channel = channel_for(comment_type, object_id)
+        if broker.has_subscribers(channel):
+            broker.publish(channel, build_event())
+
+    transaction.on_commit(publish)
+
+
+def _target(comment):
+    field, comment_type = counters.COMMENT_MODELS[comment._meta.label_lower]
+    return comment_type, getattr(comment, f'{field}_id')
+
+
+def comment_event(comment):
+    event = threads.describe_changes([comment])[0]
+    event['type'] = 'comment'
+    return event
+
+
+def comment_saved(comment):
+    """Publish ``comment`` once it is saved and its path is set."""
+    _publish(*_target(comment), partial(comment_event, comment))
+
+
+def comment_deleted(comment):
+    event = {'type': 'comment_deleted', 'id': comment.pk, 'thread_id': threads.thread_id(comment)}
+    _publish(*_target(comment), lambda: event)
+
+
+def admin_reply_event(reply):
+    model = counters.model_for_comment_type(reply.comment_type)
+    thread_visible = model.objects.filter(pk=reply.comment_id, is_active=True).exists()
+    event = threads.describe_admin_reply(reply, thread_visible)
+    event['type'] = 'admin_reply'
+    return event
+
+
+def admin_reply_saved(reply):
+    object_id = counters.object_id_for(reply.comment_type, reply.comment_id)
+    if object_id is None:
+        return
+    _publish(reply.comment_type, object_id, partial(admin_reply_event, reply))
+
+
+def admin_reply_deleted(reply):
+    object_id = counters.object_id_for(reply.comment_type, reply.comment_id)
+    if object_id is None:
+        return
+    event = {'type': 'admin_reply_deleted', 'id': reply.pk, 'thread_id': reply.comment_id}
+    _publish(reply.comment_type, object_id, lambda: event)
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+PATH_SEGMENT_WIDTH = 10
+
+
+def backfill_paths(apps, schema_editor):
+    for name in ('BlogComment', 'BookComment', 'BookReviewComment', 'NewsComment'):
+        model = apps.get_model('comments', name)
+        parents = dict(model.objects.values_list('pk', 'parent_id'))
+        paths = {}
+
+        def path_for(pk):
+            # Walk up to the first comment whose path is known, then back down.
+            chain = []
+            while pk is not None and pk not in paths:
+                chain.append(pk)
+                pk = parents.get(pk)
+            prefix = paths.get(pk, '')
+            for node in reversed(chain):
+                segment = str(node).zfill(PATH_SEGMENT_WIDTH)
+                prefix = paths[node] = f"{prefix}/{segment}" if prefix else segment
+            return prefix
+
+        batch = []
+        for pk in parents:
+            batch.append(model(pk=pk, path=path_for(pk)))
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, ['path'])
+                batch = []
+        model.objects.bulk_update(batch, ['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0004_blogcomment_parent_is_admin_reply_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogcomment',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1000),
+        ),
+        migrations.AddField(
+            model_name='bookcomment',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1000),
+        ),
+        migrations.AddField(
+            model_name='bookreviewcomment',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1000),
+        ),
+        migrations.AddField(
+            model_name='newscomment',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1000),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:58
+
+from django.db import migrations, models
+from django.db.models import Func, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+
+# As in comments.counters when this migration was written: comment model ->
+# (field pointing at the commented object, CommentReply.comment_type).
+COMMENT_MODELS = {
+    'comments.blogcomment': ('article', 'blog'),
+    'comments.bookcomment': ('book', 'book'),
+    'comments.bookreviewcomment': ('review', 'bookreview'),
+    'comments.newscomment': ('news', 'news'),
+}
+
+
+def count(queryset):
+    return Coalesce(Subquery(queryset.order_by().annotate(n=Func('pk', function='COUNT')).values('n')), 0)
+
+
+def count_existing(apps, schema_editor):
+    comment_reply = apps.get_model('library_admin', 'CommentReply')
+    for label, (field, comment_type) in COMMENT_MODELS.items():
+        model = apps.get_model(label)
+        model.objects.update(
+            direct_reply_count=count(model.objects.filter(parent=OuterRef('pk'))),
+            descendant_count=count(model.objects.filter(
+                path__gt=OuterRef('path'), path__lt=Concat(OuterRef('path'), Value('0')),
+            )),
+            admin_reply_count=count(comment_reply.objects.filter(comment_type=comment_type, comment_id=OuterRef('pk'))),
+        )
+        target_model = model._meta.get_field(field).related_model
+        target_model.objects.update(
+            comment_count=count(model.objects.filter(**{field: OuterRef('pk')}, is_active=True)),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0005_comment_paths'),
+        ('library_admin', '0050_comment_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogcomment',
+            name='admin_reply_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogcomment',
+            name='descendant_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogcomment',
+            name='direct_reply_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookcomment',
+            name='admin_reply_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookcomment',
+            name='descendant_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookcomment',
+            name='direct_reply_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookreviewcomment',
+            name='admin_reply_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookreviewcomment',
+            name='descendant_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookreviewcomment',
+            name='direct_reply_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='newscomment',
+            name='admin_reply_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='newscomment',
+            name='descendant_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='newscomment',
+            name='direct_reply_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
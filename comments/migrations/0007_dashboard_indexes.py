@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0006_comment_counters'),
+        ('library_admin', '0050_comment_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blogcomment',
+            index=models.Index(fields=['parent', 'date', 'id'], name='blogcomment_parent_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcomment',
+            index=models.Index(fields=['parent', 'date', 'id'], name='bookcomment_parent_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookreviewcomment',
+            index=models.Index(fields=['parent', 'date', 'id'], name='reviewcomment_parent_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newscomment',
+            index=models.Index(fields=['parent', 'date', 'id'], name='newscomment_parent_date_idx'),
+        ),
+    ]
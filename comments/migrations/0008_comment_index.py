@@ -0,0 +1,93 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# As in comments.counters when this migration was written: comment model ->
+# (field pointing at the commented object, CommentIndex.comment_type).
+COMMENT_MODELS = {
+    'comments.blogcomment': ('article', 'blog'),
+    'comments.bookcomment': ('book', 'book'),
+    'comments.bookreviewcomment': ('review', 'bookreview'),
+    'comments.newscomment': ('news', 'news'),
+}
+
+
+def index_existing(apps, schema_editor):
+    comment_index = apps.get_model('comments', 'CommentIndex')
+    for label, (field, comment_type) in COMMENT_MODELS.items():
+        model = apps.get_model(label)
+        rows = model.objects.values_list('pk', f'{field}_id', 'parent_id', 'user_id', 'date', 'is_active', 'rating')
+        batch = []
+        for pk, object_id, parent_id, user_id, date, is_active, rating in rows.iterator(chunk_size=2000):
+            batch.append(comment_index(
+                comment_type=comment_type, comment_id=pk, object_id=object_id, parent_id=parent_id,
+                user_id=user_id, date=date, is_active=is_active, rating=rating,
+            ))
+            if len(batch) >= 2000:
+                comment_index.objects.bulk_create(batch)
+                batch = []
+        comment_index.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0007_dashboard_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comment_type', models.CharField(choices=[('blog', 'Blog'), ('book', 'Book'), ('bookreview', 'Book Review'), ('news', 'News')], max_length=20)),
+                ('comment_id', models.IntegerField()),
+                ('object_id', models.IntegerField()),
+                ('parent_id', models.IntegerField(blank=True, null=True)),
+                ('date', models.DateTimeField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('rating', models.IntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='blogcomment',
+            name='blogcomment_parent_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='bookcomment',
+            name='bookcomment_parent_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='bookreviewcomment',
+            name='reviewcomment_parent_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='newscomment',
+            name='newscomment_parent_date_idx',
+        ),
+        migrations.AddField(
+            model_name='commentindex',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='commentindex',
+            index=models.Index(fields=['parent_id', 'date', 'id'], name='commentindex_parent_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commentindex',
+            index=models.Index(fields=['user', 'date', 'id'], name='commentindex_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commentindex',
+            index=models.Index(fields=['is_active', 'date', 'id'], name='commentindex_active_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='commentindex',
+            constraint=models.UniqueConstraint(fields=('comment_type', 'comment_id'), name='commentindex_type_comment_uniq'),
+        ),
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
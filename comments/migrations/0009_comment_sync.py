@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0008_comment_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogcomment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='bookcomment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='bookreviewcomment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='newscomment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name='CommentTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comment_type', models.CharField(choices=[('blog', 'Blog'), ('book', 'Book'), ('bookreview', 'Book Review'), ('news', 'News')], max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('kind', models.CharField(choices=[('comment', 'Comment'), ('admin_reply', 'Admin reply')], max_length=20)),
+                ('item_id', models.IntegerField()),
+                ('thread_id', models.IntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['comment_type', 'object_id', 'deleted_at'], name='tombstone_object_deleted_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0010_comment_path_collation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commentindex',
+            index=models.Index(fields=['date', 'id'], name='commentindex_date_idx'),
+        ),
+    ]
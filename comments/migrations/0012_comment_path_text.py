@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:24
+
+import comments.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0011_dashboard_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogcomment',
+            name='path',
+            field=comments.models.PathField(blank=True, db_index=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='bookcomment',
+            name='path',
+            field=comments.models.PathField(blank=True, db_index=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='bookreviewcomment',
+            name='path',
+            field=comments.models.PathField(blank=True, db_index=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='newscomment',
+            name='path',
+            field=comments.models.PathField(blank=True, db_index=True, editable=False),
+        ),
+    ]
@@ -1,11 +1,129 @@
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from simple_history.models import HistoricalRecords
-from library_admin.models import Article, Book, BookReview, News
+from library_admin import suggestions, versions
+from library_admin.models import Article, Book, BookReview, CommentReply, News
+from . import counters, live, sync, threads
 
 # Create your models here.
 
-class BookReviewComment(models.Model):
+PATH_SEGMENT_WIDTH = 10
+
+# Maintained in the database by ThreadedComment and the counter receivers, so
+# saving an instance loaded earlier must not write its copies back.
+MAINTAINED_FIELDS = ['path', 'direct_reply_count', 'descendant_count', 'admin_reply_count']
+# Not worth a history row.
+THREAD_FIELDS = [*MAINTAINED_FIELDS, 'updated_at']
+
+
+def comment_version_keys(comment):
+    """The API validators a comment write moves: its thread and, for comment_count, its object's table."""
+    field, comment_type = counters.COMMENT_MODELS[comment._meta.label_lower]
+    target_model = comment._meta.get_field(field).related_model
+    return versions.thread_key(comment_type, getattr(comment, f'{field}_id')), versions.model_key(target_model)
+
+
+class PathField(models.TextField):
+    """
+    A ``TextField`` compared byte by byte on every backend.
+
+    Unbounded because a path grows by a segment for every level of a thread;
+    any fixed length would cap how deep replies can nest.
+
+    Subtree range scans need '/' to sort right before the digits. SQLite
+    compares text that way by default; PostgreSQL follows the database locale,
+    which may ignore punctuation, so the column gets the "C" collation there.
+    """
+
+    def db_parameters(self, connection):
+        params = super().db_parameters(connection)
+        if connection.vendor == 'postgresql':
+            params['collation'] = 'C'
+        return params
+
+
+class ThreadedComment(models.Model):
+    """
+    Materialized path for comment threads.
+
+    ``path`` holds the zero-padded ids from the top-level comment down to this
+    one, joined by '/'. A subtree is then a single range scan on the indexed
+    column: every path from ``path`` up to (but excluding) ``path + '0'``,
+    since '/' sorts right before the digits (see ``PathField``). Ordering by
+    ``path`` lists a thread depth-first. The path is set after the first save and rewritten for
+    the whole subtree when a comment moves to another parent. The reply
+    counters in ``comments.counters`` are adjusted at the same time.
+    """
+    path = PathField(db_index=True, editable=False, blank=True)
+    direct_reply_count = models.IntegerField(default=0, editable=False)
+    descendant_count = models.IntegerField(default=0, editable=False)
+    admin_reply_count = models.IntegerField(default=0, editable=False)
+    # Bumped by every save and counter update for ``?since=`` syncs.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered to spot moves and visibility changes on save.
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        instance._loaded_is_active = instance.__dict__.get('is_active')
+        return instance
+
+    def save(self, *args, **kwargs):
+        creating = self._state.adding
+        if not creating and not args and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        self._update_path(creating)
+        # Published here rather than from post_save, which runs before the
+        # path of a new comment is known and before the counters move.
+        live.comment_saved(self)
+        versions.bump(*comment_version_keys(self))
+
+    def _update_path(self, creating):
+        if not creating and self.path and self.parent_id == getattr(self, '_loaded_parent_id', self.parent_id):
+            return
+        # New comment, or moved to another parent: read the current paths
+        # rather than trusting possibly stale instances.
+        model = type(self)
+        parent_path = model.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() if self.parent_id else ''
+        old_path = '' if creating else model.objects.filter(pk=self.pk).values_list('path', flat=True).get()
+        segment = str(self.pk).zfill(PATH_SEGMENT_WIDTH)
+        new_path = f"{parent_path}/{segment}" if parent_path else segment
+        self._loaded_parent_id = self.parent_id
+        if old_path == new_path:
+            return
+        model.objects.filter(pk=self.pk).update(path=new_path)
+        if old_path:
+            # Re-root the replies under the new path.
+            model.objects.filter(path__gt=old_path, path__lt=old_path + '0').update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1))
+            )
+        self.path = new_path
+        if creating:
+            counters.comment_added(self)
+        elif old_path:
+            counters.comment_moved(self, old_path)
+
+    def subtree(self):
+        """This comment and all of its replies at any depth."""
+        return type(self).objects.filter(path__gte=self.path, path__lt=self.path + '0')
+
+    def descendants(self):
+        """All replies to this comment at any depth."""
+        return type(self).objects.filter(path__gt=self.path, path__lt=self.path + '0')
+
+class BookReviewComment(ThreadedComment):
     review = models.ForeignKey(BookReview, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
@@ -15,12 +133,12 @@ class BookReviewComment(models.Model):
     parent = models.ForeignKey('self', null=True, blank=True, related_name='replies', on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
     parent_is_admin_reply = models.BooleanField(default=False)
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=THREAD_FIELDS)
 
     def __str__(self):
         return f"[{self.id}] {self.name} on {self.review.book.title} review"
 
-class BlogComment(models.Model):
+class BlogComment(ThreadedComment):
     article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
@@ -30,12 +148,12 @@ class BlogComment(models.Model):
     parent = models.ForeignKey('self', null=True, blank=True, related_name='replies', on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
     parent_is_admin_reply = models.BooleanField(default=False)
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=THREAD_FIELDS)
 
     def __str__(self):
         return f"[{self.id}] {self.name} on {self.article.title}"
 
-class NewsComment(models.Model):
+class NewsComment(ThreadedComment):
     news = models.ForeignKey(News, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
@@ -45,12 +163,12 @@ class NewsComment(models.Model):
     parent = models.ForeignKey('self', null=True, blank=True, related_name='replies', on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
     parent_is_admin_reply = models.BooleanField(default=False)
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=THREAD_FIELDS)
 
     def __str__(self):
         return f"[{self.id}] {self.name} on {self.news.title}"
 
-class BookComment(models.Model):
+class BookComment(ThreadedComment):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
@@ -60,7 +178,211 @@ class BookComment(models.Model):
     parent = models.ForeignKey('self', null=True, blank=True, related_name='replies', on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
     parent_is_admin_reply = models.BooleanField(default=False)
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=THREAD_FIELDS)
 
     def __str__(self):
         return f"[{self.id}] {self.name} on {self.book.title}"
+
+
+# CommentReply.comment_type -> comment model
+COMMENT_TYPES = {
+    'blog': BlogComment,
+    'book': BookComment,
+    'bookreview': BookReviewComment,
+    'news': NewsComment,
+}
+
+
+class CommentIndex(models.Model):
+    """
+    One row per comment of any type, kept in sync by the receivers below.
+
+    Cross-type listings (the admin dashboard, a user's comment history, the
+    moderation queue of hidden comments) are one indexed query on this table;
+    the comments themselves are then fetched by id, one query per type. Run
+    ``python manage.py rebuild_comment_index`` after writes that bypass
+    signals.
+    """
+    comment_type = models.CharField(max_length=20, choices=CommentReply.COMMENT_TYPE_CHOICES)
+    comment_id = models.IntegerField()
+    object_id = models.IntegerField()
+    parent_id = models.IntegerField(null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    date = models.DateTimeField()
+    is_active = models.BooleanField(default=True)
+    rating = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['comment_type', 'comment_id'], name='commentindex_type_comment_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'id'], name='commentindex_date_idx'),
+            models.Index(fields=['parent_id', 'date', 'id'], name='commentindex_parent_date_idx'),
+            models.Index(fields=['user', 'date', 'id'], name='commentindex_user_date_idx'),
+            models.Index(fields=['is_active', 'date', 'id'], name='commentindex_active_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.comment_type} comment {self.comment_id}"
+
+    @classmethod
+    def entry_for(cls, comment):
+        field, comment_type = counters.COMMENT_MODELS[comment._meta.label_lower]
+        return cls(
+            comment_type=comment_type,
+            comment_id=comment.pk,
+            object_id=getattr(comment, f'{field}_id'),
+            parent_id=comment.parent_id,
+            user_id=comment.user_id,
+            date=comment.date,
+            is_active=comment.is_active,
+            rating=comment.rating,
+        )
+
+    @classmethod
+    def store(cls, entries, batch_size=None):
+        """Insert or update index rows in one statement per batch."""
+        return cls.objects.bulk_create(
+            entries,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['comment_type', 'comment_id'],
+            update_fields=['object_id', 'parent_id', 'user', 'date', 'is_active', 'rating'],
+        )
+
+
+class CommentTombstone(models.Model):
+    """
+    A deleted comment or admin reply, so ``?since=`` syncs can report it.
+
+    Kept for ``comments.sync.TOMBSTONE_RETENTION``; clients syncing from
+    further back are told to reload the whole thread.
+    """
+    KIND_CHOICES = [
+        ('comment', 'Comment'),
+        ('admin_reply', 'Admin reply'),
+    ]
+    comment_type = models.CharField(max_length=20, choices=CommentReply.COMMENT_TYPE_CHOICES)
+    object_id = models.IntegerField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    item_id = models.IntegerField()
+    thread_id = models.IntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['comment_type', 'object_id', 'deleted_at'], name='tombstone_object_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.kind} {self.item_id} on {self.comment_type} {self.object_id}"
+
+
+# Keep the cross-type comment index in sync.
+@receiver(post_save, sender=BookReviewComment)
+@receiver(post_save, sender=BlogComment)
+@receiver(post_save, sender=NewsComment)
+@receiver(post_save, sender=BookComment)
+def update_comment_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        CommentIndex.store([CommentIndex.entry_for(instance)])
+
+@receiver(post_delete, sender=BookReviewComment)
+@receiver(post_delete, sender=BlogComment)
+@receiver(post_delete, sender=NewsComment)
+@receiver(post_delete, sender=BookComment)
+def remove_from_comment_index(sender, instance, **kwargs):
+    comment_type = counters.COMMENT_MODELS[instance._meta.label_lower][1]
+    CommentIndex.objects.filter(comment_type=comment_type, comment_id=instance.pk).delete()
+
+
+# Keep the reply and comment counters in sync.
+@receiver(post_save, sender=BookReviewComment)
+@receiver(post_save, sender=BlogComment)
+@receiver(post_save, sender=NewsComment)
+@receiver(post_save, sender=BookComment)
+def update_comment_counters(sender, instance, created, raw=False, **kwargs):
+    # New comments are counted by ThreadedComment.save() once their path is set.
+    if raw:
+        return
+    if not created and getattr(instance, '_loaded_is_active', None) not in (None, instance.is_active):
+        counters.visibility_changed(instance)
+    # Also for new instances, which are not loaded through from_db().
+    instance._loaded_is_active = instance.is_active
+
+@receiver(post_delete, sender=BookReviewComment)
+@receiver(post_delete, sender=BlogComment)
+@receiver(post_delete, sender=NewsComment)
+@receiver(post_delete, sender=BookComment)
+def remove_comment_from_counters(sender, instance, **kwargs):
+    counters.comment_removed(instance)
+
+@receiver(post_save, sender=CommentReply)
+def count_admin_reply(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.admin_reply_changed(instance, 1)
+
+@receiver(post_delete, sender=CommentReply)
+def uncount_admin_reply(sender, instance, **kwargs):
+    counters.admin_reply_changed(instance, -1)
+
+
+# Book suggestions rank books by their review and comment counts.
+@receiver(post_save, sender=BookComment)
+@receiver(post_delete, sender=BookComment)
+def invalidate_book_suggestions(sender, created=True, **kwargs):
+    if created:
+        suggestions.invalidate()
+
+
+# Push comment changes to open comment streams. Saved comments are published
+# by ThreadedComment.save().
+@receiver(post_delete, sender=BookReviewComment)
+@receiver(post_delete, sender=BlogComment)
+@receiver(post_delete, sender=NewsComment)
+@receiver(post_delete, sender=BookComment)
+def publish_comment_deleted(sender, instance, **kwargs):
+    live.comment_deleted(instance)
+
+@receiver(post_save, sender=CommentReply)
+def publish_admin_reply_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        live.admin_reply_saved(instance)
+
+@receiver(post_delete, sender=CommentReply)
+def publish_admin_reply_deleted(sender, instance, **kwargs):
+    live.admin_reply_deleted(instance)
+
+
+# Leave tombstones for ?since= syncs.
+@receiver(post_delete, sender=BookReviewComment)
+@receiver(post_delete, sender=BlogComment)
+@receiver(post_delete, sender=NewsComment)
+@receiver(post_delete, sender=BookComment)
+def record_deleted_comment(sender, instance, **kwargs):
+    field, comment_type = counters.COMMENT_MODELS[instance._meta.label_lower]
+    sync.record_deletion(comment_type, getattr(instance, f'{field}_id'), 'comment', instance.pk, threads.thread_id(instance))
+
+@receiver(post_delete, sender=CommentReply)
+def record_deleted_admin_reply(sender, instance, **kwargs):
+    object_id = counters.object_id_for(instance.comment_type, instance.comment_id)
+    if object_id is not None:
+        sync.record_deletion(instance.comment_type, object_id, 'admin_reply', instance.pk, instance.comment_id)
+
+
+# Move the API validators of the comment threads. Saved comments are handled
+# by ThreadedComment.save().
+@receiver(post_delete, sender=BookReviewComment)
+@receiver(post_delete, sender=BlogComment)
+@receiver(post_delete, sender=NewsComment)
+@receiver(post_delete, sender=BookComment)
+def bump_deleted_comment_version(sender, instance, **kwargs):
+    versions.bump(*comment_version_keys(instance))
+
+@receiver(post_save, sender=CommentReply)
+@receiver(post_delete, sender=CommentReply)
+def bump_admin_reply_version(sender, instance, raw=False, **kwargs):
+    object_id = None if raw else counters.object_id_for(instance.comment_type, instance.comment_id)
+    if object_id is not None:
+        versions.bump(versions.thread_key(instance.comment_type, object_id))
@@ -0,0 +1,98 @@
+"""
+Incremental ``?since=`` syncs for the comment APIs.
+
+A full comment GET carries its version in the ``X-Comments-Version`` header.
+Passing it back as ``?since=`` returns only what changed after it: comments
+and replies saved since then (posted, edited, hidden or shown again), admin
+replies saved since then, tombstones for deletions, and the version to sync
+from next. Hidden comments and admin replies are sent as ids only, so the
+client drops them without ever seeing their text. Versions are ISO timestamps
+taken when a response starts, minus ``SYNC_OVERLAP``, so a write that commits
+while a response is being built is not missed. A change can then be sent twice; clients apply them idempotently.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from library_admin.models import CommentReply
+
+from . import counters, threads
+
+SYNC_OVERLAP = timedelta(seconds=5)
+TOMBSTONE_RETENTION = timedelta(days=7)
+
+
+class InvalidVersion(ValueError):
+    pass
+
+
+def current_version():
+    return (timezone.now() - SYNC_OVERLAP).isoformat()
+
+
+def parse_version(value):
+    try:
+        since = parse_datetime(value)
+    except ValueError:
+        since = None
+    if since is None:
+        raise InvalidVersion(value)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return since
+
+
+def record_deletion(comment_type, object_id, kind, item_id, thread_id):
+    """Leave a tombstone for a deleted comment or admin reply."""
+    tombstones = apps.get_model('comments', 'CommentTombstone').objects
+    tombstones.filter(
+        comment_type=comment_type, object_id=object_id, deleted_at__lt=timezone.now() - TOMBSTONE_RETENTION,
+    ).delete()
+    tombstones.create(comment_type=comment_type, object_id=object_id, kind=kind, item_id=item_id, thread_id=thread_id)
+
+
+def load_changes(comment_type, object_id, since):
+    """
+    Changes to the comments on one object after version ``since``.
+
+    Returns ``{'version', 'reset', 'comments', 'admin_replies', 'deleted'}``.
+    ``reset`` is true, and nothing else is sent, when ``since`` is older than
+    the tombstones kept: the client has to reload the whole thread. Raises
+    ``InvalidVersion`` for a malformed ``since``.
+    """
+    since = parse_version(since)
+    version = current_version()
+    if since < timezone.now() - TOMBSTONE_RETENTION:
+        return {'version': version, 'reset': True}
+
+    model = counters.model_for_comment_type(comment_type)
+    field = counters.COMMENT_MODELS[model._meta.label_lower][0]
+    on_object = model.objects.filter(**{f'{field}_id': object_id})
+    comments = (
+        on_object.filter(updated_at__gt=since)
+        .select_related('user__userprofile')
+        .order_by('date', 'id')
+    )
+    admin_replies = CommentReply.objects.filter(
+        comment_type=comment_type,
+        comment_id__in=on_object.filter(parent__isnull=True).values('pk'),
+        updated_at__gt=since,
+    ).annotate(
+        thread_visible=Exists(on_object.filter(pk=OuterRef('comment_id'), is_active=True)),
+    ).order_by('date', 'id')
+    tombstones = apps.get_model('comments', 'CommentTombstone').objects.filter(
+        comment_type=comment_type, object_id=object_id, deleted_at__gt=since,
+    ).order_by('deleted_at', 'id')
+    return {
+        'version': version,
+        'reset': False,
+        'comments': threads.describe_changes(comments),
+        'admin_replies': [threads.describe_admin_reply(reply, reply.thread_visible) for reply in admin_replies],
+        'deleted': [
+            {'kind': tombstone.kind, 'id': tombstone.item_id, 'thread_id': tombstone.thread_id}
+            for tombstone in tombstones
+        ],
+    }
@@ -1,3 +1,350 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from library_admin.admin import CommentsAdmin
+from library_admin.models import Article, Category, CommentReply
+
+from . import counters, live, threads
+from .models import BlogComment, CommentIndex
+
+
+class CommentTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Category")
+        cls.article = Article.objects.create(title="Article", content="Text", author="Author", category=category)
+
+    def comment(self, comment="Nice", **kwargs):
+        return BlogComment.objects.create(article=self.article, name="Guest", comment=comment, **kwargs)
+
+
+class ThreadPathTests(CommentTestCase):
+    def thread(self):
+        top = self.comment()
+        reply = self.comment(parent=top)
+        nested = self.comment(parent=reply)
+        other = self.comment()
+        return top, reply, nested, other
+
+    def segment(self, comment):
+        return str(comment.pk).zfill(10)
+
+    def paths(self, *comments):
+        for comment in comments:
+            comment.refresh_from_db()
+        return [comment.path for comment in comments]
+
+    def test_paths_follow_the_thread(self):
+        top, reply, nested, other = self.thread()
+        self.assertEqual(self.paths(top, reply, nested), [
+            self.segment(top),
+            f"{self.segment(top)}/{self.segment(reply)}",
+            f"{self.segment(top)}/{self.segment(reply)}/{self.segment(nested)}",
+        ])
+        self.assertEqual(list(top.subtree().order_by('path')), [top, reply, nested])
+        self.assertEqual(list(reply.descendants()), [nested])
+        self.assertEqual(list(other.descendants()), [])
+
+    def test_deep_threads_keep_their_full_path(self):
+        comment = top = self.comment()
+        for _ in range(120):
+            comment = self.comment(parent=comment)
+        comment.refresh_from_db()
+        self.assertEqual(comment.path.count('/'), 120)
+        self.assertEqual(top.descendants().count(), 120)
+
+    def test_moving_a_reply_rewrites_its_subtree(self):
+        top, reply, nested, other = self.thread()
+        reply.parent = other
+        reply.save()
+        self.assertEqual(self.paths(reply, nested), [
+            f"{self.segment(other)}/{self.segment(reply)}",
+            f"{self.segment(other)}/{self.segment(reply)}/{self.segment(nested)}",
+        ])
+        self.assertEqual(list(top.descendants()), [])
+        self.assertEqual(list(other.descendants().order_by('path')), [reply, nested])
+
+        # Back to the top level.
+        reply.parent = None
+        reply.save()
+        self.assertEqual(self.paths(reply, nested), [
+            self.segment(reply), f"{self.segment(reply)}/{self.segment(nested)}",
+        ])
+
+    def test_backfill_migration_rebuilds_the_paths(self):
+        comments = self.thread()
+        expected = self.paths(*comments)
+        BlogComment.objects.update(path='')
+        import_module('comments.migrations.0005_comment_paths').backfill_paths(apps, None)
+        self.assertEqual(self.paths(*comments), expected)
+
+
+class AdminReplyLoadingTests(CommentTestCase):
+    def admin_reply(self, comment, reply, comment_type='blog', **kwargs):
+        return CommentReply.objects.create(
+            comment_type=comment_type, comment_id=comment.pk, reply=reply, admin_name="Admin", **kwargs,
+        )
+
+    def test_replies_are_mapped_to_their_comments(self):
+        first, second, third = self.comment(), self.comment(), self.comment()
+        thanks = self.admin_reply(first, "Thanks")
+        welcome = self.admin_reply(first, "Welcome")
+        hidden = self.admin_reply(second, "Draft", is_active=False)
+        self.admin_reply(third, "On a news comment with the same id", comment_type='news')
+
+        replies = threads.admin_replies_for('blog', [first.pk, second.pk, third.pk])
+        self.assertEqual(dict(replies), {first.pk: [thanks, welcome]})
+        replies = threads.admin_replies_for('blog', [second.pk, third.pk], include_hidden=True)
+        self.assertEqual(dict(replies), {second.pk: [hidden]})
+
+        loaded = threads.load_thread(BlogComment.objects.filter(article=self.article), 'blog')
+        self.assertEqual(
+            {thread['id']: [reply['reply'] for reply in thread['admin_replies']] for thread in loaded},
+            {first.pk: ["Thanks", "Welcome"], second.pk: [], third.pk: []},
+        )
+
+    def test_a_thread_loads_in_a_fixed_number_of_queries(self):
+        comments = BlogComment.objects.filter(article=self.article)
+        for size in (1, 10):
+            for i in range(size):
+                top = self.comment()
+                self.comment(parent=top)
+                self.admin_reply(top, f"Reply {i}")
+                self.admin_reply(top, f"Second reply {i}")
+            with self.subTest(size=size), self.assertNumQueries(2):
+                loaded = threads.load_thread(comments, 'blog')
+            self.assertEqual(sum(len(thread['admin_replies']) for thread in loaded), 2 * comments.filter(parent=None).count())
+
+
+class CounterTests(CommentTestCase):
+    def assertCountersMatchRecount(self):
+        self.assertEqual(set(counters.recount().values()), {0})
+
+    def test_counters_follow_every_change(self):
+        top = self.comment()
+        reply = self.comment(parent=top)
+        nested = self.comment(parent=reply)
+        other = self.comment()
+        CommentReply.objects.create(comment_type='blog', comment_id=reply.pk, reply="Thanks", admin_name="Admin")
+        self.assertCountersMatchRecount()
+        top.refresh_from_db()
+        self.assertEqual((top.direct_reply_count, top.descendant_count), (1, 2))
+
+        reply.is_active = False
+        reply.save()
+        self.assertCountersMatchRecount()
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.comment_count, 3)
+
+        reply.parent = other
+        reply.save()
+        self.assertCountersMatchRecount()
+
+        reply.delete()
+        self.assertCountersMatchRecount()
+        other.refresh_from_db()
+        self.assertEqual((other.direct_reply_count, other.descendant_count), (0, 0))
+
+    def test_counter_changes_reach_since_syncs(self):
+        top = self.comment()
+        since = (timezone.now() - timedelta(seconds=1)).isoformat()
+        BlogComment.objects.filter(pk=top.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+        self.comment(parent=top)
+        changes = self.client.get(f'/api/articles/{self.article.pk}/comments/', {'since': since}).json()
+        self.assertTrue({change['id']: change for change in changes['comments']}[top.pk]['has_replies'])
+
+    def test_recount_corrects_only_the_counters_that_are_off(self):
+        top = self.comment()
+        self.comment(parent=top)
+        BlogComment.objects.filter(pk=top.pk).update(descendant_count=7)
+        out = StringIO()
+        call_command('recount_comments', stdout=out)
+        self.assertIn("Corrected 1 comments.BlogComment rows.", out.getvalue())
+        self.assertIn("Corrected 0 library_admin.Article rows.", out.getvalue())
+        self.assertCountersMatchRecount()
+
+
+class CommentIndexTests(CommentTestCase):
+    FIELDS = ('comment_type', 'comment_id', 'object_id', 'parent_id', 'user_id', 'date', 'is_active', 'rating')
+
+    def entries(self):
+        return set(CommentIndex.objects.values_list(*self.FIELDS))
+
+    def assertIndexMatchesComments(self):
+        expected = {
+            ('blog', pk, object_id, parent_id, user_id, date, is_active, rating)
+            for pk, object_id, parent_id, user_id, date, is_active, rating in BlogComment.objects.values_list(
+                'pk', 'article_id', 'parent_id', 'user_id', 'date', 'is_active', 'rating',
+            )
+        }
+        self.assertEqual(self.entries(), expected)
+
+    def test_index_follows_every_change(self):
+        reader = User.objects.create_user('reader')
+        top = self.comment(rating=4)
+        reply = self.comment(parent=top, user=reader)
+        nested = self.comment(parent=reply)
+        other = self.comment()
+        self.assertIndexMatchesComments()
+        self.assertEqual(CommentIndex.objects.count(), 4)
+
+        reply.is_active = False
+        reply.save()
+        self.assertIndexMatchesComments()
+        self.assertFalse(CommentIndex.objects.get(comment_id=reply.pk).is_active)
+
+        nested.parent = other
+        nested.save()
+        self.assertIndexMatchesComments()
+        self.assertEqual(CommentIndex.objects.get(comment_id=nested.pk).parent_id, other.pk)
+
+        # Deleting the user deletes their comments and the replies below them.
+        self.comment(parent=reply)
+        reader.delete()
+        self.assertIndexMatchesComments()
+        self.assertEqual(CommentIndex.objects.count(), 3)
+
+        top.delete()
+        self.assertIndexMatchesComments()
+        self.assertEqual(set(CommentIndex.objects.values_list('comment_id', flat=True)), {nested.pk, other.pk})
+
+    def test_rebuild_matches_the_live_index(self):
+        top = self.comment()
+        self.comment(parent=top, is_active=False)
+        live_entries = self.entries()
+        CommentIndex.objects.all().delete()
+        call_command('rebuild_comment_index', stdout=StringIO())
+        self.assertEqual(self.entries(), live_entries)
+
+
+class DashboardTests(CommentTestCase):
+    def test_dashboard_lists_replies_unless_scoped_to_top_level(self):
+        top = self.comment(comment="TOP LEVEL")
+        self.comment(comment="A REPLY", parent=top)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        url = reverse('admin_comments_dashboard')
+
+        response = self.client.get(url)
+        self.assertContains(response, "TOP LEVEL")
+        self.assertContains(response, "A REPLY")
+        response = self.client.get(url, {'scope': 'top'})
+        self.assertContains(response, "TOP LEVEL")
+        self.assertNotContains(response, "A REPLY")
+
+    def test_comments_admin_lists_top_level_comments_by_default(self):
+        top = self.comment(comment="TOP LEVEL")
+        self.comment(comment="A REPLY", parent=top)
+        request = RequestFactory().get('/admin/comments/')
+        request.user = User.objects.create_superuser('admin')
+        model_admin = CommentsAdmin(BlogComment, admin.site)
+
+        response = model_admin.comments_view(request)
+        self.assertContains(response, "TOP LEVEL")
+        self.assertNotContains(response, "A REPLY")
+        request = RequestFactory().get('/admin/comments/', {'scope': 'all'})
+        request.user = User.objects.get(username='admin')
+        self.assertContains(model_admin.comments_view(request), "A REPLY")
+
+
+class CommentSyncTests(CommentTestCase):
+
+    def test_hidden_content_never_appears_in_a_since_response(self):
+        url = f'/api/articles/{self.article.pk}/comments/'
+        shown = self.comment(rating=5)
+        since = (timezone.now() - timedelta(seconds=1)).isoformat()
+        hidden = self.comment(comment="SECRET ABUSIVE TEXT", rating=1, is_active=False)
+        reply_to_hidden = self.comment(comment="SECRET REPLY", parent=hidden)
+        draft = CommentReply.objects.create(
+            comment_type='blog', comment_id=shown.pk, reply="SECRET ADMIN DRAFT", admin_name="Admin", is_active=False,
+        )
+        on_hidden = CommentReply.objects.create(
+            comment_type='blog', comment_id=hidden.pk, reply="SECRET ADMIN REPLY", admin_name="Admin",
+        )
+
+        response = self.client.get(url, {'since': since})
+        self.assertNotContains(response, "SECRET")
+        changes = response.json()
+        comments = {change['id']: change for change in changes['comments']}
+        self.assertEqual(comments[hidden.pk], {
+            'id': hidden.pk, 'thread_id': hidden.pk, 'visible': False, 'hidden_ids': [hidden.pk, reply_to_hidden.pk],
+        })
+        self.assertEqual(comments[reply_to_hidden.pk]['visible'], False)
+        self.assertNotIn('comment', comments[reply_to_hidden.pk])
+        self.assertEqual(
+            [(reply['id'], reply['visible']) for reply in changes['admin_replies']],
+            [(draft.pk, False), (on_hidden.pk, False)],
+        )
+        self.assertEqual(set(changes['admin_replies'][0]), {'id', 'thread_id', 'is_active', 'visible'})
+
+        # The same rows once shown again are sent in full.
+        since = (timezone.now() - timedelta(seconds=1)).isoformat()
+        draft.is_active = True
+        draft.save()
+        changes = self.client.get(url, {'since': since}).json()
+        self.assertEqual(changes['admin_replies'][0]['reply'], "SECRET ADMIN DRAFT")
+
+
+
+class LiveEventTests(CommentTestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        # A fresh in-process broker (the default) for each test.
+        live.get_broker.cache_clear()
+        self.addCleanup(live.get_broker.cache_clear)
+        self.broker = live.get_broker()
+
+    def subscribe(self):
+        async def subscribe():
+            return self.broker.subscribe(live.channel_for('blog', self.article.pk))
+        return self.loop.run_until_complete(subscribe())
+
+    def events(self, subscription):
+        events = []
+        while (event := self.loop.run_until_complete(subscription.get(0.01))) is not None:
+            events.append(event)
+        return events
+
+    def test_hidden_comments_and_admin_replies_are_published_as_ids_only(self):
+        subscription = self.subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = self.comment(rating=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.comment = "SECRET ABUSIVE TEXT"
+            comment.is_active = False
+            comment.save()
+            draft = CommentReply.objects.create(
+                comment_type='blog', comment_id=comment.pk, reply="SECRET ADMIN DRAFT", admin_name="Admin",
+            )
+        shown, hidden, reply = self.events(subscription)
+        self.assertEqual(shown['comment'], "Nice")
+        self.assertEqual(hidden, {
+            'type': 'comment', 'id': comment.pk, 'thread_id': comment.pk, 'visible': False, 'hidden_ids': [comment.pk],
+        })
+        self.assertEqual(reply, {
+            'type': 'admin_reply', 'id': draft.pk, 'thread_id': comment.pk, 'is_active': False, 'visible': False,
+        })
+
+    def test_events_are_not_built_without_subscribers(self):
+        comment = self.comment(rating=5)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.comment(comment="Reply", parent=comment)
+        with CaptureQueriesContext(connection) as subscribed_queries:
+            subscription = self.subscribe()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.comment(comment="Reply", parent=comment)
+        self.assertEqual(len(self.events(subscription)), 1)
+        # Building the event reads the ancestors of the reply.
+        self.assertEqual(len(subscribed_queries), len(queries) + 1)
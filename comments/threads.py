@@ -0,0 +1,203 @@
+"""
+Threaded comment loading for the public comment APIs.
+
+A thread is read with one query for every active comment on the object (users
+and profiles joined in) and one for the admin replies to its top-level
+comments, then assembled in memory. The output keeps the shape the comment
+section expects: top-level comments, each with its nested user replies
+flattened depth-first and its admin replies. ``admin_replies_for`` is the
+bulk admin reply loader, also used by the admin comment views.
+
+Clients that already hold a thread are sent changes instead:
+``describe_changes`` serializes changed comments flat, with what is needed to
+patch them into the thread (live stream events and ``?since=`` syncs), and
+``describe_admin_reply`` does the same for admin replies. Both are public: a
+change the full thread would not show is sent as ids only, for the client to
+remove, never with its text or author.
+"""
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from library_admin.models import CommentReply
+
+DEFAULT_AVATAR = '/static/images/default-avatar.png'
+
+
+def author(comment):
+    return comment.user.username if comment.user else comment.name
+
+
+def _avatar(comment):
+    user = comment.user
+    if user and hasattr(user, 'userprofile') and user.userprofile.profile_image:
+        return user.userprofile.profile_image.url
+    return DEFAULT_AVATAR
+
+
+def serialize(comment):
+    return {
+        'id': comment.id,
+        'name': author(comment),
+        'comment': comment.comment,
+        'rating': comment.rating,
+        'date': comment.date.strftime('%Y-%m-%d %H:%M'),
+        'profile_image': _avatar(comment),
+    }
+
+
+def serialize_admin_reply(reply):
+    return {
+        'id': reply.id,
+        'thread_id': reply.comment_id,
+        'reply': reply.reply,
+        'admin_name': reply.admin_name,
+        'date': reply.date.strftime('%Y-%m-%d %H:%M'),
+        'is_active': reply.is_active,
+    }
+
+
+def describe_admin_reply(reply, thread_visible):
+    """
+    ``serialize_admin_reply`` plus ``visible``, for a client patching a thread.
+
+    A hidden reply, or one to a hidden comment (``thread_visible`` false), is
+    reduced to its ids.
+    """
+    if reply.is_active and thread_visible:
+        change = serialize_admin_reply(reply)
+        change['visible'] = True
+        return change
+    return {'id': reply.id, 'thread_id': reply.comment_id, 'is_active': False, 'visible': False}
+
+
+def thread_id(comment):
+    """Id of the top-level comment of ``comment``'s thread."""
+    return int(comment.path.split('/')[0]) if comment.path else comment.pk
+
+
+def _ancestor_ids(comment):
+    return [int(segment) for segment in comment.path.split('/')[:-1]]
+
+
+def describe_changes(comments):
+    """
+    Serialize changed ``comments`` of one type for a client patching them in.
+
+    Each dict holds the comment API fields plus ``thread_id``, ``parent_id``,
+    ``parent_name``, ``has_replies`` and ``visible``. ``visible`` is false when
+    the comment or one of its ancestors is hidden; the dict then only holds
+    ``id``, ``thread_id``, ``visible`` and ``hidden_ids``, the comment's whole
+    subtree. Runs one query for the ancestors and one for the subtrees of
+    hidden comments, whatever the number of comments.
+    """
+    comments = list(comments)
+    if not comments:
+        return []
+    model = type(comments[0])
+    ancestor_ids = {pk for comment in comments for pk in _ancestor_ids(comment)}
+    ancestors = {}
+    if ancestor_ids:
+        ancestors = {ancestor.pk: ancestor for ancestor in model.objects.filter(pk__in=ancestor_ids).select_related('user')}
+
+    changes = []
+    for comment in comments:
+        change = serialize(comment)
+        change.update(thread_id=thread_id(comment), parent_id=comment.parent_id, parent_name=None)
+        if comment.parent_id:
+            parent = ancestors.get(comment.parent_id)
+            if comment.parent_is_admin_reply:
+                change['parent_name'] = 'Admin'
+            elif parent is not None:
+                change['parent_name'] = author(parent)
+        change['visible'] = comment.is_active and all(
+            ancestors[pk].is_active for pk in _ancestor_ids(comment) if pk in ancestors
+        )
+        change['has_replies'] = bool(comment.descendant_count or comment.admin_reply_count)
+        changes.append(change)
+
+    hidden = {}
+    for i, (comment, change) in enumerate(zip(comments, changes)):
+        if not change['visible']:
+            changes[i] = hidden[comment.path] = {
+                'id': comment.pk, 'thread_id': change['thread_id'], 'visible': False, 'hidden_ids': [],
+            }
+    if hidden:
+        subtrees = reduce(or_, (Q(path__gte=path, path__lt=path + '0') for path in hidden))
+        for pk, path in model.objects.filter(subtrees).values_list('pk', 'path'):
+            for hidden_path, change in hidden.items():
+                if path == hidden_path or path.startswith(hidden_path + '/'):
+                    change['hidden_ids'].append(pk)
+    return changes
+
+
+def _flatten(comment, children):
+    """User replies under ``comment``, depth-first, each with its parent's name."""
+    flat = []
+    stack = [(reply, comment) for reply in reversed(children.get(comment.id, []))]
+    while stack:
+        reply, parent = stack.pop()
+        reply_dict = serialize(reply)
+        reply_dict['parent_name'] = 'Admin' if reply.parent_is_admin_reply else author(parent)
+        flat.append(reply_dict)
+        stack.extend((child, reply) for child in reversed(children.get(reply.id, [])))
+    return flat
+
+
+def admin_replies_for(comment_type, comment_ids, include_hidden=False):
+    """
+    Admin replies to the ``comment_type`` comments in ``comment_ids``.
+
+    Returns a dict of comment id -> list of ``CommentReply``, oldest first,
+    read in one query on the (comment_type, comment_id, is_active, date)
+    index. Comments without replies are missing from the dict.
+    """
+    replies = defaultdict(list)
+    if not comment_ids:
+        return replies
+    queryset = CommentReply.objects.filter(comment_type=comment_type, comment_id__in=comment_ids)
+    if not include_hidden:
+        queryset = queryset.filter(is_active=True)
+    for reply in queryset.order_by('date', 'id'):
+        replies[reply.comment_id].append(reply)
+    return replies
+
+
+def load_thread(queryset, comment_type):
+    """
+    Serialize the active comments in ``queryset`` as a list of threads.
+
+    ``queryset`` holds every comment of one object at any depth, e.g.
+    ``BlogComment.objects.filter(article_id=...)``; ``comment_type`` is the
+    matching ``CommentReply.comment_type``. Replies whose parent is hidden are
+    hidden with it.
+    """
+    comments = list(
+        queryset.filter(is_active=True)
+        .select_related('user__userprofile')
+        .order_by('date', 'id')
+    )
+    top_level = []
+    children = defaultdict(list)
+    for comment in comments:
+        if comment.parent_id is None:
+            top_level.append(comment)
+        else:
+            children[comment.parent_id].append(comment)
+
+    admin_replies = admin_replies_for(comment_type, [comment.id for comment in top_level])
+
+    threads = []
+    for comment in top_level:
+        thread = serialize(comment)
+        thread['replies'] = _flatten(comment, children)
+        thread['admin_replies'] = [{
+            'id': reply.id,
+            'reply': reply.reply,
+            'admin_name': reply.admin_name,
+            'date': reply.date.strftime('%Y-%m-%d %H:%M'),
+        } for reply in admin_replies.get(comment.id, [])]
+        threads.append(thread)
+    return threads
@@ -9,15 +9,19 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as DefaultUserAdmin
 from django.contrib.auth.models import User, Group
 from public_site.models import UserProfile
+from public_site import page_cache
 from django.contrib.sites.models import Site
 from simple_history.admin import SimpleHistoryAdmin
 from django.utils.safestring import mark_safe
 from django.db.models import Model
 from django.contrib.admin.widgets import ForeignKeyRawIdWidget
 from django.utils.translation import gettext_lazy as _
-from comments.models import BookReviewComment, BlogComment, NewsComment, BookComment
+from comments.models import COMMENT_TYPES, BookReviewComment, BlogComment, NewsComment, BookComment
+from comments import threads
 from django.utils.text import Truncator
 from library_admin.models import CommentReply
+from library_admin.pagination import InvalidCursor
+from library_admin.views import comments_dashboard_context
 
 # Register your models here.
 class BookReviewCommentInline(admin.TabularInline):
@@ -77,7 +81,22 @@ class BookAdminForm(forms.ModelForm):
         self.fields['category'].queryset = Category.objects.filter(type='book', active=True)
         self.fields['category'].empty_label = None
 
-class BookAdmin(admin.ModelAdmin):
+class WarmPageCacheMixin:
+    """Re-render the cached public pages showing this model after each edit."""
+
+    def log_addition(self, request, obj, message):
+        page_cache.warm_after_commit(request, self.model)
+        return super().log_addition(request, obj, message)
+
+    def log_change(self, request, obj, message):
+        page_cache.warm_after_commit(request, self.model)
+        return super().log_change(request, obj, message)
+
+    def log_deletions(self, request, queryset):
+        page_cache.warm_after_commit(request, self.model)
+        return super().log_deletions(request, queryset)
+
+class BookAdmin(WarmPageCacheMixin, admin.ModelAdmin):
     form = BookAdminForm
     list_display = ('title', 'author', 'category', 'publication_date')
     search_fields = ('title', 'author', 'description')
@@ -104,7 +123,7 @@ class ArticleAdminForm(forms.ModelForm):
         self.fields['category'].queryset = Category.objects.filter(type='blog', active=True)
         self.fields['category'].empty_label = None
 
-class ArticleAdmin(admin.ModelAdmin):
+class ArticleAdmin(WarmPageCacheMixin, admin.ModelAdmin):
     form = ArticleAdminForm
     fieldsets = (
         (None, {
@@ -181,12 +200,7 @@ class BaseCommentAdmin(SimpleHistoryAdmin):
         return queryset.filter(parent__isnull=True).order_by('-date')
 
     def reply_count(self, obj):
-        def count_replies(comment):
-            total = comment.replies.count()
-            for reply in comment.replies.all():
-                total += count_replies(reply)
-            return total
-        count = count_replies(obj)
+        count = obj.descendant_count
         if count == 0:
             return 'No Reply'
         # Make the count a clickable link to the replies view
@@ -204,15 +218,8 @@ class BaseCommentAdmin(SimpleHistoryAdmin):
 
     def view_replies(self, request, comment_id):
         comment = get_object_or_404(self.model, pk=comment_id)
-        # Gather all replies recursively
-        def get_all_replies(comment):
-            replies = list(comment.replies.all())
-            all_replies = []
-            for reply in replies:
-                all_replies.append(reply)
-                all_replies.extend(get_all_replies(reply))
-            return all_replies
-        all_replies = get_all_replies(comment)
+        # All replies at any depth, depth-first
+        all_replies = list(comment.descendants().order_by('path'))
         # Map model_name to correct comment_type
         model_name_map = {
             'bookreviewcomment': 'bookreview',
@@ -221,7 +228,7 @@ class BaseCommentAdmin(SimpleHistoryAdmin):
             'bookcomment': 'book',
         }
         comment_type = model_name_map.get(self.model._meta.model_name, self.model._meta.model_name)
-        admin_replies = CommentReply.objects.filter(comment_id=comment.id, comment_type=comment_type, is_active=True).order_by('date')
+        admin_replies = threads.admin_replies_for(comment_type, [comment.id]).get(comment.id, [])
 
         # Handle admin reply creation
         message = None
@@ -245,21 +252,19 @@ class BaseCommentAdmin(SimpleHistoryAdmin):
                     # Find all user replies to this admin reply
                     user_reply_model = self.model
                     user_replies = user_reply_model.objects.filter(parent=comment, parent_is_admin_reply=True)
-                    # Recursively delete all user replies and their children
+                    # Delete all user replies and their children
                     for user_reply in user_replies:
-                        def delete_with_children(reply):
-                            for child in reply.replies.all():
-                                delete_with_children(child)
-                            reply.delete()
-                        delete_with_children(user_reply)
+                        user_reply.subtree().delete()
                     # Now delete the admin reply
                     admin_reply.delete()
                 message = 'Admin reply and its user replies deleted.'
                 return redirect(request.path)
             elif 'delete_public_reply' in request.POST:
                 reply_id = request.POST.get('delete_public_reply')
-                # Delete the public reply (and its children recursively)
-                self.model.objects.filter(id=reply_id).delete()
+                # Delete the public reply (and its children)
+                public_reply = self.model.objects.filter(id=reply_id).first()
+                if public_reply:
+                    public_reply.subtree().delete()
                 message = 'User reply deleted.'
                 return redirect(request.path)
 
@@ -319,7 +324,7 @@ class NewsAdminForm(forms.ModelForm):
         self.fields['category'].queryset = Category.objects.filter(type='news', active=True)
         self.fields['category'].empty_label = None
 
-class NewsAdmin(admin.ModelAdmin):
+class NewsAdmin(WarmPageCacheMixin, admin.ModelAdmin):
     form = NewsAdminForm
     fieldsets = (
         (None, {
@@ -360,29 +365,11 @@ class CommentsAdmin(admin.ModelAdmin):
         return custom_urls + urls
 
     def comments_view(self, request):
-        # Gather only top-level (parent) comments from all models
-        # Note: The filtering is now handled in BaseCommentAdmin.get_queryset,
-        # but we do it here explicitly for the combined view to be safe.
-        blog_comments = BlogComment.objects.filter(parent__isnull=True)
-        book_comments = BookComment.objects.filter(parent__isnull=True)
-        bookreview_comments = BookReviewComment.objects.filter(parent__isnull=True)
-        news_comments = NewsComment.objects.filter(parent__isnull=True)
-        
-        # Combine and sort by date (latest first)
-        all_comments = list(blog_comments) + list(book_comments) + list(bookreview_comments) + list(news_comments)
-        all_comments.sort(key=lambda c: c.date, reverse=True)
-
         # Handle delete
         if request.method == 'POST' and 'delete_comment_id' in request.POST:
             comment_id = int(request.POST['delete_comment_id'])
             comment_type = request.POST['delete_comment_type']
-            model_map = {
-                'blog': BlogComment,
-                'book': BookComment,
-                'bookreview': BookReviewComment,
-                'news': NewsComment,
-            }
-            model = model_map.get(comment_type)
+            model = COMMENT_TYPES.get(comment_type)
             if model:
                 try:
                     model.objects.get(id=comment_id).delete()
@@ -391,9 +378,14 @@ class CommentsAdmin(admin.ModelAdmin):
                 except Exception:
                     messages.error(request, 'Failed to delete comment.')
 
+        # One page of top-level comments from all models, latest first
+        try:
+            page = comments_dashboard_context(request, default_scope='top')
+        except InvalidCursor:
+            return redirect(request.path)
         context = dict(
             self.admin_site.each_context(request),
-            comments=all_comments,
+            **page,
         )
         return render(request, "admin/comments_changelist.html", context)
 
@@ -408,10 +400,13 @@ class AdminUserAdmin(DefaultUserAdmin):
         verbose_name = 'Admin User'
         verbose_name_plural = 'Admin Users'
 
+class BookReviewHistoryAdmin(WarmPageCacheMixin, SimpleHistoryAdmin):
+    pass
+
 admin.site.register(Book, BookAdmin)
 admin.site.register(Category, SimpleHistoryAdmin)
 admin.site.register(News, NewsAdmin)
-admin.site.register(BookReview, SimpleHistoryAdmin)
+admin.site.register(BookReview, BookReviewHistoryAdmin)
 admin.site.register(Article, ArticleAdmin)
 
 def safe_unregister(model):
@@ -450,7 +445,7 @@ class CategoryAdminForm(django_forms.ModelForm):
             self.fields['type'].initial = request.GET['type']
             self.fields['type'].widget = django_forms.HiddenInput()
 
-class PatchedCategoryAdmin(SimpleHistoryAdmin):
+class PatchedCategoryAdmin(WarmPageCacheMixin, SimpleHistoryAdmin):
     form = CategoryAdminForm
     list_filter = ['type', 'active']
     def get_form(self, request, obj=None, **kwargs):
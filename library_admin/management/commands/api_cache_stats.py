@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from library_admin import response_cache
+
+class Command(BaseCommand):
+    help = 'Show the hit and miss counters of the catalog API response cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them.')
+
+    def handle(self, *args, **options):
+        stats = response_cache.stats()
+        for metric in response_cache.METRICS:
+            self.stdout.write(f"{metric}: {stats[metric]}")
+        served = stats['hits'] + stats['coalesced']
+        total = served + stats['misses'] + stats['lock_timeouts']
+        if total:
+            self.stdout.write(f"hit rate: {served / total:.1%}")
+        if options['reset']:
+            response_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
@@ -0,0 +1,70 @@
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+
+from public_site.mail_pool import ConnectionPool
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+
+class Sink:
+    """aiosmtpd handler that accepts and discards every message."""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+class Command(BaseCommand):
+    help = 'Compare one SMTP connection per message with pooled connections against a local aiosmtpd server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200, help='Number of messages sent per run.')
+        parser.add_argument('--pool-size', type=int, default=2, help='Number of pooled connections.')
+        parser.add_argument('--port', type=int, default=8025, help='Port of the local SMTP server.')
+
+    def handle(self, *args, **options):
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError:
+            raise CommandError('The benchmark needs the aiosmtpd package.')
+
+        count = options['messages']
+        sink = Sink()
+        controller = Controller(sink, hostname='127.0.0.1', port=options['port'])
+        controller.start()
+        try:
+            backend = {
+                'backend': SMTP_BACKEND, 'host': '127.0.0.1', 'port': options['port'],
+                'username': '', 'password': '', 'use_tls': False, 'use_ssl': False,
+            }
+
+            def messages():
+                return [
+                    EmailMessage(f'Benchmark {i}', 'Your OTP code is: 123456', 'library@example.com', ['reader@example.com'])
+                    for i in range(count)
+                ]
+
+            batch = messages()
+            start = time.perf_counter()
+            for message in batch:
+                # What ``msg.send()`` does: connect, send, disconnect.
+                get_connection(**backend).send_messages([message])
+            self.report('One connection per message', count, time.perf_counter() - start)
+
+            pool = ConnectionPool(size=options['pool_size'], **backend)
+            batch = messages()
+            start = time.perf_counter()
+            errors = [error for error in pool.send_many(batch) if error is not None]
+            self.report(f"Pool of {pool.size} connections", count - len(errors), time.perf_counter() - start)
+            pool.close()
+        finally:
+            controller.stop()
+        self.stdout.write(f"The server received {sink.received} messages.")
+
+    def report(self, label, sent, seconds):
+        self.stdout.write(f"{label}: {sent} messages in {seconds:.2f}s, {sent / seconds:.0f} messages/s")
@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, override_settings
+
+from public_site.middleware import LogoutDeletedUserMiddleware
+
+ENGINES = {
+    'database': 'public_site.session_backend',
+    'cached, write-behind': 'public_site.cached_session_backend',
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure signed-in requests per second through the session middleware, with and without the session cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Number of requests per run.')
+        parser.add_argument('--write-every', type=int, default=10, help='Change the session on every n-th request.')
+
+    def handle(self, *args, **options):
+        # Runs in a transaction rolled back at the end: the benchmark user and
+        # its sessions never reach the database.
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user('session-benchmark')
+                for label, engine in ENGINES.items():
+                    with override_settings(SESSION_ENGINE=engine):
+                        self.run(label, user, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, label, user, options):
+        write_every = max(1, options['write_every'])
+        count = options['requests']
+        visits = iter(range(count))
+
+        def view(request):
+            request.user.pk
+            # Most requests only read the session; some change it, like a flash message would.
+            if next(visits) % write_every == 0:
+                request.session['last_visit'] = time.time()
+            return HttpResponse()
+
+        handler = SessionMiddleware(AuthenticationMiddleware(LogoutDeletedUserMiddleware(view)))
+        client = Client()
+        client.force_login(user)
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        factory = RequestFactory()
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            for _ in range(count):
+                request = factory.get('/')
+                request.COOKIES[settings.SESSION_COOKIE_NAME] = session_key
+                handler(request)
+        seconds = time.perf_counter() - start
+        self.stdout.write(
+            f"{label}: {count / seconds:.0f} requests/s, {len(queries) / count:.2f} queries per request"
+        )
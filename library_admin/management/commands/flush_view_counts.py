@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from library_admin import view_counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the view counts buffered in this process to the database. Web processes flush their own '
+        'buffers on a timer and when they exit; this is for scripts and shells that record views.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--refresh', action='store_true',
+            help='Also recompute the stored recent views of every object, e.g. daily from cron on a quiet site.',
+        )
+
+    def handle(self, *args, **options):
+        rows = view_counts.flush()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} view counts.'))
+        if options['refresh']:
+            changed = view_counts.refresh_all()
+            self.stdout.write(self.style.SUCCESS(f'Refreshed the recent views of {len(changed)} kinds.'))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from public_site.models import UserSession
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions in small batches, so the session table is never locked for long.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of sessions deleted per statement.')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to wait between batches.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = UserSession.objects.filter(expire_date__lt=now).order_by('expire_date')
+        deleted = 0
+        while True:
+            session_keys = list(expired.values_list('session_key', flat=True)[:options['batch_size']])
+            if not session_keys:
+                break
+            deleted += UserSession.objects.filter(session_key__in=session_keys, expire_date__lt=now).delete()[0]
+            self.stdout.write(f"Deleted {deleted} expired sessions so far.")
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions.'))
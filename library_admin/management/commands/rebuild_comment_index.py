@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from comments.models import COMMENT_TYPES, CommentIndex
+
+class Command(BaseCommand):
+    help = 'Rebuild the cross-type comment index from the four comment tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of comments indexed per batch.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            CommentIndex.objects.all().delete()
+            for comment_type, model in COMMENT_TYPES.items():
+                total = 0
+                batch = []
+                queryset = model.objects.defer('comment').order_by('pk')
+                for comment in queryset.iterator(chunk_size=batch_size):
+                    batch.append(CommentIndex.entry_for(comment))
+                    if len(batch) >= batch_size:
+                        total += len(CommentIndex.store(batch))
+                        batch = []
+                total += len(CommentIndex.store(batch))
+                self.stdout.write(f"Indexed {total} {comment_type} comments.")
+        self.stdout.write(self.style.SUCCESS('Comment index rebuilt.'))
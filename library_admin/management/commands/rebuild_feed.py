@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from library_admin.models import Article, BookReview, FeedItem, News
+
+class Command(BaseCommand):
+    help = 'Rebuild the home page feed from the articles, news and book reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of feed entries written per batch.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        sources = {
+            'blog': Article.objects.defer('content', 'content_html'),
+            'news': News.objects.defer('content', 'content_html'),
+            'bookreview': BookReview.objects.select_related('book').defer('review_text', 'review_text_html', 'book__description', 'book__description_html'),
+        }
+        entries = []
+        for kind, queryset in sources.items():
+            collected = [FeedItem.entry_for(obj) for obj in queryset.iterator(chunk_size=batch_size)]
+            entries += collected
+            self.stdout.write(f"Collected {len(collected)} {kind} entries.")
+        # Oldest first, so ids break ties between same-day entries by age.
+        entries.sort(key=lambda entry: (entry.published, entry.object_id))
+        with transaction.atomic():
+            FeedItem.objects.all().delete()
+            FeedItem.store(entries, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Feed rebuilt with {len(entries)} entries.'))
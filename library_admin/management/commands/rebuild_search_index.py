@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from library_admin import search
+from library_admin.models import Article, Book, BookReview, News
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for books, blogs, news and book reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of objects indexed per batch.')
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('No search index table found. Run "python manage.py migrate" on SQLite (with FTS5) or PostgreSQL.')
+        batch_size = options['batch_size']
+        sources = {
+            'book': Book.objects.order_by('pk'),
+            'blog': Article.objects.order_by('pk'),
+            'news': News.objects.order_by('pk'),
+            'bookreview': BookReview.objects.select_related('book').order_by('pk'),
+        }
+        with transaction.atomic():
+            search.clear()
+            for kind, queryset in sources.items():
+                total = 0
+                batch = []
+                for obj in queryset.iterator(chunk_size=batch_size):
+                    batch.append(obj)
+                    if len(batch) >= batch_size:
+                        total += search.index_documents(kind, batch)
+                        batch = []
+                total += search.index_documents(kind, batch)
+                self.stdout.write(f"Indexed {total} {kind} entries.")
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from comments import counters
+from library_admin import versions
+
+class Command(BaseCommand):
+    help = 'Recompute the reply and comment counters of every comment and commented object.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = counters.recount()
+            # comment_count is in the catalog APIs and the thread counters are not,
+            # so only the catalog validators move.
+            versions.bump(*(label.lower() for label, count in updated.items() if count and not label.startswith('comments.')))
+        for label, count in updated.items():
+            self.stdout.write(f"Corrected {count} {label} rows.")
+        self.stdout.write(self.style.SUCCESS('Comment counters are up to date.'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from library_admin import rendering, versions
+from library_admin.models import FEED_KINDS, Article, Book, BookReview, FeedItem, News
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored HTML and excerpts of books, blogs, news and book reviews whose markdown changed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of rows updated per batch.')
+        parser.add_argument('--force', action='store_true', help='Render every row, not only stale ones.')
+
+    def store_batch(self, model, batch, stored_fields):
+        # bulk_update() sends no post_save, so copy the new excerpts to the feed here.
+        model.objects.bulk_update(batch, stored_fields)
+        if batch and model in FEED_KINDS:
+            FeedItem.refresh_excerpts(model, [obj.pk for obj in batch])
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (Book, Article, News, BookReview):
+            source, stored_fields = rendering.fields_for(model)
+            queryset = model.objects.only('pk', source, stored_fields[-1]).order_by('pk')
+            total = 0
+            batch = []
+            for obj in queryset.iterator(chunk_size=batch_size):
+                if rendering.refresh(obj, force=options['force']):
+                    batch.append(obj)
+                if len(batch) >= batch_size:
+                    self.store_batch(model, batch, stored_fields)
+                    total += len(batch)
+                    batch = []
+            self.store_batch(model, batch, stored_fields)
+            total += len(batch)
+            if total:
+                versions.bump(versions.model_key(model))
+            self.stdout.write(f"Rendered {total} {str(model._meta.verbose_name_plural).lower()}.")
+        self.stdout.write(self.style.SUCCESS('Stored HTML and excerpts are up to date.'))
@@ -0,0 +1,49 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from public_site import mail_pool, outbox
+
+class Command(BaseCommand):
+    help = 'Deliver the queued account emails over pooled backend connections, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Number of emails claimed and sent at a time.')
+        parser.add_argument('--workers', type=int, default=1, help='Number of threads sending batches in parallel.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait when no email is due.')
+        parser.add_argument('--once', action='store_true', help='Exit once no email is due instead of polling.')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        try:
+            if workers == 1:
+                self.work(options)
+                return
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for future in [pool.submit(self.work_in_thread, options) for _ in range(workers)]:
+                    future.result()
+        finally:
+            mail_pool.get_pool().close()
+
+    def work_in_thread(self, options):
+        try:
+            self.work(options)
+        finally:
+            # Each thread opened its own database connection.
+            connection.close()
+
+    def work(self, options):
+        while True:
+            emails = outbox.claim(options['batch_size'])
+            if not emails:
+                purged = outbox.purge()
+                if purged:
+                    self.stdout.write(f"Deleted {purged} sent and failed emails.")
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+            sent, failed = outbox.send_batch(emails)
+            self.stdout.write(f"Sent {sent} emails, {failed} failed.")
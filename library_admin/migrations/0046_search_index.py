@@ -0,0 +1,89 @@
+from django.db import migrations, OperationalError
+
+# A copy of library_admin.search as of this migration, so later changes to that
+# module do not change what this migration does.
+INDEX_TABLE = 'library_admin_searchindex'
+KINDS = ('book', 'blog', 'news', 'bookreview')
+ROWID_STRIDE = 8
+
+
+def document_for(kind, obj):
+    if kind == 'book':
+        return obj.title, f"{obj.author}\n{obj.description}"
+    if kind == 'blog':
+        return obj.title, f"{obj.author}\n{obj.content}"
+    if kind == 'news':
+        return obj.title, obj.content
+    return obj.book.title, f"{obj.reviewer_name}\n{obj.review_text}"
+
+
+def create_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor not in ('sqlite', 'postgresql'):
+        return
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+                    "kind UNINDEXED, object_id UNINDEXED, title, body, "
+                    "prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+                )
+            except OperationalError:
+                # SQLite built without FTS5: the views keep using icontains.
+                return
+        else:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+                "kind varchar(20) NOT NULL, object_id bigint NOT NULL, "
+                "title text NOT NULL, body text NOT NULL, document tsvector NOT NULL, "
+                "PRIMARY KEY (kind, object_id))"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document_idx "
+                f"ON {INDEX_TABLE} USING GIN (document)"
+            )
+
+    sources = {
+        'book': apps.get_model('library_admin', 'Book').objects.all(),
+        'blog': apps.get_model('library_admin', 'Article').objects.all(),
+        'news': apps.get_model('library_admin', 'News').objects.all(),
+        'bookreview': apps.get_model('library_admin', 'BookReview').objects.select_related('book'),
+    }
+    with conn.cursor() as cursor:
+        for kind, queryset in sources.items():
+            rows = [(obj.pk, *(text or '' for text in document_for(kind, obj))) for obj in queryset.iterator()]
+            if not rows:
+                continue
+            if conn.vendor == 'sqlite':
+                cursor.executemany(
+                    f"INSERT OR REPLACE INTO {INDEX_TABLE} (rowid, kind, object_id, title, body) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    [(pk * ROWID_STRIDE + KINDS.index(kind), kind, pk, title, body) for pk, title, body in rows],
+                )
+            else:
+                cursor.executemany(
+                    f"INSERT INTO {INDEX_TABLE} (kind, object_id, title, body, document) "
+                    "VALUES (%s, %s, %s, %s, "
+                    "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B')) "
+                    "ON CONFLICT (kind, object_id) DO NOTHING",
+                    [(kind, pk, title, body, title, body) for pk, title, body in rows],
+                )
+
+
+def drop_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor in ('sqlite', 'postgresql'):
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_admin', '0045_remove_commentreply_parent_content_type_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
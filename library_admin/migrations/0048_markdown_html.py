@@ -0,0 +1,79 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+import markdown
+
+# As in library_admin.rendering when this migration was written.
+MARKDOWN_FIELDS = {
+    'library_admin.article': 'content',
+    'library_admin.book': 'description',
+    'library_admin.bookreview': 'review_text',
+    'library_admin.news': 'content',
+}
+EXTENSIONS = ["extra", "codehilite", "toc"]
+
+
+def render_existing(apps, schema_editor):
+    for name in ('Article', 'Book', 'BookReview', 'News'):
+        model = apps.get_model('library_admin', name)
+        source = MARKDOWN_FIELDS[model._meta.label_lower]
+        html, hash_field = f'{source}_html', f'{source}_hash'
+        batch = []
+        for obj in model.objects.only('pk', source).iterator(chunk_size=500):
+            text = getattr(obj, source)
+            setattr(obj, html, markdown.markdown(text or '', extensions=EXTENSIONS))
+            setattr(obj, hash_field, '')
+            batch.append(obj)
+        model.objects.bulk_update(batch, [html, hash_field], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_admin', '0047_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='description_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='description_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookreview',
+            name='review_text_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='bookreview',
+            name='review_text_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(render_existing, migrations.RunPython.noop),
+    ]
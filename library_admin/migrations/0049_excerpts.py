@@ -0,0 +1,98 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+import hashlib
+import re
+
+import markdown
+from django.conf import settings
+
+# A copy of library_admin.rendering as of this migration, so later changes to
+# that module do not change what this migration writes. Rows whose hash no
+# longer matches the current module are rebuilt by render_markdown.
+MARKDOWN_FIELDS = {
+    'library_admin.article': 'content',
+    'library_admin.book': 'description',
+    'library_admin.bookreview': 'review_text',
+    'library_admin.news': 'content',
+}
+EXTENSIONS = ["extra", "codehilite", "toc"]
+EXCERPT_LENGTH = getattr(settings, 'EXCERPT_LENGTH', 200)
+
+PLAIN_TEXT_PATTERNS = [
+    (re.compile(r'#{1,6}\s+'), ''),
+    (re.compile(r'\*\*(.*?)\*\*'), r'\1'),
+    (re.compile(r'\*(.*?)\*'), r'\1'),
+    (re.compile(r'\[([^\]]+)\]\([^)]+\)'), r'\1'),
+    (re.compile(r'`([^`]+)`'), r'\1'),
+    (re.compile(r'^\s*[-*+]\s+', re.MULTILINE), ''),
+    (re.compile(r'^\s*\d+\.\s+', re.MULTILINE), ''),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def excerpt(text):
+    cleaned = text or ''
+    for pattern, replacement in PLAIN_TEXT_PATTERNS:
+        cleaned = pattern.sub(replacement, cleaned)
+    cleaned = cleaned.strip()
+    if len(cleaned) <= EXCERPT_LENGTH:
+        return cleaned
+    cut = cleaned[:EXCERPT_LENGTH].rsplit(' ', 1)[0] or cleaned[:EXCERPT_LENGTH]
+    return cut.rstrip(' .,;:') + '…'
+
+
+def source_hash(text):
+    digest = hashlib.sha256(f"{EXTENSIONS!r}:{EXCERPT_LENGTH}:".encode())
+    digest.update((text or '').encode())
+    return digest.hexdigest()
+
+
+def build_excerpts(apps, schema_editor):
+    for name in ('Article', 'Book', 'BookReview', 'News'):
+        model = apps.get_model('library_admin', name)
+        source = MARKDOWN_FIELDS[model._meta.label_lower]
+        stored_fields = [f'{source}_html', 'excerpt', f'{source}_hash']
+        batch = []
+        for obj in model.objects.only('pk', source).iterator(chunk_size=500):
+            text = getattr(obj, source)
+            setattr(obj, f'{source}_html', markdown.markdown(text or '', extensions=EXTENSIONS))
+            obj.excerpt = excerpt(text)
+            setattr(obj, f'{source}_hash', source_hash(text))
+            batch.append(obj)
+            if len(batch) >= 500:
+                model.objects.bulk_update(batch, stored_fields)
+                batch = []
+        model.objects.bulk_update(batch, stored_fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_admin', '0048_markdown_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookreview',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(build_excerpts, migrations.RunPython.noop),
+    ]
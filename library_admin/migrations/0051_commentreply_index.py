@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_admin', '0050_comment_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commentreply',
+            index=models.Index(fields=['comment_type', 'comment_id', 'is_active', 'date'], name='commentreply_comment_idx'),
+        ),
+    ]
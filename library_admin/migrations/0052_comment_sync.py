@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_admin', '0051_commentreply_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commentreply',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_admin', '0052_comment_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentVersion',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.CharField(max_length=32)),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+def fill_feed(apps, schema_editor):
+    feed_item = apps.get_model('library_admin', 'FeedItem')
+    sources = [
+        ('blog', apps.get_model('library_admin', 'Article').objects.values_list(
+            'pk', 'title', 'excerpt', 'author', 'image', 'publication_date')),
+        ('news', apps.get_model('library_admin', 'News').objects.values_list(
+            'pk', 'title', 'excerpt', 'image', 'publication_date')),
+        ('bookreview', apps.get_model('library_admin', 'BookReview').objects.values_list(
+            'pk', 'book__title', 'excerpt', 'reviewer_name', 'image', 'review_date')),
+    ]
+    entries = []
+    for kind, rows in sources:
+        for row in rows:
+            if kind == 'news':
+                pk, title, excerpt, image, published = row
+                byline = ''
+            else:
+                pk, title, excerpt, byline, image, published = row
+            entries.append(feed_item(
+                kind=kind, object_id=pk, title=title, excerpt=excerpt, byline=byline,
+                image=image or '', published=published,
+            ))
+    # Oldest first, so ids break ties between same-day entries by age.
+    entries.sort(key=lambda entry: (entry.published, entry.object_id))
+    feed_item.objects.bulk_create(entries, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_admin', '0053_content_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('blog', 'Blog'), ('news', 'News'), ('bookreview', 'Book Review')], max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('excerpt', models.TextField(blank=True)),
+                ('byline', models.CharField(blank=True, max_length=100)),
+                ('image', models.ImageField(blank=True, upload_to='')),
+                ('published', models.DateField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['published', 'id'], name='feeditem_published_idx'), models.Index(fields=['kind', 'published', 'id'], name='feeditem_kind_published_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='feeditem_kind_object_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
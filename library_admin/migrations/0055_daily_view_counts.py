@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_admin', '0054_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyViewCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id', 'day'), name='dailyviewcount_object_day_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:21
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# As in library_admin.view_counts when this migration was written.
+KINDS = {'book': 'Book', 'blog': 'Article', 'news': 'News', 'bookreview': 'BookReview'}
+POPULAR_DAYS = 30
+
+
+def store_recent_views(apps, schema_editor):
+    daily = apps.get_model('library_admin', 'DailyViewCount').objects
+    since = timezone.localdate() - timedelta(days=POPULAR_DAYS)
+    for kind, name in KINDS.items():
+        rows = daily.filter(kind=kind, object_id=OuterRef('pk'), day__gte=since)
+        total = Subquery(rows.values('object_id').annotate(total=Sum('count')).values('total')[:1])
+        model = apps.get_model('library_admin', name)
+        model.objects.filter(pk__in=daily.filter(kind=kind, day__gte=since).values('object_id')).update(
+            recent_views=Coalesce(total, Value(0)),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_admin', '0055_daily_view_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='recent_views',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='recent_views',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookreview',
+            name='recent_views',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='recent_views',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['recent_views', 'id'], name='article_recent_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['recent_views', 'id'], name='book_recent_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookreview',
+            index=models.Index(fields=['recent_views', 'id'], name='bookreview_recent_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['recent_views', 'id'], name='news_recent_views_idx'),
+        ),
+        migrations.RunPython(store_recent_views, migrations.RunPython.noop),
+    ]
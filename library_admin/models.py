@@ -1,6 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models import F, OuterRef, Subquery, Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from simple_history.models import HistoricalRecords
+from . import rendering, search, suggestions, versions
 
 # Create your models here.
 
@@ -8,16 +13,28 @@ class Book(models.Model):
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=100)
     description = models.TextField()
+    description_html = models.TextField(blank=True, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+    description_hash = models.CharField(max_length=64, blank=True, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+    recent_views = models.IntegerField(default=0, editable=False)
     pdf_file = models.FileField(upload_to='book_pdfs/', blank=True, null=True)
     publication_date = models.DateField(null=True, blank=True)
     cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True)
     available = models.BooleanField(default=True)
     category = models.ForeignKey('Category', on_delete=models.PROTECT, blank=False, null=False, related_name='books')
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=['description_html', 'excerpt', 'description_hash', 'comment_count', 'recent_views'])
 
     def __str__(self):
         return self.title
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['publication_date', 'id'], name='book_pubdate_id_idx'),
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+            models.Index(fields=['recent_views', 'id'], name='book_recent_views_idx'),
+        ]
+
 class Category(models.Model):
     TYPE_CHOICES = [
         ('book', 'Book'),
@@ -35,11 +52,16 @@ class Category(models.Model):
 class Article(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
+    content_html = models.TextField(blank=True, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+    recent_views = models.IntegerField(default=0, editable=False)
     author = models.CharField(max_length=100)
     publication_date = models.DateField(auto_now_add=True)
     category = models.ForeignKey(Category, on_delete=models.PROTECT, blank=False, null=False, related_name='articles')
     image = models.ImageField(upload_to='blog_images/', blank=True, null=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=['content_html', 'excerpt', 'content_hash', 'comment_count', 'recent_views'])
 
     def __str__(self):
         return self.title
@@ -47,14 +69,24 @@ class Article(models.Model):
     class Meta:
         verbose_name = 'Blog'
         verbose_name_plural = 'Blogs'
+        indexes = [
+            models.Index(fields=['publication_date', 'id'], name='article_pubdate_id_idx'),
+            models.Index(fields=['title', 'id'], name='article_title_id_idx'),
+            models.Index(fields=['recent_views', 'id'], name='article_recent_views_idx'),
+        ]
 
 class News(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
+    content_html = models.TextField(blank=True, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+    recent_views = models.IntegerField(default=0, editable=False)
     publication_date = models.DateField(auto_now_add=True)
     category = models.ForeignKey(Category, on_delete=models.PROTECT, blank=False, null=False, related_name='news')
     image = models.ImageField(upload_to='news_images/', blank=True, null=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=['content_html', 'excerpt', 'content_hash', 'comment_count', 'recent_views'])
 
     def __str__(self):
         return self.title
@@ -62,18 +94,34 @@ class News(models.Model):
     class Meta:
         verbose_name = 'News'
         verbose_name_plural = 'News'
+        indexes = [
+            models.Index(fields=['publication_date', 'id'], name='news_pubdate_id_idx'),
+            models.Index(fields=['title', 'id'], name='news_title_id_idx'),
+            models.Index(fields=['recent_views', 'id'], name='news_recent_views_idx'),
+        ]
 
 class BookReview(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     reviewer_name = models.CharField(max_length=100)
     review_text = models.TextField()
+    review_text_html = models.TextField(blank=True, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+    review_text_hash = models.CharField(max_length=64, blank=True, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+    recent_views = models.IntegerField(default=0, editable=False)
     review_date = models.DateField(auto_now_add=True)
     image = models.ImageField(upload_to='review_images/', blank=True, null=True)
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=['review_text_html', 'excerpt', 'review_text_hash', 'comment_count', 'recent_views'])
 
     def __str__(self):
         return f"Review for {self.book.title} by {self.reviewer_name}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['review_date', 'id'], name='bookreview_date_id_idx'),
+            models.Index(fields=['recent_views', 'id'], name='bookreview_recent_views_idx'),
+        ]
+
 class CommentReply(models.Model):
     COMMENT_TYPE_CHOICES = [
         ('blog', 'Blog'),
@@ -87,6 +135,213 @@ class CommentReply(models.Model):
     admin_name = models.CharField(max_length=100)
     date = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['comment_type', 'comment_id', 'is_active', 'date'], name='commentreply_comment_idx'),
+        ]
 
     def __str__(self):
         return f"Reply by {self.admin_name} to {self.comment_type} comment {self.comment_id} [Reply ID: {self.id}]"
+
+
+class ContentVersion(models.Model):
+    """Current version of a resource behind the API validators; see ``library_admin.versions``."""
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.CharField(max_length=32)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key} @ {self.version}"
+
+
+class DailyViewCount(models.Model):
+    """Views of one object on one day, written in batches by ``library_admin.view_counts``."""
+    kind = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id', 'day'], name='dailyviewcount_object_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} on {self.day}: {self.count}"
+
+
+class FeedItem(models.Model):
+    """
+    One row per article, news item and book review: the "latest content" feed.
+
+    Holds what a feed card shows, so the home page and ``/api/feed/`` read
+    every kind in one indexed query instead of one query per table plus the
+    review's book. Kept in sync by the receivers below; run
+    ``python manage.py rebuild_feed`` after writes that bypass signals.
+    """
+    KIND_CHOICES = [
+        ('blog', 'Blog'),
+        ('news', 'News'),
+        ('bookreview', 'Book Review'),
+    ]
+    DEFAULT_IMAGE = '/static/images/blog-default.jpg'
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    title = models.CharField(max_length=200)  # The book's title for a review.
+    excerpt = models.TextField(blank=True)
+    byline = models.CharField(max_length=100, blank=True)
+    image = models.ImageField(blank=True)
+    published = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='feeditem_kind_object_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['published', 'id'], name='feeditem_published_idx'),
+            models.Index(fields=['kind', 'published', 'id'], name='feeditem_kind_published_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.title}"
+
+    @property
+    def image_url(self):
+        return self.image.url if self.image else self.DEFAULT_IMAGE
+
+    @classmethod
+    def entry_for(cls, obj):
+        kind = FEED_KINDS[type(obj)]
+        if kind == 'bookreview':
+            title, byline, published = obj.book.title, obj.reviewer_name, obj.review_date
+        else:
+            title, byline, published = obj.title, getattr(obj, 'author', ''), obj.publication_date
+        return cls(
+            kind=kind,
+            object_id=obj.pk,
+            title=title,
+            excerpt=obj.excerpt,
+            byline=byline,
+            image=obj.image.name or '',
+            published=published,
+        )
+
+    @classmethod
+    def store(cls, entries, batch_size=None):
+        """Insert or update feed rows in one statement per batch."""
+        return cls.objects.bulk_create(
+            entries,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['kind', 'object_id'],
+            update_fields=['title', 'excerpt', 'byline', 'image', 'published'],
+        )
+
+    @classmethod
+    def refresh_excerpts(cls, model, ids):
+        """Copy the stored excerpts of ``model`` rows ``ids`` to their feed entries in one query."""
+        return cls.objects.filter(kind=FEED_KINDS[model], object_id__in=ids).update(
+            excerpt=Subquery(model.objects.filter(pk=OuterRef('object_id')).values('excerpt')),
+        )
+
+    @classmethod
+    def latest(cls, per_kind):
+        """The ``per_kind`` newest entries of every kind, read in one query, as ``{kind: [entries]}``."""
+        rank = Window(RowNumber(), partition_by=F('kind'), order_by=[F('published').desc(), F('id').desc()])
+        latest = {kind: [] for kind, _ in cls.KIND_CHOICES}
+        for entry in cls.objects.annotate(rank=rank).filter(rank__lte=per_kind).order_by('kind', 'rank'):
+            latest[entry.kind].append(entry)
+        return latest
+
+
+# Render markdown once when it changes instead of on every detail page view.
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=Article)
+@receiver(pre_save, sender=News)
+@receiver(pre_save, sender=BookReview)
+def render_markdown_html(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rendering.refresh(instance)
+
+
+# Keep the full-text search index in sync with the catalog.
+SEARCH_KINDS = {
+    Book: 'book',
+    Article: 'blog',
+    News: 'news',
+    BookReview: 'bookreview',
+}
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=News)
+@receiver(post_save, sender=BookReview)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_instance(SEARCH_KINDS[sender], instance)
+    if sender is Book and search.is_available():
+        # Reviews are indexed under their book's title.
+        search.index_documents('bookreview', instance.bookreview_set.select_related('book'))
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=News)
+@receiver(post_delete, sender=BookReview)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_document(SEARCH_KINDS[sender], instance.pk)
+
+# Suggestions rank books by their reviews and comments (see also comments.models).
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookReview)
+@receiver(post_delete, sender=BookReview)
+def invalidate_book_suggestions(sender, created=True, **kwargs):
+    # An edited review leaves its book's rank as it was.
+    if sender is Book or created:
+        suggestions.invalidate()
+
+# Keep the home page feed in sync with its tables.
+FEED_KINDS = {
+    Article: 'blog',
+    News: 'news',
+    BookReview: 'bookreview',
+}
+
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=News)
+@receiver(post_save, sender=BookReview)
+def update_feed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        FeedItem.store([FeedItem.entry_for(instance)])
+
+@receiver(post_save, sender=Book)
+def update_feed_review_titles(sender, instance, raw=False, **kwargs):
+    if not raw:
+        FeedItem.objects.filter(
+            kind='bookreview', object_id__in=instance.bookreview_set.values('pk'),
+        ).exclude(title=instance.title).update(title=instance.title)
+
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=News)
+@receiver(post_delete, sender=BookReview)
+def remove_from_feed(sender, instance, **kwargs):
+    FeedItem.objects.filter(kind=FEED_KINDS[sender], object_id=instance.pk).delete()
+
+# Move the API validators of every list and detail endpoint built on the table.
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=News)
+@receiver(post_save, sender=BookReview)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=News)
+@receiver(post_delete, sender=BookReview)
+@receiver(post_delete, sender=Category)
+def bump_content_version(sender, raw=False, **kwargs):
+    if not raw:
+        versions.bump(versions.model_key(sender))
@@ -0,0 +1,112 @@
+"""
+Keyset (cursor) pagination for the JSON list APIs.
+
+Pages are ordered by ``(sort field, id)`` and the ``next`` cursor remembers
+the last row of the page, so the following page is fetched with a ``WHERE``
+on that pair instead of an ``OFFSET``. Cursors are opaque to clients: base64
+encoded JSON holding the sort name, the sort value and the id.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort, value, pk):
+    if value is not None and not isinstance(value, (str, int, float)):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+    if cursor_sort != sort or not isinstance(pk, int):
+        raise InvalidCursor('Cursor does not match the requested ordering')
+    return value, pk
+
+
+def parse_limit(request, default=DEFAULT_LIMIT):
+    try:
+        limit = int(request.GET.get('limit', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _is_nullable(model, path):
+    field = None
+    for name in path.split('__'):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        if field.is_relation:
+            model = field.related_model
+    return bool(field and field.null)
+
+
+def _after(field, descending, value, pk):
+    """Rows that come after ``(value, pk)`` in the page ordering."""
+    direction = 'lt' if descending else 'gt'
+    return Q(**{f'{field}__{direction}': value}) | Q(**{field: value, f'pk__{direction}': pk})
+
+
+def keyset_page(request, queryset, sort, field, descending=False, limit=None):
+    """
+    Return ``(rows, next_cursor)`` for one page of ``queryset``.
+
+    ``sort`` is the public ordering name (newest, oldest, ...) that the cursor
+    is bound to, ``field`` the model field it orders by. ``next_cursor`` is
+    ``None`` on the last page. ``limit`` defaults to the ``limit`` parameter.
+    Raises ``InvalidCursor`` for a malformed or mismatched ``cursor``
+    parameter.
+
+    Rows with a NULL sort value come last. They are read by a second query
+    ordered by id so both parts can seek on the ``(field, id)`` index.
+    """
+    limit = limit or parse_limit(request)
+    sign = '-' if descending else ''
+    nullable = _is_nullable(queryset.model, field)
+    queryset = queryset.annotate(keyset_value=F(field))
+    cursor = request.GET.get('cursor')
+    value = pk = None
+    if cursor:
+        value, pk = decode_cursor(cursor, sort)
+
+    rows = []
+    if not cursor or value is not None:
+        head = queryset.order_by(f'{sign}{field}', f'{sign}pk')
+        if nullable:
+            head = head.filter(**{f'{field}__isnull': False})
+        if cursor:
+            head = head.filter(_after(field, descending, value, pk))
+        rows = list(head[:limit + 1])
+    if nullable and len(rows) <= limit:
+        tail = queryset.filter(**{f'{field}__isnull': True}).order_by(f'{sign}pk')
+        if cursor and value is None:
+            tail = tail.filter(**{f'pk__{"lt" if descending else "gt"}': pk})
+        rows += list(tail[:limit + 1 - len(rows)])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(sort, last['keyset_value'], last['id'])
+        else:
+            next_cursor = encode_cursor(sort, last.keyset_value, last.pk)
+    return rows, next_cursor
@@ -0,0 +1,154 @@
+"""
+Field projections for the catalog JSON APIs.
+
+Each endpoint declares the fields it can return and which of them it returns
+by default. Clients pick a subset with ``?fields=id,title,author``. Only the
+columns those fields need are read, through ``.values()``, so unrequested
+columns (descriptions, full article bodies) are never fetched and no model
+instances are built for list responses. List projections serve the stored
+plain-text ``excerpt`` in place of the markdown body.
+"""
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from .models import Article, Book, BookReview, FeedItem, News
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+class Field:
+    """An output field computed from one or more ``.values()`` columns."""
+
+    def __init__(self, *columns, get=None):
+        self.columns = columns
+        self.get = get or (lambda row, request: row[columns[0]])
+
+
+def _date(column):
+    return Field(column, get=lambda row, request: row[column].isoformat() if row[column] else None)
+
+
+def _media(model, column, default=None, absolute=False):
+    storage = model._meta.get_field(column).storage or default_storage
+
+    def get(row, request):
+        name = row[column]
+        if not name:
+            return default
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if absolute else url
+    return Field(column, get=get)
+
+
+class Projection:
+    def __init__(self, fields, default):
+        self.fields = fields
+        self.default = tuple(default)
+
+    def parse(self, request, default=None):
+        """Return the field names requested through ``?fields=``."""
+        raw = request.GET.get('fields', '').strip()
+        if not raw:
+            return default or self.default
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise InvalidFields(f"Unknown fields: {', '.join(unknown)}")
+        return tuple(dict.fromkeys(names))
+
+    def columns(self, names):
+        columns = {'id': None}
+        for name in names:
+            columns.update(dict.fromkeys(self.fields[name].columns))
+        return list(columns)
+
+    def apply(self, queryset, names):
+        return queryset.values(*self.columns(names))
+
+    def serialize(self, row, names, request):
+        return {name: self.fields[name].get(row, request) for name in names}
+
+
+BOOK_FIELDS = {
+    'id': Field('id'),
+    'title': Field('title'),
+    'author': Field('author'),
+    'description': Field('description'),
+    'publication_date': _date('publication_date'),
+    'cover_image': _media(Book, 'cover_image', '/static/images/default-book.jpg', absolute=True),
+    'pdf_file': _media(Book, 'pdf_file', absolute=True),
+    'views': Field('view_count'),
+    'category': Field('category__name'),
+    'comment_count': Field('comment_count'),
+}
+BOOK_LIST = Projection(BOOK_FIELDS, ['id', 'title', 'author', 'cover_image', 'publication_date', 'category'])
+BOOK_DETAIL = Projection(BOOK_FIELDS, ['id', 'title', 'author', 'description', 'publication_date', 'cover_image', 'pdf_file', 'views'])
+
+ARTICLE_FIELDS = {
+    'id': Field('id'),
+    'title': Field('title'),
+    'content': Field('content'),
+    'author': Field('author', get=lambda row, request: {'name': row['author']}),
+    'created_at': _date('publication_date'),
+    'category': Field('category__name', get=lambda row, request: row['category__name'] or 'Uncategorized'),
+    'image': _media(Article, 'image', '/static/images/blog-default.jpg'),
+    'comment_count': Field('comment_count'),
+}
+ARTICLE_DETAIL = Projection(ARTICLE_FIELDS, ARTICLE_FIELDS)
+ARTICLE_LIST = Projection({**ARTICLE_FIELDS, 'content': Field('excerpt')}, ARTICLE_FIELDS)
+
+BLOG_CARD = Projection({
+    'id': Field('id'),
+    'title': Field('title'),
+    'content': Field('excerpt'),
+    'image_url': _media(Article, 'image', '/static/images/blog-default.jpg'),
+    'category': Field('category__name', get=lambda row, request: row['category__name'] or ''),
+}, ['id', 'title', 'content', 'image_url', 'category'])
+
+NEWS_FIELDS = {
+    'id': Field('id'),
+    'title': Field('title'),
+    'content': Field('content'),
+    'publication_date': _date('publication_date'),
+    'views': Field('view_count'),
+    'category': Field('category__name'),
+    'image': _media(News, 'image', '/static/images/blog-default.jpg'),
+    'comment_count': Field('comment_count'),
+}
+NEWS_DETAIL = Projection(NEWS_FIELDS, ['id', 'title', 'content', 'publication_date', 'views'])
+NEWS_LIST = Projection({**NEWS_FIELDS, 'content': Field('excerpt')}, NEWS_FIELDS)
+
+REVIEW_FIELDS = {
+    'id': Field('id'),
+    'book_title': Field('book__title'),
+    'reviewer_name': Field('reviewer_name'),
+    'review_text': Field('review_text'),
+    'review_date': _date('review_date'),
+    'category': Field('book__category__name'),
+    'image': _media(BookReview, 'image', '/static/images/blog-default.jpg'),
+    'comment_count': Field('comment_count'),
+}
+REVIEW_DETAIL = Projection(REVIEW_FIELDS, ['id', 'book_title', 'reviewer_name', 'review_text', 'review_date'])
+REVIEW_LIST = Projection({**REVIEW_FIELDS, 'review_text': Field('excerpt')}, REVIEW_FIELDS)
+
+REVIEW_CARD = Projection({
+    **REVIEW_FIELDS,
+    'review_text': Field('excerpt'),
+    'image_url': _media(BookReview, 'image', '/static/images/blog-default.jpg'),
+}, ['id', 'book_title', 'reviewer_name', 'review_text', 'review_date', 'category', 'image_url'])
+
+# Public pages of the feed entry kinds.
+FEED_PAGES = {'blog': 'blog_detail', 'news': 'news_detail', 'bookreview': 'review_detail'}
+
+FEED = Projection({
+    'type': Field('kind'),
+    'id': Field('object_id'),
+    'title': Field('title'),
+    'excerpt': Field('excerpt'),
+    'byline': Field('byline'),
+    'image_url': _media(FeedItem, 'image', FeedItem.DEFAULT_IMAGE),
+    'date': _date('published'),
+    'url': Field('kind', 'object_id', get=lambda row, request: reverse(FEED_PAGES[row['kind']], args=[row['object_id']])),
+}, ['type', 'id', 'title', 'excerpt', 'byline', 'image_url', 'date', 'url'])
@@ -0,0 +1,90 @@
+"""
+Stored HTML and plain-text excerpts for the catalog's markdown fields.
+
+Each model keeps the rendered HTML of its markdown field, a short plain-text
+excerpt for list pages and APIs, and a hash of the source they were built
+from. ``refresh()`` runs from a ``pre_save`` signal and only rebuilds them when
+the hash no longer matches, so views read the stored values and never render
+markdown or scan full bodies themselves. The hash also covers the markdown
+extensions and ``EXCERPT_LENGTH``, so changing either marks every row stale;
+run ``python manage.py render_markdown`` to rebuild existing rows.
+"""
+import hashlib
+import re
+
+import markdown
+from django.conf import settings
+
+EXTENSIONS = ["extra", "codehilite", "toc"]
+
+EXCERPT_LENGTH = getattr(settings, 'EXCERPT_LENGTH', 200)
+
+# model label -> markdown source field. The derived fields are named
+# ``<source>_html`` and ``<source>_hash``, plus ``excerpt``.
+MARKDOWN_FIELDS = {
+    'library_admin.article': 'content',
+    'library_admin.book': 'description',
+    'library_admin.bookreview': 'review_text',
+    'library_admin.news': 'content',
+}
+
+_PLAIN_TEXT_PATTERNS = [
+    (re.compile(r'#{1,6}\s+'), ''),  # Headers
+    (re.compile(r'\*\*(.*?)\*\*'), r'\1'),  # Bold
+    (re.compile(r'\*(.*?)\*'), r'\1'),  # Italic
+    (re.compile(r'\[([^\]]+)\]\([^)]+\)'), r'\1'),  # Links
+    (re.compile(r'`([^`]+)`'), r'\1'),  # Inline code
+    (re.compile(r'^\s*[-*+]\s+', re.MULTILINE), ''),  # List markers
+    (re.compile(r'^\s*\d+\.\s+', re.MULTILINE), ''),  # Numbered list markers
+    (re.compile(r'\s+'), ' '),  # Newlines and runs of spaces
+]
+
+
+def render(text):
+    return markdown.markdown(text or '', extensions=EXTENSIONS)
+
+
+def plain_text(text):
+    """Strip markdown symbols from ``text`` for previews."""
+    cleaned = text or ''
+    for pattern, replacement in _PLAIN_TEXT_PATTERNS:
+        cleaned = pattern.sub(replacement, cleaned)
+    return cleaned.strip()
+
+
+def excerpt(text, length=None):
+    """Plain-text preview of ``text``, cut at a word boundary."""
+    length = length or EXCERPT_LENGTH
+    cleaned = plain_text(text)
+    if len(cleaned) <= length:
+        return cleaned
+    cut = cleaned[:length].rsplit(' ', 1)[0] or cleaned[:length]
+    return cut.rstrip(' .,;:') + '…'
+
+
+def source_hash(text):
+    digest = hashlib.sha256(f"{EXTENSIONS!r}:{EXCERPT_LENGTH}:".encode())
+    digest.update((text or '').encode())
+    return digest.hexdigest()
+
+
+def fields_for(model):
+    """Return ``(source, stored_fields)`` for ``model``."""
+    source = MARKDOWN_FIELDS[model._meta.label_lower]
+    return source, [f'{source}_html', 'excerpt', f'{source}_hash']
+
+
+def refresh(instance, force=False):
+    """Rebuild the stored HTML and excerpt of ``instance`` if its markdown changed.
+
+    Returns ``True`` when the stored fields were updated.
+    """
+    source, (html, excerpt_field, hash_field) = fields_for(type(instance))
+    text = getattr(instance, source)
+    digest = source_hash(text)
+    if not force and getattr(instance, hash_field) == digest:
+        return False
+    setattr(instance, html, render(text))
+    setattr(instance, excerpt_field, excerpt(text))
+    setattr(instance, hash_field, digest)
+    return True
@@ -0,0 +1,122 @@
+"""
+Shared cache of the catalog list and search API responses.
+
+A response is stored under its view, its normalized query parameters and the
+current versions of the tables it reads (``library_admin.versions``, the same
+values behind its ETag). A write bumps a table's version, so every entry built
+on the old one stops being asked for and ages out: nothing has to enumerate
+or delete keys. Entries live in the ``api`` cache, which can be any Django
+backend: LocMem (the default, per process), file-based or Redis.
+
+On a miss only one request per key recomputes the response, holding a
+``cache.add()`` lock; concurrent requests for the same key wait up to
+``LOCK_WAIT`` seconds for its result before computing it themselves. Hits,
+misses and waits are counted in the same cache (``stats()``, or
+``python manage.py api_cache_stats``), and every response carries
+``X-Cache: HIT`` or ``MISS``.
+"""
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from . import versions
+
+CACHE_ALIAS = 'api'
+
+# Query parameters the cached views read; no other one changes a response.
+PARAMS = ('category', 'sort_by', 'sort', 'query', 'type', 'limit', 'cursor', 'fields')
+
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+POLL_INTERVAL = 0.05
+
+# hits: served from the cache; misses: computed here; coalesced: waited for
+# another request's result; lock_timeouts: waited in vain, then computed.
+METRICS = ('hits', 'misses', 'coalesced', 'lock_timeouts')
+
+
+def get_cache():
+    return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else 'default']
+
+
+def cache_key(request, view_name, version):
+    params = sorted((name, value) for name in PARAMS for value in request.GET.getlist(name))
+    # Absolute URLs in the responses depend on the host.
+    raw = f"{request.scheme}://{request.get_host()}?{urlencode(params)}"
+    return f"api:{view_name}:{version}:{hashlib.sha256(raw.encode()).hexdigest()[:32]}"
+
+
+def _count(metric):
+    cache = get_cache()
+    key = f"api:stats:{metric}"
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:  # Evicted in between.
+            cache.set(key, 1, timeout=None)
+
+
+def stats():
+    values = get_cache().get_many([f"api:stats:{metric}" for metric in METRICS])
+    return {metric: values.get(f"api:stats:{metric}", 0) for metric in METRICS}
+
+
+def reset_stats():
+    get_cache().delete_many([f"api:stats:{metric}" for metric in METRICS])
+
+
+def _from_entry(entry, status):
+    content_type, content = entry
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Cache'] = status
+    return response
+
+
+def _compute(cache, key, view, request, args, kwargs):
+    response = view(request, *args, **kwargs)
+    if response.status_code == 200:
+        cache.set(key, (response['Content-Type'], response.content))
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def cached(*keys):
+    """Cache the GET responses of a view whose output only changes with ``keys``."""
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            cache = get_cache()
+            version, _ = versions.for_request(request, versions.resolve(request, keys, kwargs))
+            key = cache_key(request, view.__name__, version)
+            entry = cache.get(key)
+            if entry is not None:
+                _count('hits')
+                return _from_entry(entry, 'HIT')
+
+            lock_key = f"{key}:lock"
+            if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+                try:
+                    _count('misses')
+                    return _compute(cache, key, view, request, args, kwargs)
+                finally:
+                    cache.delete(lock_key)
+
+            # Another request is computing this response: wait for it.
+            deadline = time.monotonic() + LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                entry = cache.get(key)
+                if entry is not None:
+                    _count('coalesced')
+                    return _from_entry(entry, 'HIT')
+            _count('lock_timeouts')
+            return _compute(cache, key, view, request, args, kwargs)
+        return inner
+    return decorator
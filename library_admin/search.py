@@ -0,0 +1,198 @@
+"""
+Full-text search index for books, blogs, news and book reviews.
+
+On SQLite the index is an FTS5 virtual table ranked with bm25(). On
+PostgreSQL it is a regular table with a weighted tsvector column behind a GIN
+index, ranked with ts_rank(). On any other backend (or an SQLite build without
+FTS5) ``search()`` returns ``None`` and the views fall back to ``icontains``.
+
+Every indexed object gets one row keyed by its kind and primary key. Rows are
+kept in sync by the save/delete signals in ``library_admin.models`` and can be
+rebuilt from scratch with ``python manage.py rebuild_search_index``.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+INDEX_TABLE = 'library_admin_searchindex'
+
+# Kinds share their names with CommentReply.comment_type.
+KINDS = ('book', 'blog', 'news', 'bookreview')
+
+# FTS5 rowids encode (kind, object id) so single rows can be replaced or
+# deleted by rowid instead of scanning the UNINDEXED columns.
+_KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+_ROWID_STRIDE = 8
+
+MAX_RESULTS = getattr(settings, 'SEARCH_MAX_RESULTS', 500)
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+_available = None
+
+
+def document_for(kind, obj):
+    """Return the (title, body) pair that gets indexed for ``obj``."""
+    if kind == 'book':
+        return obj.title, f"{obj.author}\n{obj.description}"
+    if kind == 'blog':
+        return obj.title, f"{obj.author}\n{obj.content}"
+    if kind == 'news':
+        return obj.title, obj.content
+    if kind == 'bookreview':
+        return obj.book.title, f"{obj.reviewer_name}\n{obj.review_text}"
+    raise ValueError(f"Unknown search kind: {kind}")
+
+
+def _vendor(conn=None):
+    return (conn or connection).vendor
+
+
+def is_available():
+    """Whether the index table exists on the default database."""
+    global _available
+    if _available is None:
+        _available = (
+            _vendor() in ('sqlite', 'postgresql')
+            and INDEX_TABLE in connection.introspection.table_names()
+        )
+    return _available
+
+
+def _rowid(kind, object_id):
+    return int(object_id) * _ROWID_STRIDE + _KIND_CODES[kind]
+
+
+def index_documents(kind, objects, conn=None):
+    """Insert or replace the index rows for ``objects`` of the given kind."""
+    conn = conn or connection
+    rows = []
+    for obj in objects:
+        title, body = document_for(kind, obj)
+        rows.append((obj.pk, title or '', body or ''))
+    if not rows:
+        return 0
+    with conn.cursor() as cursor:
+        if _vendor(conn) == 'sqlite':
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {INDEX_TABLE} (rowid, kind, object_id, title, body) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [(_rowid(kind, pk), kind, pk, title, body) for pk, title, body in rows],
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {INDEX_TABLE} (kind, object_id, title, body, document) "
+                "VALUES (%s, %s, %s, %s, "
+                "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B')) "
+                "ON CONFLICT (kind, object_id) DO UPDATE SET "
+                "title = EXCLUDED.title, body = EXCLUDED.body, document = EXCLUDED.document",
+                [(kind, pk, title, body, title, body) for pk, title, body in rows],
+            )
+    return len(rows)
+
+
+def remove_document(kind, object_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        if _vendor() == 'sqlite':
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE rowid = %s", [_rowid(kind, object_id)])
+        else:
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE kind = %s AND object_id = %s", [kind, object_id])
+
+
+def index_instance(kind, obj):
+    if is_available():
+        index_documents(kind, [obj])
+
+
+def clear(conn=None):
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+
+
+def _terms(query):
+    return [term.lower() for term in _WORD_RE.findall(query or '')][:8]
+
+
+def _match(kind, terms):
+    """
+    Return ``(sql, params, ordering)`` selecting the object ids of ``kind``
+    that match every term, the last one also as a prefix.
+    """
+    if _vendor() == 'sqlite':
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        return (
+            f"SELECT object_id FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s AND kind = %s",
+            [match, kind],
+            f"bm25({INDEX_TABLE}, 0.0, 0.0, 10.0, 1.0)",
+        )
+    tsquery = ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+    return (
+        f"SELECT object_id FROM {INDEX_TABLE}, to_tsquery('simple', %s) query "
+        "WHERE kind = %s AND document @@ query",
+        [tsquery, kind],
+        "ts_rank(document, query) DESC, object_id DESC",
+    )
+
+
+def search(kind, query, limit=None, within=None):
+    """
+    Return object ids of ``kind`` matching ``query``, best match first.
+
+    Every word of the query must match, and the last word also matches as a
+    prefix so results keep up while the user is still typing. ``within`` is a
+    queryset the matches are restricted to in the same query, so a category
+    filter applies before the ``limit`` (``MAX_RESULTS`` by default) and not
+    after it. Returns ``None`` when no index is available so callers can fall
+    back to ``icontains``.
+    """
+    if not is_available():
+        return None
+    terms = _terms(query)
+    if not terms:
+        return []
+    sql, params, ordering = _match(kind, terms)
+    if within is not None:
+        within_sql, within_params = within.values('pk').query.sql_with_params()
+        sql = f"{sql} AND object_id IN ({within_sql})"
+        params = [*params, *within_params]
+    with connection.cursor() as cursor:
+        cursor.execute(f"{sql} ORDER BY {ordering} LIMIT %s", [*params, limit or MAX_RESULTS])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def filter_ranked(queryset, kind, query, ranked=True):
+    """
+    Restrict ``queryset`` to index matches for ``query``.
+
+    Returns ``(queryset, ranked_ids)``; ``ranked_ids`` is ``None`` when the
+    index is unavailable and the caller has to filter by itself. With
+    ``ranked``, the queryset holds the ``MAX_RESULTS`` best matches and
+    ``ranked_ids`` their order. Without it, the queryset holds every match (as
+    a subquery, for the caller to sort and cut) and ``ranked_ids`` is empty.
+    """
+    if not is_available():
+        return queryset, None
+    if ranked:
+        ranked_ids = search(kind, query, within=queryset)
+        return queryset.filter(pk__in=ranked_ids), ranked_ids
+    terms = _terms(query)
+    if not terms:
+        return queryset.none(), []
+    sql, params, _ = _match(kind, terms)
+    return queryset.filter(pk__in=RawSQL(sql, params)), []
+
+
+def order_by_rank(objects, ranked_ids):
+    """Sort objects (or ``.values()`` rows) into the order returned by ``search()``."""
+    position = {pk: index for index, pk in enumerate(ranked_ids)}
+
+    def rank(obj):
+        pk = obj['id'] if isinstance(obj, dict) else obj.pk
+        return position.get(pk, len(position))
+    return sorted(objects, key=rank)
@@ -0,0 +1,144 @@
+"""
+In-memory prefix index for the books autocomplete.
+
+The index is built lazily from one query over book titles and authors and then
+answers ``books_suggestions_api`` without touching the database. Every word of
+a title or author is a key, so "hob" and "tolk" both find "The Hobbit".
+
+Book saves and deletes, and added or deleted reviews and book comments (which
+rank the suggestions), call ``invalidate()``. It drops this process's copy and
+bumps a generation number in the default cache so other workers rebuild on
+their next lookup. That only reaches them when the default cache is shared
+(``DEFAULT_CACHE_BACKEND``); with the per-process default each worker keeps
+its stale copy until it restarts.
+"""
+import threading
+from bisect import bisect_left
+import re
+
+from django.core.cache import cache
+from django.db.models import Count
+
+GENERATION_KEY = 'library_admin:book_suggestions:generation'
+
+# Prefixes up to this length match too many keys to scan on every keystroke,
+# so their best candidates are precomputed while building the index.
+SHORT_PREFIX_LENGTH = 3
+SHORT_PREFIX_CANDIDATES = 64
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+_lock = threading.Lock()
+_index = None
+_index_generation = None
+
+
+def normalize(text):
+    return ' '.join(_WORD_RE.findall((text or '').casefold()))
+
+
+class SuggestionIndex:
+    def __init__(self, entries):
+        """``entries`` is an iterable of ``(title, author, popularity)``."""
+        self.titles = []
+        self.normalized = []
+        self.words = []
+        self.popularity = []
+        pairs = []
+        for title, author, popularity in entries:
+            idx = len(self.titles)
+            self.titles.append(title)
+            self.normalized.append(normalize(title))
+            words = frozenset(_WORD_RE.findall(f"{title} {author}".casefold()))
+            self.words.append(words)
+            self.popularity.append(popularity or 0)
+            pairs.extend((word, idx) for word in words)
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.key_ids = [idx for _, idx in pairs]
+
+        # Best candidates for very short prefixes, most popular first.
+        self.short = {}
+        for idx in sorted(range(len(self.titles)), key=self._rank_key):
+            prefixes = {word[:length] for word in self.words[idx] for length in range(1, min(len(word), SHORT_PREFIX_LENGTH) + 1)}
+            for prefix in prefixes:
+                bucket = self.short.setdefault(prefix, [])
+                if len(bucket) < SHORT_PREFIX_CANDIDATES:
+                    bucket.append(idx)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def _rank_key(self, idx):
+        return (-self.popularity[idx], self.normalized[idx])
+
+    def _key_range(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        return start, bisect_left(self.keys, prefix + '\uffff', start)
+
+    def _candidates(self, terms):
+        # The precomputed bucket only holds the best titles for one short
+        # prefix; further terms could filter all of them out.
+        if len(terms) == 1 and len(terms[0]) <= SHORT_PREFIX_LENGTH:
+            return self.short.get(terms[0], [])
+        start, end = min((self._key_range(term) for term in terms), key=lambda key_range: key_range[1] - key_range[0])
+        return set(self.key_ids[start:end])
+
+    def suggest(self, query, limit=8):
+        terms = _WORD_RE.findall((query or '').casefold())
+        if not terms:
+            return []
+        # Candidates come from the term matching the fewest keys; every term
+        # must then match the start of some word in the same title or author.
+        matches = [
+            idx for idx in self._candidates(terms)
+            if all(any(word.startswith(term) for word in self.words[idx]) for term in terms)
+        ]
+        phrase = ' '.join(terms)
+        matches.sort(key=lambda idx: (not self.normalized[idx].startswith(phrase),) + self._rank_key(idx))
+        suggestions = []
+        seen = set()
+        for idx in matches:
+            title = self.titles[idx]
+            if title not in seen:
+                seen.add(title)
+                suggestions.append(title)
+                if len(suggestions) >= limit:
+                    break
+        return suggestions
+
+
+def build_index():
+    from .models import Book
+    books = (
+        Book.objects
+        .annotate(popularity=Count('bookreview', distinct=True) + Count('comments', distinct=True))
+        .values_list('title', 'author', 'popularity')
+    )
+    return SuggestionIndex(books.iterator())
+
+
+def get_index():
+    global _index, _index_generation
+    generation = cache.get(GENERATION_KEY, 0)
+    index = _index
+    if index is not None and _index_generation == generation:
+        return index
+    with _lock:
+        if _index is None or _index_generation != generation:
+            _index = build_index()
+            _index_generation = generation
+        return _index
+
+
+def suggest(query, limit=8):
+    return get_index().suggest(query, limit=limit)
+
+
+def invalidate():
+    global _index
+    _index = None
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
@@ -1,3 +1,676 @@
-from django.test import TestCase
-
-# Create your tests here.
+import re
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_init
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from comments.models import BlogComment, BookComment, BookReviewComment, NewsComment
+from public_site import page_cache
+from public_site.models import UserProfile
+
+from . import pagination, rendering, response_cache, search, suggestions, view_counts
+from .suggestions import SHORT_PREFIX_CANDIDATES, SuggestionIndex
+from .models import Article, Book, BookReview, Category, CommentReply, DailyViewCount, FeedItem, News
+
+# Most queries a public GET endpoint may run, whatever the number of rows it
+# returns. Raise a budget only when a new query is genuinely needed; a list
+# endpoint that starts growing with its rows is an N+1 and should be fixed.
+QUERY_BUDGETS = {
+    # library_admin JSON APIs; all but the suggestions read their validators
+    # (ContentVersion) first.
+    'articles_api': 2,
+    'article_detail_api': 2,
+    'blogs_api': 2,
+    'bookreviews_api': 2,
+    'bookreview_detail_api': 2,
+    'bookreviews_search_api': 3,
+    'bookreviews_list_api': 2,
+    'news_api': 2,
+    'news_detail_api': 2,
+    'news_search_api': 3,
+    'books_api': 3,
+    'book_detail_api': 2,
+    'books_search_api': 3,
+    'books_suggestions_api': 2,
+    'feed_api': 2,
+    'article_comments_api': 4,
+    'bookreview_comments_api': 4,
+    'news_comments_api': 4,
+    'book_comments_api': 4,
+    # public_site pages; the cached ones read their ContentVersion first.
+    'home': 2,
+    'blogs': 4,
+    'book_reviews': 4,
+    'books': 1,
+    'news': 4,
+    'contact': 0,
+    'about': 0,
+    'blog_detail': 2,
+    'book_detail': 1,
+    'review_detail': 1,
+    'news_detail': 1,
+    'digital_resources': 0,
+    'community_programs': 0,
+}
+
+# Routes that are not public reads: staff-only or write endpoints and account
+# pages behind a login.
+UNBUDGETED = {
+    'admin_comments_dashboard', 'admin_reply_comment', 'api_admin_delete_comment', 'api_admin_reply_comment',
+    'comment_replies_api', 'get_user_replies', 'toggle_comment_visibility',
+    'delete_admin_reply', 'edit_admin_reply', 'toggle_admin_reply_visibility',
+    'delete_user_reply', 'track_views',
+    'login', 'logout', 'register', 'profile', 'password_change', 'delete_account',
+    'activate_account', 'verify_otp',
+    # Long-lived event streams; they only query once, to check the object.
+    'article_comments_stream', 'bookreview_comments_stream', 'news_comments_stream', 'book_comments_stream',
+}
+
+ROWS = 5
+
+
+def _route_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.app_name == 'admin':
+                continue
+            yield from _route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+class CatalogTestCase(TestCase):
+    """One object of every catalog kind, for tests of a single feature."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Category")
+        book = Book.objects.create(title="Book", author="Author", description="About books", category=category)
+        article = Article.objects.create(title="An Article", content="**Blog** text", author="Author", category=category)
+        news = News.objects.create(title="A News Item", content="News text", category=category, image="news_images/0.jpg")
+        review = BookReview.objects.create(book=book, reviewer_name="Reader", review_text="A good book")
+        cls.url_kwargs = {
+            'article_id': article.pk,
+            'blog_id': article.pk,
+            'book_id': book.pk,
+            'news_id': news.pk,
+            'review_id': review.pk,
+        }
+
+    def setUp(self):
+        # Versions start over in every test, so must the caches keyed by them.
+        response_cache.get_cache().clear()
+        page_cache.get_cache().clear()
+
+    def url_for(self, name):
+        pattern = get_resolver().reverse_dict.getlist(name)[0][0][0][1]
+        return reverse(name, kwargs={param: self.url_kwargs[param] for param in pattern})
+
+
+class QueryBudgetTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=f"Category {i}") for i in range(2)]
+        for i in range(ROWS):
+            category = categories[i % 2]
+            book = Book.objects.create(title=f"Book {i}", author="Author", description="About books", category=category)
+            Article.objects.create(title=f"Article {i}", content="**Blog** text", author="Author", category=category)
+            News.objects.create(title=f"News {i}", content="News text", category=category, image=f"news_images/{i}.jpg")
+            BookReview.objects.create(book=book, reviewer_name="Reader", review_text="A good book")
+        readers = [User.objects.create_user(username=f"reader{i}") for i in range(2)]
+        UserProfile.objects.create(user=readers[0], phone='0300')
+        threads = [
+            (BlogComment, 'article', Article, 'blog'),
+            (BookComment, 'book', Book, 'book'),
+            (BookReviewComment, 'review', BookReview, 'bookreview'),
+            (NewsComment, 'news', News, 'news'),
+        ]
+        for comment_model, field, model, comment_type in threads:
+            target = model.objects.first()
+            for i in range(ROWS):
+                comment = comment_model.objects.create(**{field: target}, user=readers[i % 2], comment="Nice", rating=5)
+                reply = comment_model.objects.create(**{field: target}, name="Guest", comment="Agreed", parent=comment)
+                comment_model.objects.create(**{field: target}, user=readers[0], comment="Me too", parent=reply)
+                CommentReply.objects.create(comment_type=comment_type, comment_id=comment.pk, reply="Thanks", admin_name="Admin")
+        cls.url_kwargs = {
+            'article_id': Article.objects.first().pk,
+            'blog_id': Article.objects.first().pk,
+            'book_id': Book.objects.first().pk,
+            'news_id': News.objects.first().pk,
+            'review_id': BookReview.objects.first().pk,
+        }
+
+    def test_public_endpoints_stay_within_budget(self):
+        query_strings = {
+            'bookreviews_search_api': 'query=book&sort_by=relevance',
+            'news_search_api': 'query=news&sort_by=relevance',
+            'books_search_api': 'query=book&sort_by=relevance',
+            'books_suggestions_api': 'q=bo',
+        }
+        for name, budget in QUERY_BUDGETS.items():
+            url = self.url_for(name)
+            if name in query_strings:
+                url = f"{url}?{query_strings[name]}"
+            with self.subTest(name=name):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(
+                    len(queries), budget,
+                    f"{name} ran {len(queries)} queries (budget {budget}):\n"
+                    + "\n".join(query['sql'] for query in queries.captured_queries),
+                )
+
+    def test_every_public_route_has_a_budget(self):
+        names = set(_route_names(get_resolver().url_patterns))
+        missing = names - set(QUERY_BUDGETS) - UNBUDGETED
+        self.assertFalse(missing, f"Routes without a query budget: {sorted(missing)}")
+
+
+class ConditionalResponseTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        kwargs = cls.url_kwargs
+        BlogComment.objects.create(article_id=kwargs['article_id'], name="Guest", comment="Nice", rating=5)
+        BookComment.objects.create(book_id=kwargs['book_id'], name="Guest", comment="Nice", rating=5)
+        BookReviewComment.objects.create(review_id=kwargs['review_id'], name="Guest", comment="Nice", rating=5)
+        NewsComment.objects.create(news_id=kwargs['news_id'], name="Guest", comment="Nice", rating=5)
+
+    def test_unchanged_json_endpoints_answer_304_without_loading_rows(self):
+        instances = []
+
+        def count_instance(sender, **kwargs):
+            instances.append(sender)
+
+        for name in QUERY_BUDGETS:
+            if not name.endswith('_api'):
+                continue
+            url = self.url_for(name)
+            with self.subTest(name=name):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                self.assertFalse(etag.startswith('W/'))
+                post_init.connect(count_instance)
+                try:
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                finally:
+                    post_init.disconnect(count_instance)
+                self.assertEqual(response.status_code, 304)
+                self.assertLessEqual(len(queries), 1)
+                self.assertEqual(instances, [])
+
+    def test_writes_change_the_validators(self):
+        url = self.url_for('article_comments_api')
+        etag = self.client.get(url)['ETag']
+        BlogComment.objects.create(article_id=self.url_kwargs['article_id'], name="Guest", comment="Late", rating=4)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        url = self.url_for('books_api')
+        etag = self.client.get(url)['ETag']
+        Category.objects.first().save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ResponseCacheTests(CatalogTestCase):
+    def test_catalog_responses_are_cached_until_their_tables_change(self):
+        url = self.url_for('books_api')
+        first = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(len(queries), 1)
+
+        Book.objects.filter(pk=self.url_kwargs['book_id']).get().save()
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+
+class PageCacheTests(CatalogTestCase):
+    def test_anonymous_pages_are_cached_until_their_tables_change(self):
+        url = self.url_for('blogs')
+        first = self.client.get(url, {'sort': 'oldest'})
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url, {'sort': 'oldest'})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(len(queries), 1)
+
+        Article.objects.first().save()
+        self.assertEqual(self.client.get(url, {'sort': 'oldest'})['X-Cache'], 'MISS')
+
+        self.assertEqual(page_cache.warm('testserver', models=[Article]), ['home', 'blogs'])
+        self.assertEqual(self.client.get(self.url_for('home'))['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(self.url_for('blogs'))['X-Cache'], 'HIT')
+        self.assertEqual(page_cache.warm('testserver', 'https', models=[News]), ['home', 'news'])
+        self.assertEqual(self.client.get(self.url_for('news'), secure=True)['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(self.url_for('news'))['X-Cache'], 'MISS')
+
+    def test_signed_in_pages_are_rendered_with_cached_fragments(self):
+        reader = User.objects.create_user(username='reader')
+        UserProfile.objects.create(user=reader, phone='0300')
+        self.client.get(self.url_for('home'))
+        self.client.force_login(reader)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url_for('home'))
+        self.assertNotIn('X-Cache', response)
+        self.assertContains(response, 'Logout')
+        self.assertContains(response, 'An Article')
+        self.assertFalse([query for query in queries.captured_queries if 'library_admin_article' in query['sql']])
+
+
+class FeedTests(CatalogTestCase):
+    PER_KIND = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        book = Book.objects.get()
+        for i in range(1, cls.PER_KIND):
+            Article.objects.create(title=f"Article {i}", content="Text", author="Author", category=book.category)
+            News.objects.create(title=f"News {i}", content="Text", category=book.category)
+            BookReview.objects.create(book=book, reviewer_name="Reader", review_text="Text")
+
+    def test_feed_pages_through_every_item_once(self):
+        url = self.url_for('feed_api')
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(url, {'limit': 4, **({'cursor': cursor} if cursor else {})}).json()
+            seen += [(item['type'], item['id']) for item in response['results']]
+            cursor = response['next']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 3 * self.PER_KIND)
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertEqual(
+            [item['type'] for item in self.client.get(url, {'type': 'news'}).json()['results']], ['news'] * self.PER_KIND,
+        )
+
+        review = BookReview.objects.select_related('book').first()
+        review.book.title = "Renamed"
+        review.book.save()
+        self.assertEqual(FeedItem.objects.get(kind='bookreview', object_id=review.pk).title, "Renamed")
+        review.delete()
+        self.assertFalse(FeedItem.objects.filter(kind='bookreview', object_id=review.pk).exists())
+
+
+class ViewCountTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        category = Category.objects.get()
+        for i in range(2):
+            News.objects.create(title=f"Later News {i}", content="Text", category=category)
+
+    def test_views_are_buffered_deduped_and_sorted_by(self):
+        browser = {'HTTP_USER_AGENT': 'Mozilla/5.0 (X11; Linux x86_64) Firefox/140.0'}
+        # The oldest two, listed last until their views count.
+        popular, other = News.objects.order_by('pk')[:2]
+        list_url = self.url_for('news_api')
+        etag = self.client.get(list_url, {'sort_by': 'popular'})['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            for address in ('10.0.0.1', '10.0.0.2', '10.0.0.2'):
+                response = self.client.post(f'/track_views/news/{popular.pk}', REMOTE_ADDR=address, **browser)
+                self.assertEqual(response.status_code, 204)
+            self.client.post(f'/track_views/news/{other.pk}', **browser)
+            self.client.post(f'/track_views/news/{other.pk}', HTTP_USER_AGENT='Googlebot/2.1')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.client.post('/track_views/shelf/1', **browser).status_code, 404)
+
+        view_counts.flush()
+        self.assertEqual(
+            dict(DailyViewCount.objects.filter(kind='news').values_list('object_id', 'count')),
+            {popular.pk: 2, other.pk: 1},
+        )
+        response = self.client.get(list_url, {'sort_by': 'popular', 'fields': 'id,views'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][:2], [{'id': popular.pk, 'views': 2}, {'id': other.pk, 'views': 1}])
+
+    def test_popular_sorts_read_the_stored_recent_views(self):
+        news = list(News.objects.order_by('pk'))
+        today = timezone.localdate()
+        view_counts.write_counts({
+            ('news', news[0].pk, today): 3,
+            ('news', news[1].pk, today - timedelta(days=view_counts.POPULAR_DAYS + 1)): 9,
+        })
+        self.assertEqual(dict(News.objects.values_list('pk', 'recent_views')), {news[0].pk: 3, news[1].pk: 0, news[2].pk: 0})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url_for('news_api'), {'sort_by': 'popular', 'fields': 'id'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [news[0].pk, news[2].pk, news[1].pk])
+        self.assertFalse([query for query in queries.captured_queries if 'dailyviewcount' in query['sql']])
+
+        # The next day's first flush drops the views that aged out.
+        News.objects.filter(pk=news[1].pk).update(recent_views=9)
+        with mock.patch.object(view_counts, '_refreshed_on', today - timedelta(days=1)):
+            view_counts.write_counts({('news', news[2].pk, today): 1})
+        self.assertEqual(dict(News.objects.values_list('pk', 'recent_views')), {news[0].pk: 3, news[1].pk: 0, news[2].pk: 1})
+
+        News.objects.filter(pk=news[0].pk).update(recent_views=0)
+        out = StringIO()
+        call_command('flush_view_counts', '--refresh', stdout=out)
+        self.assertIn("Refreshed the recent views of 1 kinds.", out.getvalue())
+        self.assertEqual(News.objects.get(pk=news[0].pk).recent_views, 3)
+
+    def test_view_counts_only_change_the_responses_that_show_them(self):
+        browser = {'HTTP_USER_AGENT': 'Mozilla/5.0 (X11; Linux x86_64) Firefox/140.0'}
+        requests = {
+            'list': (self.url_for('books_api'), {}),
+            'popular list': (self.url_for('books_api'), {'sort_by': 'popular'}),
+            'list with views': (self.url_for('books_api'), {'fields': 'id,views'}),
+            'detail': (self.url_for('book_detail_api'), {}),
+        }
+        etags = {name: self.client.get(url, params)['ETag'] for name, (url, params) in requests.items()}
+
+        self.client.post(f"/track_views/book/{self.url_kwargs['book_id']}", **browser)
+        out = StringIO()
+        call_command('flush_view_counts', stdout=out)
+        self.assertIn("Wrote 1 view counts.", out.getvalue())
+        statuses = {
+            name: self.client.get(url, params, HTTP_IF_NONE_MATCH=etags[name]).status_code
+            for name, (url, params) in requests.items()
+        }
+        self.assertEqual(statuses, {'list': 304, 'popular list': 200, 'list with views': 200, 'detail': 200})
+
+    def test_buffered_views_are_flushed_without_further_hits(self):
+        buffer = view_counts.ViewBuffer()
+        flushed = threading.Event()
+
+        def flush():
+            buffer.take()
+            flushed.set()
+
+        with mock.patch.object(view_counts, 'FLUSH_SECONDS', 0.01), mock.patch.object(buffer, 'flush', flush):
+            buffer.add('book', 1, timezone.localdate())
+            self.assertTrue(flushed.wait(5))
+
+
+class PaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Fiction")
+        dates = [(2020, 1, 1), (2020, 1, 1), (2020, 1, 1), (2021, 6, 1), None, None, (2019, 3, 1)]
+        titles = ["Dune", "Emma", "Dune", "Beloved", "Atonement", "Dune", "Carrie"]
+        cls.books = [
+            Book.objects.create(
+                title=title, author="Author", category=category,
+                publication_date=timezone.datetime(*date).date() if date else None,
+            )
+            for title, date in zip(titles, dates)
+        ]
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+
+    def page_through(self, sort_by, limit):
+        ids, cursor = [], None
+        while True:
+            params = {'sort_by': sort_by, 'limit': limit, 'fields': 'id', **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(reverse('books_api'), params).json()
+            self.assertLessEqual(len(response['results']), limit)
+            ids += [book['id'] for book in response['results']]
+            cursor = response['next']
+            if not cursor:
+                return ids
+
+    def test_cursors_walk_every_ordering_without_gaps_or_repeats(self):
+        dated = [book for book in self.books if book.publication_date]
+        undated = [book for book in self.books if not book.publication_date]
+        expected = {
+            'newest': sorted(dated, key=lambda book: (book.publication_date, book.pk), reverse=True)
+            + sorted(undated, key=lambda book: book.pk, reverse=True),
+            'oldest': sorted(dated, key=lambda book: (book.publication_date, book.pk))
+            + sorted(undated, key=lambda book: book.pk),
+            'alphabetical': sorted(self.books, key=lambda book: (book.title, book.pk)),
+        }
+        for sort_by, books in expected.items():
+            for limit in (1, 2, 3, len(self.books)):
+                with self.subTest(sort_by=sort_by, limit=limit):
+                    self.assertEqual(self.page_through(sort_by, limit), [book.pk for book in books])
+
+    def test_malformed_or_mismatched_cursors_are_rejected(self):
+        url = reverse('books_api')
+        self.assertEqual(self.client.get(url, {'cursor': 'not a cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': pagination.encode_cursor('newest', 'x', 'y')}).status_code, 400)
+        cursor = self.client.get(url, {'sort_by': 'oldest', 'limit': 1}).json()['next']
+        self.assertEqual(pagination.decode_cursor(cursor, 'oldest'), ('2019-03-01', self.books[6].pk))
+        with self.assertRaises(pagination.InvalidCursor):
+            pagination.decode_cursor(cursor, 'newest')
+        self.assertEqual(self.client.get(url, {'sort_by': 'newest', 'cursor': cursor}).status_code, 400)
+
+    @mock.patch.object(pagination, 'MAX_LIMIT', 3)
+    def test_limit_is_capped(self):
+        response = self.client.get(reverse('books_api'), {'limit': 50}).json()
+        self.assertEqual(len(response['results']), 3)
+        self.assertIsNotNone(response['next'])
+        self.assertEqual(len(self.client.get(reverse('books_api'), {'limit': 'many'}).json()['results']), len(self.books))
+
+
+class ProjectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(
+            title="Dune", author="Frank Herbert", description="Spice", category=Category.objects.create(name="Fiction"),
+        )
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+
+    def get(self, url, fields):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': fields})
+        # The column aliases selected by the queries reading books.
+        book_queries = [
+            set(re.findall(r'AS "(\w+)"', query['sql'].split(' FROM "library_admin_book"')[0]))
+            for query in queries.captured_queries if ' FROM "library_admin_book"' in query['sql']
+        ]
+        return response, book_queries
+
+    def test_fields_narrow_the_payload_and_the_select_list(self):
+        # Lists also select the value their cursor is built from.
+        for url, extra in ((reverse('books_api'), {'keyset_value'}), (reverse('book_detail_api', args=[self.book.pk]), set())):
+            with self.subTest(url=url):
+                response, book_queries = self.get(url, 'title, author')
+                self.assertEqual(response.status_code, 200)
+                payload = response.json()
+                book = payload['results'][0] if 'results' in payload else payload
+                self.assertEqual(book, {'title': "Dune", 'author': "Frank Herbert"})
+                self.assertTrue(book_queries)
+                for columns in book_queries:
+                    self.assertEqual(columns, {'id', 'title', 'author', *extra})
+
+    def test_unknown_fields_are_rejected(self):
+        for url in (reverse('books_api'), reverse('book_detail_api', args=[self.book.pk])):
+            with self.subTest(url=url):
+                response, book_queries = self.get(url, 'title,password')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("password", response.json()['error'])
+                self.assertEqual(book_queries, [])
+
+
+class RenderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Fiction")
+
+    def article(self, content):
+        return Article.objects.create(title="Article", content=content, author="Author", category=self.category)
+
+    def test_saves_store_the_html_and_render_only_changed_markdown(self):
+        with mock.patch.object(rendering, 'render', wraps=rendering.render) as render:
+            article = self.article("# Title\n\n**Bold** text")
+            self.assertEqual(render.call_count, 1)
+            article.title = "Renamed"
+            article.save()
+            self.assertEqual(render.call_count, 1)
+            article.content = "*Changed*"
+            article.save()
+            self.assertEqual(render.call_count, 2)
+        stored = Article.objects.get(pk=article.pk)
+        self.assertEqual(stored.content_html, "<p><em>Changed</em></p>")
+        self.assertEqual(stored.content_hash, rendering.source_hash("*Changed*"))
+
+    def test_detail_pages_serve_the_stored_html(self):
+        article = self.article("**Bold** text")
+        with mock.patch.object(rendering, 'render') as render:
+            response = self.client.get(reverse('blog_detail', args=[article.pk]))
+        render.assert_not_called()
+        self.assertContains(response, "<strong>Bold</strong> text")
+
+    def test_render_markdown_rebuilds_stale_rows_or_all_with_force(self):
+        fresh, stale = self.article("**Fresh**"), self.article("**Stale**")
+        Article.objects.filter(pk=stale.pk).update(content_html='', excerpt='', content_hash='')
+
+        out = StringIO()
+        call_command('render_markdown', stdout=out)
+        self.assertIn("Rendered 1 blogs.", out.getvalue())
+        self.assertEqual(Article.objects.get(pk=stale.pk).content_html, "<p><strong>Stale</strong></p>")
+        self.assertEqual(Article.objects.get(pk=stale.pk).excerpt, "Stale")
+
+        out = StringIO()
+        call_command('render_markdown', stdout=out)
+        self.assertIn("Rendered 0 blogs.", out.getvalue())
+        out = StringIO()
+        call_command('render_markdown', '--force', stdout=out)
+        self.assertIn("Rendered 2 blogs.", out.getvalue())
+        self.assertEqual(Article.objects.get(pk=fresh.pk).content_html, "<p><strong>Fresh</strong></p>")
+
+    def test_render_markdown_refreshes_the_feed_excerpts(self):
+        article = self.article("Old text")
+        Article.objects.filter(pk=article.pk).update(content="**New** text")
+        call_command('render_markdown', stdout=StringIO())
+        self.assertEqual(FeedItem.objects.get(kind='blog', object_id=article.pk).excerpt, "New text")
+        page_cache.get_cache().clear()
+        self.assertContains(self.client.get(reverse('home')), "New text")
+
+
+class ExcerptTests(TestCase):
+    BODY = "## Heading\n\nA **bold** start with a [link](https://example.com) and `code`.\n\n" + "More words. " * 40 + "TAIL"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.article = Article.objects.create(
+            title="Article", content=cls.BODY, author="Author", category=Category.objects.create(name="Fiction"),
+        )
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+        page_cache.get_cache().clear()
+
+    def test_excerpts_are_plain_text_cut_at_a_word(self):
+        self.assertEqual(
+            rendering.plain_text("# Title\n\n- **bold** and *italic*\n1. [a link](/x) with `code`"),
+            "Title bold and italic a link with code",
+        )
+        self.assertEqual(rendering.excerpt("Short *text*."), "Short text.")
+        self.assertEqual(rendering.excerpt("one two three, four five", length=15), "one two three…")
+        self.assertEqual(rendering.excerpt("unbrokenwordthatislong", length=8), "unbroken…")
+
+        excerpt = self.article.excerpt
+        self.assertTrue(excerpt.startswith("Heading A bold start with a link and code. More words."))
+        self.assertLessEqual(len(excerpt), rendering.EXCERPT_LENGTH + 1)
+        self.assertTrue(excerpt.endswith("…"))
+
+    def test_lists_serve_the_excerpt_instead_of_the_body(self):
+        excerpt = self.article.excerpt
+        self.assertEqual(self.client.get(reverse('articles_api')).json()['results'][0]['content'], excerpt)
+        self.assertEqual(self.client.get(reverse('article_detail_api', args=[self.article.pk])).json()['content'], self.BODY)
+        self.assertEqual(self.client.get(reverse('feed_api')).json()['results'][0]['excerpt'], excerpt)
+        response = self.client.get(reverse('blogs'))
+        self.assertContains(response, excerpt)
+        self.assertNotContains(response, "TAIL")
+
+
+class SearchIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        fiction, history = Category.objects.create(name="Fiction"), Category.objects.create(name="History")
+        cls.fiction = [
+            Book.objects.create(
+                title=f"Garden Garden {i}", author="Author", description="Garden", category=fiction,
+                publication_date=timezone.datetime(2020, 1, 1 + i).date(),
+            )
+            for i in range(4)
+        ]
+        cls.history = [
+            Book.objects.create(
+                title=f"A History {i}", author="Author", description="Of the garden", category=history,
+                publication_date=timezone.datetime(2010, 1, 1 + i).date(),
+            )
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+
+    def titles(self, **params):
+        response = self.client.get(reverse('books_search_api'), params)
+        return [book['title'] for book in response.json()]
+
+    def test_saved_and_deleted_objects_are_kept_in_the_index(self):
+        book = self.history[0]
+        self.assertCountEqual(search.search('book', 'histo'), [history.pk for history in self.history])
+        book.title = "Orchard"
+        book.save()
+        self.assertEqual(search.search('book', 'orch'), [book.pk])
+        self.assertNotIn(book.pk, search.search('book', 'history'))
+        book.delete()
+        self.assertEqual(search.search('book', 'orchard'), [])
+
+    @mock.patch.object(search, 'MAX_RESULTS', 2)
+    def test_results_are_cut_after_the_category_filter_and_the_sort(self):
+        # The fiction books rank first for "garden", yet the category and the
+        # newest-first order see every match.
+        self.assertEqual(self.titles(query="garden", category="history"), ["A History 1", "A History 0"])
+        self.assertCountEqual(
+            self.titles(query="garden", category="history", sort_by="relevance"), ["A History 0", "A History 1"],
+        )
+        self.assertEqual(self.titles(query="garden", sort_by="oldest"), ["A History 0", "A History 1"])
+        self.assertEqual(self.titles(query="garden"), ["Garden Garden 3", "Garden Garden 2"])
+
+    @mock.patch.object(search, '_available', False)
+    def test_searches_fall_back_to_icontains_without_the_index(self):
+        self.assertIsNone(search.search('book', 'garden'))
+        self.assertEqual(self.titles(query="of the gard", category="history"), ["A History 1", "A History 0"])
+
+
+class SuggestionIndexTests(SimpleTestCase):
+    def test_short_terms_are_not_limited_to_the_most_popular_titles(self):
+        popular = [(f"The Popular Book {i}", "Author", 100 + i) for i in range(SHORT_PREFIX_CANDIDATES * 2)]
+        index = SuggestionIndex(popular + [("The Abbey", "Author", 0), ("War and Peace", "Tolstoy", 0)])
+        self.assertEqual(index.suggest("the ab"), ["The Abbey"])
+        self.assertEqual(index.suggest("war pe"), ["War and Peace"])
+        self.assertEqual(index.suggest("to wa"), ["War and Peace"])
+        # A single short term still reads its precomputed bucket, best first.
+        self.assertEqual(index.suggest("th", limit=2), ["The Popular Book 127", "The Popular Book 126"])
+
+
+class BookSuggestionTests(TestCase):
+    def test_reviews_and_comments_rerank_the_suggestions(self):
+        category = Category.objects.create(name="Fiction")
+        Book.objects.create(title="Dune", author="Frank Herbert", category=category)
+        messiah = Book.objects.create(title="Dune Messiah", author="Frank Herbert", category=category)
+        self.assertEqual(suggestions.suggest("dune"), ["Dune", "Dune Messiah"])
+
+        review = BookReview.objects.create(book=messiah, reviewer_name="Reader", review_text="Better")
+        self.assertEqual(suggestions.suggest("dune"), ["Dune Messiah", "Dune"])
+        review.delete()
+        self.assertEqual(suggestions.suggest("dune"), ["Dune", "Dune Messiah"])
+        comment = BookComment.objects.create(book=messiah, name="Guest", comment="Better", rating=5)
+        self.assertEqual(suggestions.suggest("dune"), ["Dune Messiah", "Dune"])
+        comment.delete()
+        self.assertEqual(suggestions.suggest("dune"), ["Dune", "Dune Messiah"])
@@ -7,9 +7,11 @@ urlpatterns = [
     path('api/articles/', views.articles_api, name='articles_api'),
     path('api/articles/<int:article_id>/', views.article_detail_api, name='article_detail_api'),
     path('api/articles/<int:article_id>/comments/', article_comments_api, name='article_comments_api'),
+    path('api/articles/<int:object_id>/comments/stream/', views.comment_stream, {'comment_type': 'blog'}, name='article_comments_stream'),
     path('api/bookreviews/', views.bookreviews_api, name='bookreviews_api'),
     path('api/bookreviews/<int:review_id>/', views.bookreview_detail_api, name='bookreview_detail_api'),
     path('api/bookreviews/<int:review_id>/comments/', bookreview_comments_api, name='bookreview_comments_api'),
+    path('api/bookreviews/<int:object_id>/comments/stream/', views.comment_stream, {'comment_type': 'bookreview'}, name='bookreview_comments_stream'),
     path('api/bookreviews/search/', views.bookreviews_search_api, name='bookreviews_search_api'),
     path('api/bookreviews/list/', bookreviews_list_api, name='bookreviews_list_api'),
     # News API endpoints
@@ -17,11 +19,13 @@ urlpatterns = [
     path('api/news/<int:news_id>/', views.news_detail_api, name='news_detail_api'),
     path('api/news/search/', views.news_search_api, name='news_search_api'),
     path('api/news/<int:news_id>/comments/', views.news_comments_api, name='news_comments_api'),
+    path('api/news/<int:object_id>/comments/stream/', views.comment_stream, {'comment_type': 'news'}, name='news_comments_stream'),
     # Book API endpoints
     path('api/books/', views.books_api, name='books_api'),
     path('api/books/<int:book_id>/', views.book_detail_api, name='book_detail_api'),
     path('api/books/search/', views.books_search_api, name='books_search_api'),
     path('api/books/<int:book_id>/comments/', views.book_comments_api, name='book_comments_api'),
+    path('api/books/<int:object_id>/comments/stream/', views.comment_stream, {'comment_type': 'book'}, name='book_comments_stream'),
     path('admin/comments/reply/', views.admin_reply_comment, name='admin_reply_comment'),
     path('api/comments/delete/', views.admin_delete_comment, name='api_admin_delete_comment'),
     path('api/comments/reply/', views.admin_reply_comment, name='api_admin_reply_comment'),
@@ -33,6 +37,8 @@ urlpatterns = [
     path('api/comments/toggle_admin_reply_visibility/', views.toggle_admin_reply_visibility, name='toggle_admin_reply_visibility'),
     path('api/admin-replies/delete/', views.delete_admin_reply, name='delete_admin_reply'),
     path('api/blogs/', blogs_api, name='blogs_api'),
+    path('api/feed/', views.feed_api, name='feed_api'),
+    path('track_views/<str:kind>/<int:object_id>', views.track_views, name='track_views'),
     path('api/books/suggestions/', books_suggestions_api, name='books_suggestions_api'),
     path('api/comments/delete_user_reply/', views.delete_user_reply, name='delete_user_reply'),
 ] 
\ No newline at end of file
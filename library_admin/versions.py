@@ -0,0 +1,133 @@
+"""
+Content versions behind the ETag and Last-Modified validators of the JSON APIs.
+
+Each resource a response depends on has a key: a model label such as
+``library_admin.book`` for a catalog table, or ``comments:<type>:<id>`` for a
+comment thread. Saves and deletes call ``bump()``, which stores a fresh random
+version and the time of the change in ``ContentVersion``, in the same
+transaction as the write. ``versioned`` views read the versions of their keys
+in one query and answer ``If-None-Match`` / ``If-Modified-Since`` with a 304
+before the view runs, so an unchanged resource costs that single query and no
+model instances. Writes that bypass signals (``QuerySet.update()``,
+``bulk_update``) must bump their keys themselves.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.apps import apps
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, set_response_etag
+from django.views.decorators.http import condition
+
+# Change it when a response format changes, so clients drop their copies.
+SALT = '1'
+
+USERS = 'auth.user'
+
+
+def model_key(model):
+    return model._meta.label_lower
+
+
+def thread_key(comment_type, object_id):
+    return f"comments:{comment_type}:{object_id}"
+
+
+def bump(*keys):
+    now = timezone.now()
+    content_version = apps.get_model('library_admin', 'ContentVersion')
+    content_version.objects.bulk_create(
+        [content_version(key=key, version=uuid.uuid4().hex, updated_at=now) for key in keys],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['version', 'updated_at'],
+    )
+
+
+def current(keys):
+    """Return ``(etag, last_modified)`` for the current versions of ``keys``."""
+    rows = apps.get_model('library_admin', 'ContentVersion').objects.filter(key__in=keys).values_list(
+        'key', 'version', 'updated_at',
+    )
+    versions = {key: (version, updated_at) for key, version, updated_at in rows}
+    digest = hashlib.sha256(SALT.encode())
+    for key in sorted(keys):
+        digest.update(f"{key}={versions.get(key, ('', None))[0]};".encode())
+    # Keys never bumped have not changed since versions were first recorded.
+    last_modified = max((updated_at for _, updated_at in versions.values()), default=None)
+    return digest.hexdigest()[:32], last_modified
+
+
+class RequestKey:
+    """
+    A key that only some requests of a view depend on: ``get(request)``
+    returns it, or ``None`` when the response does not read it.
+    """
+
+    def __init__(self, get):
+        self.get = get
+
+
+def resolve(request, keys, kwargs=None):
+    """The version keys of ``keys`` for this request and these view arguments."""
+    resolved = []
+    for key in keys:
+        if isinstance(key, RequestKey):
+            key = key.get(request)
+        elif callable(key):
+            key = key(**(kwargs or {}))
+        if key is not None:
+            resolved.append(key)
+    return resolved
+
+
+def for_request(request, keys):
+    """``current(keys)``, read once per request."""
+    memo = request.__dict__.setdefault('_content_versions', {})
+    if tuple(keys) not in memo:
+        memo[tuple(keys)] = current(keys)
+    return memo[tuple(keys)]
+
+
+def versioned(*keys):
+    """
+    Conditional GET for a view whose response only changes with ``keys``.
+
+    A key is a version key, a callable taking the view's keyword arguments
+    and returning one, e.g. ``lambda article_id: thread_key('blog', article_id)``,
+    or a ``RequestKey``. Other methods go straight to the view.
+    """
+    def decorator(view):
+        def state(request, **kwargs):
+            return for_request(request, resolve(request, keys, kwargs))
+
+        conditional_view = condition(
+            etag_func=lambda request, *args, **kwargs: state(request, **kwargs)[0],
+            last_modified_func=lambda request, *args, **kwargs: state(request, **kwargs)[1],
+        )(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                # A 404 now may be a 200 later without any of the keys moving.
+                response.headers.pop('ETag', None)
+                response.headers.pop('Last-Modified', None)
+            return response
+        return inner
+    return decorator
+
+
+def content_etag(view):
+    """Conditional GET from a hash of the body, for views that never hit the database."""
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+        set_response_etag(response)
+        return get_conditional_response(request, etag=response['ETag'], response=response)
+    return inner
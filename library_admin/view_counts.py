@@ -0,0 +1,300 @@
+"""
+Buffered page view counts for books, blogs, news and book reviews.
+
+``POST /track_views/<kind>/<id>`` calls ``record()``, which never writes to
+the database itself: hits are counted in a per-process buffer keyed by kind,
+object and day, and the buffer is written to ``DailyViewCount`` as one batch of
+upserts every ``VIEW_COUNT_FLUSH_SECONDS``: by a hit once that much time has
+passed, or else by a background timer started with the first buffered hit. The
+buffer is also written when the process exits normally (``atexit``) and by
+``python manage.py flush_view_counts`` for the process running it. A process
+that is killed loses the hits buffered since its last flush.
+
+Hits from crawlers, link previews and prefetches are dropped, and a visitor
+(its session, or its address and user agent without one) counts once per
+object every ``DEDUPE_SECONDS``, through ``cache.add()`` in the ``views``
+cache (``default`` unless configured; share it between workers to dedupe
+across them).
+
+Behind the catalog APIs' ``popular`` sort, each tracked model stores
+``recent_views``, its views over the last ``POPULAR_DAYS`` days, so the sort
+reads an indexed column instead of summing the daily counts of every row.
+Each flush recomputes it for the objects it wrote, and the first flush of a
+day (or ``flush_view_counts --refresh``) for every object whose stored value
+may have aged. The all-time ``view_count`` is summed by ``annotate()`` for the
+responses that show it. Each flush bumps the ``views:<kind>`` version of the
+kinds it changed. Only responses that sort by or show the counts include it in their
+validators and cache keys (``version_key_for()``), so other responses stay
+valid while views come in.
+"""
+import atexit
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import versions
+
+# Kinds share their names with the search index and CommentReply.comment_type.
+KINDS = {
+    'book': 'library_admin.Book',
+    'blog': 'library_admin.Article',
+    'news': 'library_admin.News',
+    'bookreview': 'library_admin.BookReview',
+}
+
+CACHE_ALIAS = 'views'
+FLUSH_SECONDS = getattr(settings, 'VIEW_COUNT_FLUSH_SECONDS', 60)
+DEDUPE_SECONDS = 30 * 60
+POPULAR_DAYS = 30
+
+BOT_RE = re.compile(
+    r'bot|crawl|spider|slurp|archiver|facebookexternalhit|embedly|preview|headless|'
+    r'curl|wget|python-requests|httpclient|okhttp|go-http-client',
+    re.IGNORECASE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidKind(ValueError):
+    pass
+
+
+def get_cache():
+    return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else 'default']
+
+
+def version_key(kind):
+    return f"views:{kind}"
+
+
+def version_key_for(kind, projection=None):
+    """
+    ``version_key(kind)`` as a ``RequestKey``, for requests that sort by
+    popularity (``sort_by`` or ``sort``) or return the ``views`` field of
+    ``projection``.
+    """
+    def get(request):
+        if 'popular' in (request.GET.get('sort_by'), request.GET.get('sort')):
+            return version_key(kind)
+        if projection is None or 'views' not in projection.fields:
+            return None
+        try:
+            names = projection.parse(request)
+        except ValueError:
+            return None  # Answered with a 400.
+        return version_key(kind) if 'views' in names else None
+    return versions.RequestKey(get)
+
+
+def kind_for(model):
+    label = model._meta.label
+    return next((kind for kind, model_label in KINDS.items() if model_label == label), None)
+
+
+def is_bot(request):
+    user_agent = request.headers.get('User-Agent', '')
+    if not user_agent or BOT_RE.search(user_agent):
+        return True
+    purpose = request.headers.get('Sec-Purpose') or request.headers.get('Purpose') or ''
+    return 'prefetch' in purpose.lower()
+
+
+def _visitor(request):
+    session_key = request.session.session_key if hasattr(request, 'session') else None
+    if session_key:
+        return f"s:{session_key}"
+    raw = f"{request.META.get('REMOTE_ADDR', '')}|{request.headers.get('User-Agent', '')}"
+    return f"a:{hashlib.sha256(raw.encode()).hexdigest()[:24]}"
+
+
+class ViewBuffer:
+    """Hit counts waiting to be written, keyed by ``(kind, object_id, day)``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    def add(self, kind, object_id, day):
+        with self._lock:
+            self._counts[kind, object_id, day] += 1
+            due = time.monotonic() - self._last_flush >= FLUSH_SECONDS
+            self._schedule()
+        if due:
+            self.flush()
+
+    def _schedule(self):
+        """Start the flush timer if counts are waiting and none is running; needs the lock."""
+        if self._timer is None and self._counts:
+            self._timer = threading.Timer(FLUSH_SECONDS, self._flush_on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except DatabaseError:
+            logger.exception("Could not write the buffered view counts")
+        finally:
+            connections.close_all()  # The timer thread's own connections.
+            with self._lock:
+                self._schedule()
+
+    def take(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._last_flush = time.monotonic()
+        return counts
+
+    def restore(self, counts):
+        with self._lock:
+            self._counts.update(counts)
+
+    def flush(self):
+        """Write the buffered counts. Returns the number of rows upserted."""
+        counts = self.take()
+        if not counts:
+            return 0
+        try:
+            return write_counts(counts)
+        except DatabaseError:
+            self.restore(counts)  # Retried with the next flush.
+            raise
+
+
+def _existing(counts):
+    """Drop counts for objects that do not exist (ids are not checked per hit)."""
+    ids_by_kind = {}
+    for kind, object_id, day in counts:
+        ids_by_kind.setdefault(kind, set()).add(object_id)
+    existing = {
+        kind: set(apps.get_model(KINDS[kind]).objects.filter(pk__in=ids).values_list('pk', flat=True))
+        for kind, ids in ids_by_kind.items()
+    }
+    return {key: count for key, count in counts.items() if key[1] in existing[key[0]]}
+
+
+def _total(rows):
+    return Coalesce(Subquery(rows.values('object_id').annotate(total=Sum('count')).values('total')[:1]), Value(0))
+
+
+def refresh_recent_views(kind, object_ids=None):
+    """
+    Recompute the stored ``recent_views`` of the ``kind`` objects in
+    ``object_ids``, or of every one that has or had recent views. Returns the
+    number of rows changed.
+    """
+    model = apps.get_model(KINDS[kind])
+    daily = apps.get_model('library_admin', 'DailyViewCount').objects.filter(kind=kind)
+    since = timezone.localdate() - timedelta(days=POPULAR_DAYS)
+    if object_ids is None:
+        objects = model.objects.filter(
+            Q(recent_views__gt=0) | Q(pk__in=daily.filter(day__gte=since).values('object_id'))
+        )
+    else:
+        objects = model.objects.filter(pk__in=object_ids)
+    recent_views = _total(daily.filter(object_id=OuterRef('pk'), day__gte=since))
+    return objects.exclude(recent_views=recent_views).update(recent_views=recent_views)
+
+
+def refresh_all():
+    """Recompute ``recent_views`` for every kind and bump the versions of those changed."""
+    global _refreshed_on
+    changed = [kind for kind in KINDS if refresh_recent_views(kind)]
+    versions.bump(*[version_key(kind) for kind in changed])
+    _refreshed_on = timezone.localdate()
+    return changed
+
+
+def write_counts(counts):
+    counts = _existing(counts)
+    if not counts:
+        return 0
+    model = apps.get_model('library_admin', 'DailyViewCount')
+    with transaction.atomic():
+        if connection.vendor in ('sqlite', 'postgresql'):
+            table = model._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {table} (kind, object_id, day, count) VALUES (%s, %s, %s, %s) "
+                    f"ON CONFLICT (kind, object_id, day) DO UPDATE SET count = {table}.count + excluded.count",
+                    [
+                        (kind, object_id, connection.ops.adapt_datefield_value(day), count)
+                        for (kind, object_id, day), count in counts.items()
+                    ],
+                )
+        else:
+            for (kind, object_id, day), count in counts.items():
+                updated = model.objects.filter(kind=kind, object_id=object_id, day=day).update(count=F('count') + count)
+                if not updated:
+                    model.objects.create(kind=kind, object_id=object_id, day=day, count=count)
+        ids_by_kind = {}
+        for kind, object_id, _ in counts:
+            ids_by_kind.setdefault(kind, set()).add(object_id)
+        for kind, ids in ids_by_kind.items():
+            refresh_recent_views(kind, ids)
+        versions.bump(*sorted(version_key(kind) for kind in ids_by_kind))
+        # Views older than POPULAR_DAYS leave the stored sums once a day.
+        if _refreshed_on != timezone.localdate():
+            refresh_all()
+    return len(counts)
+
+
+_buffer = ViewBuffer()
+_refreshed_on = None
+
+
+def record(request, kind, object_id):
+    """
+    Count a view of ``object_id`` unless it comes from a bot or the visitor
+    was already counted. Returns whether it was counted. Raises
+    ``InvalidKind`` for an unknown ``kind``.
+    """
+    if kind not in KINDS:
+        raise InvalidKind(kind)
+    if is_bot(request):
+        return False
+    if not get_cache().add(f"views:seen:{kind}:{object_id}:{_visitor(request)}", 1, timeout=DEDUPE_SECONDS):
+        return False
+    try:
+        _buffer.add(kind, object_id, timezone.localdate())
+    except DatabaseError:
+        pass  # The counts stay buffered.
+    return True
+
+
+def flush():
+    return _buffer.flush()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Could not write the buffered view counts at exit")
+
+
+def annotate(queryset):
+    """Add the all-time ``view_count`` to a queryset of a tracked model, if it is one."""
+    kind = kind_for(queryset.model)
+    if kind is None:
+        return queryset
+    counts = apps.get_model('library_admin', 'DailyViewCount').objects.filter(kind=kind, object_id=OuterRef('pk'))
+    return queryset.annotate(view_count=_total(counts))
@@ -1,8 +1,10 @@
-from django.shortcuts import render
-from django.http import JsonResponse
+from django.shortcuts import redirect, render
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt, csrf_protect
-from .models import Article, BookReview, Book, News, CommentReply
-from comments.models import BlogComment, BookReviewComment, NewsComment, BookComment
+from .models import Article, BookReview, Book, Category, FeedItem, News, CommentReply
+from comments.models import COMMENT_TYPES, BlogComment, BookReviewComment, NewsComment, BookComment
+from comments import counters, dashboard, live, sync, threads
 from datetime import datetime
 from django.db.models import Q
 from django.views.decorators.http import require_http_methods, require_POST
@@ -14,90 +16,128 @@ from django.urls import reverse_lazy
 from django.urls import reverse
 from django.urls import reverse_lazy
 from functools import wraps
-import re
 from django.contrib.admin.models import LogEntry, DELETION
 from django.contrib.contenttypes.models import ContentType
 from public_site.models import UserProfile
 from django.conf import settings
-from django.db import models
+from . import projections, search, suggestions, versions, view_counts
+from .projections import InvalidFields
+from .pagination import InvalidCursor, keyset_page
+from .response_cache import cached
+from .versions import versioned
 
 # Create your views here.
 
-def clean_markdown_preview(text):
-    """Clean markdown symbols from text for preview purposes"""
-    if not text:
-        return ""
-    
-    # Remove markdown symbols
-    cleaned = text
-    cleaned = re.sub(r'#{1,6}\s+', '', cleaned)  # Remove headers
-    cleaned = re.sub(r'\*\*(.*?)\*\*', r'\1', cleaned)  # Remove bold
-    cleaned = re.sub(r'\*(.*?)\*', r'\1', cleaned)  # Remove italic
-    cleaned = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', cleaned)  # Remove links
-    cleaned = re.sub(r'`([^`]+)`', r'\1', cleaned)  # Remove inline code
-    cleaned = re.sub(r'^\s*[-*+]\s+', '', cleaned, flags=re.MULTILINE)  # Remove list markers
-    cleaned = re.sub(r'^\s*\d+\.\s+', '', cleaned, flags=re.MULTILINE)  # Remove numbered list markers
-    cleaned = re.sub(r'\n+', ' ', cleaned)  # Replace multiple newlines with space
-    cleaned = re.sub(r'\s+', ' ', cleaned)  # Replace multiple spaces with single space
-    
-    return cleaned.strip()
-
-def flatten_replies_for_api(comment, parent=None):
-    flat = []
-    for reply in comment.replies.all().order_by('date'):
-        # Determine parent_name: immediate parent (could be user or name field)
-        if getattr(reply, 'parent_is_admin_reply', False):
-            parent_name = 'Admin'
-        elif parent:
-            parent_name = parent.user.username if getattr(parent, 'user', None) and parent.user else parent.name
-        else:
-            parent_name = comment.user.username if getattr(comment, 'user', None) and comment.user else comment.name
-        # Build reply dict with parent_name
-        reply_dict = {
-            'id': reply.id,
-            'name': reply.user.username if reply.user else reply.name,
-            'comment': reply.comment,
-            'rating': reply.rating,
-            'date': reply.date.strftime('%Y-%m-%d %H:%M'),
-            'profile_image': reply.user.userprofile.profile_image.url if reply.user and hasattr(reply.user, 'userprofile') and reply.user.userprofile.profile_image else '/static/images/default-avatar.png',
-            'parent_name': parent_name
-        }
-        flat.append(reply_dict)
-        flat.extend(flatten_replies_for_api(reply, parent=reply))
-    return flat
+# Validator keys of the catalog APIs: the tables each response reads, and the
+# view counts for the responses sorted by or showing them.
+ARTICLE_VERSIONS = [versions.model_key(Article), versions.model_key(Category), view_counts.version_key_for('blog')]
+NEWS_VERSIONS = [
+    versions.model_key(News), versions.model_key(Category), view_counts.version_key_for('news', projections.NEWS_LIST),
+]
+NEWS_DETAIL_VERSIONS = [
+    versions.model_key(News), versions.model_key(Category), view_counts.version_key_for('news', projections.NEWS_DETAIL),
+]
+BOOK_VERSIONS = [
+    versions.model_key(Book), versions.model_key(Category), view_counts.version_key_for('book', projections.BOOK_LIST),
+]
+BOOK_DETAIL_VERSIONS = [
+    versions.model_key(Book), versions.model_key(Category), view_counts.version_key_for('book', projections.BOOK_DETAIL),
+]
+REVIEW_VERSIONS = [
+    versions.model_key(BookReview), versions.model_key(Book), versions.model_key(Category),
+    view_counts.version_key_for('bookreview'),
+]
+FEED_VERSIONS = [versions.model_key(Article), versions.model_key(News), versions.model_key(BookReview), versions.model_key(Book)]
+
+# Keyset orderings for the list APIs: sort name -> (field, descending).
+DATE_ORDERINGS = {
+    'newest': ('publication_date', True),
+    'oldest': ('publication_date', False),
+    'alphabetical': ('title', False),
+    'popular': ('recent_views', True),
+}
+REVIEW_ORDERINGS = {
+    'newest': ('review_date', True),
+    'oldest': ('review_date', False),
+    'alphabetical': ('book__title', False),
+    'popular': ('recent_views', True),
+}
+FEED_ORDERINGS = {
+    'newest': ('published', True),
+}
+
+def paginate_list(request, queryset, orderings, sort_by):
+    """
+    Fetch one keyset page of ``queryset`` in the ``sort_by`` ordering.
+    Returns ``(rows, next_cursor, error_response)``.
+    """
+    if sort_by not in orderings:
+        sort_by = 'newest'
+    field, descending = orderings[sort_by]
+    try:
+        rows, next_cursor = keyset_page(request, queryset, sort_by, field, descending)
+    except InvalidCursor as e:
+        return None, None, JsonResponse({'error': str(e)}, status=400)
+    return rows, next_cursor, None
+
+def list_response(request, queryset, projection, orderings, sort_by):
+    """Paginated JSON list of ``queryset`` restricted to the requested fields."""
+    try:
+        names = projection.parse(request)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    queryset = view_counts.annotate(queryset)
+    rows, next_cursor, error = paginate_list(request, projection.apply(queryset, names), orderings, sort_by)
+    if error:
+        return error
+    return JsonResponse({
+        'results': [projection.serialize(row, names, request) for row in rows],
+        'next': next_cursor,
+    })
+
+def search_response(request, queryset, projection, orderings, sort_by, ranked_ids):
+    """
+    JSON list of at most ``search.MAX_RESULTS`` search results: the best
+    ranked ones, or the first ones in ``sort_by`` order.
+    """
+    try:
+        names = projection.parse(request)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    rows = projection.apply(view_counts.annotate(queryset), names)
+    if sort_by == 'relevance' and ranked_ids is not None:
+        rows = search.order_by_rank(rows, ranked_ids)
+    else:
+        field, descending = orderings.get(sort_by, orderings['newest'])
+        sign = '-' if descending else ''
+        rows = rows.order_by(f'{sign}{field}', f'{sign}pk')[:search.MAX_RESULTS]
+    return JsonResponse([projection.serialize(row, names, request) for row in rows], safe=False)
+
+def detail_response(request, queryset, pk, projection, not_found):
+    try:
+        names = projection.parse(request)
+        row = projection.apply(view_counts.annotate(queryset), names).get(pk=pk)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except queryset.model.DoesNotExist:
+        return JsonResponse({'error': not_found}, status=404)
+    return JsonResponse(projection.serialize(row, names, request))
 
 @csrf_exempt
+@versioned(*ARTICLE_VERSIONS)
+@cached(*ARTICLE_VERSIONS)
 def articles_api(request):
-    articles = Article.objects.all().order_by('-publication_date')
-    article_list = [{
-        'id': article.id,
-        'title': article.title,
-        'content': clean_markdown_preview(article.content),  # Clean content for preview
-        'author': {'name': article.author},
-        'created_at': article.publication_date.isoformat(),
-        'category': article.category.name if article.category else 'Uncategorized',
-        'image': article.image.url if article.image else '/static/images/blog-default.jpg'
-    } for article in articles]
-    return JsonResponse(article_list, safe=False)
+    sort_by = request.GET.get('sort_by', 'newest')
+    return list_response(request, Article.objects.all(), projections.ARTICLE_LIST, DATE_ORDERINGS, sort_by)
 
 @csrf_exempt
+@versioned(*ARTICLE_VERSIONS)
 def article_detail_api(request, article_id):
-    try:
-        article = Article.objects.get(id=article_id)
-        data = {
-            'id': article.id,
-            'title': article.title,
-            'content': article.content,
-            'author': {'name': article.author},
-            'created_at': article.publication_date.isoformat(),
-            'category': article.category.name if article.category else 'Uncategorized',
-            'image': article.image.url if article.image else '/static/images/blog-default.jpg'
-        }
-        return JsonResponse(data)
-    except Article.DoesNotExist:
-        return JsonResponse({'error': 'Article not found'}, status=404)
+    return detail_response(request, Article.objects.all(), article_id, projections.ARTICLE_DETAIL, 'Article not found')
 
 @csrf_exempt
+@versioned(*REVIEW_VERSIONS)
+@cached(*REVIEW_VERSIONS)
 def bookreviews_api(request):
     category = request.GET.get('category', 'all').lower()
     sort_by = request.GET.get('sort_by', 'newest')
@@ -105,79 +145,38 @@ def bookreviews_api(request):
     reviews = BookReview.objects.all()
 
     if category != 'all':
-        reviews = reviews.filter(book__category__iexact=category)
-
-    # Apply sorting
-    if sort_by == 'oldest':
-        reviews = reviews.order_by('review_date')
-    elif sort_by == 'alphabetical':
-        reviews = reviews.order_by('book__title') # Sort by book title for alphabetical
-    else: # newest
-        reviews = reviews.order_by('-review_date')
-
-    review_list = [{
-        'id': review.id,
-        'book_title': review.book.title,
-        'reviewer_name': review.reviewer_name,
-        'review_text': clean_markdown_preview(review.review_text),  # Clean review text for preview
-        'rating': review.rating,
-        'review_date': review.review_date.isoformat(),
-        'category': review.book.category, # Include book category in response
-        'image': review.image.url if review.image else '/static/images/blog-default.jpg'
-    } for review in reviews]
-    return JsonResponse(review_list, safe=False)
+        reviews = reviews.filter(book__category__name__iexact=category)
+
+    return list_response(request, reviews, projections.REVIEW_LIST, REVIEW_ORDERINGS, sort_by)
 
 @csrf_exempt
+@versioned(*REVIEW_VERSIONS)
 def bookreview_detail_api(request, review_id):
-    try:
-        review = BookReview.objects.get(id=review_id)
-        data = {
-            'id': review.id,
-            'book_title': review.book.title,
-            'reviewer_name': review.reviewer_name,
-            'review_text': review.review_text,
-            'rating': review.rating,
-            'review_date': review.review_date.isoformat(),
-        }
-        return JsonResponse(data)
-    except BookReview.DoesNotExist:
-        return JsonResponse({'error': 'Review not found'}, status=404)
+    return detail_response(request, BookReview.objects.all(), review_id, projections.REVIEW_DETAIL, 'Review not found')
 
 @csrf_exempt
+@versioned(*REVIEW_VERSIONS)
+@cached(*REVIEW_VERSIONS)
 def bookreviews_search_api(request):
     query = request.GET.get('query', '')
     category = request.GET.get('category', 'all').lower()
     sort_by = request.GET.get('sort_by', 'newest')
-    print(f"Received search query: '{query}'") # Debug print
     reviews = BookReview.objects.all()
 
     if category != 'all':
-        reviews = reviews.filter(book__category__iexact=category)
+        reviews = reviews.filter(book__category__name__iexact=category)
 
+    ranked_ids = None
     if query:
-        reviews = reviews.filter(Q(book__title__icontains=query) | Q(review_text__icontains=query) | Q(reviewer_name__icontains=query))
-    
-    # Apply sorting
-    if sort_by == 'oldest':
-        reviews = reviews.order_by('review_date')
-    elif sort_by == 'alphabetical':
-        reviews = reviews.order_by('book__title') # Sort by book title for alphabetical
-    else: # newest
-        reviews = reviews.order_by('-review_date')
-
-    print(f"Found {reviews.count()} reviews for query: '{query}'") # Debug print
-    review_list = [{
-        'id': review.id,
-        'book_title': review.book.title,
-        'reviewer_name': review.reviewer_name,
-        'review_text': clean_markdown_preview(review.review_text),  # Clean review text for preview
-        'rating': review.rating,
-        'review_date': review.review_date.isoformat(),
-        'category': review.book.category # Include book category in response
-    } for review in reviews]
-    return JsonResponse(review_list, safe=False)
+        reviews, ranked_ids = search.filter_ranked(reviews, 'bookreview', query, ranked=sort_by == 'relevance')
+        if ranked_ids is None:
+            reviews = reviews.filter(Q(book__title__icontains=query) | Q(review_text__icontains=query) | Q(reviewer_name__icontains=query))
+
+    return search_response(request, reviews, projections.REVIEW_LIST, REVIEW_ORDERINGS, sort_by, ranked_ids)
 
 @csrf_exempt
+@versioned(*NEWS_VERSIONS)
+@cached(*NEWS_VERSIONS)
 def news_api(request):
     category = request.GET.get('category', 'all').lower()
     sort_by = request.GET.get('sort_by', 'newest')
@@ -185,43 +184,18 @@ def news_api(request):
     news = News.objects.all()
 
     if category != 'all':
-        news = news.filter(category__iexact=category)
-
-    # Apply sorting
-    if sort_by == 'oldest':
-        news = news.order_by('publication_date')
-    elif sort_by == 'alphabetical':
-        news = news.order_by('title')
-    else: # newest
-        news = news.order_by('-publication_date')
-
-    news_list = [{
-        'id': item.id,
-        'title': item.title,
-        'content': clean_markdown_preview(item.content),  # Clean content for preview
-        'publication_date': item.publication_date.strftime('%Y-%m-%d'),
-        'views': getattr(item, 'views', 0),
-        'category': item.category,
-        'image': item.image.url if item.image else '/static/images/blog-default.jpg'
-    } for item in news]
-    return JsonResponse(news_list, safe=False)
+        news = news.filter(category__name__iexact=category)
+
+    return list_response(request, news, projections.NEWS_LIST, DATE_ORDERINGS, sort_by)
 
 @csrf_exempt
+@versioned(*NEWS_DETAIL_VERSIONS)
 def news_detail_api(request, news_id):
-    try:
-        news = News.objects.get(id=news_id)
-        data = {
-            'id': news.id,
-            'title': news.title,
-            'content': news.content,
-            'publication_date': news.publication_date.strftime('%Y-%m-%d'),
-            'views': getattr(news, 'views', 0)
-        }
-        return JsonResponse(data)
-    except News.DoesNotExist:
-        return JsonResponse({'error': 'News not found'}, status=404)
+    return detail_response(request, News.objects.all(), news_id, projections.NEWS_DETAIL, 'News not found')
 
 @csrf_exempt
+@versioned(*NEWS_VERSIONS)
+@cached(*NEWS_VERSIONS)
 def news_search_api(request):
     query = request.GET.get('query', '').lower()
     category = request.GET.get('category', 'all').lower()
@@ -230,32 +204,21 @@ def news_search_api(request):
     news = News.objects.all()
 
     if category != 'all':
-        news = news.filter(category__iexact=category)
+        news = news.filter(category__name__iexact=category)
 
+    ranked_ids = None
     if query:
-        news = news.filter(
-            Q(title__icontains=query) | Q(content__icontains=query)
-        )
-    
-    if sort_by == 'oldest':
-        news = news.order_by('publication_date')
-    elif sort_by == 'alphabetical':
-        news = news.order_by('title')
-    else:
-        news = news.order_by('-publication_date')
-    
-    news_list = [{
-        'id': item.id,
-        'title': item.title,
-        'content': clean_markdown_preview(item.content),  # Clean content for preview
-        'publication_date': item.publication_date.strftime('%Y-%m-%d'),
-        'views': getattr(item, 'views', 0),
-        'category': item.category,
-        'image': item.image.url if item.image else '/static/images/blog-default.jpg'
-    } for item in news]
-    return JsonResponse(news_list, safe=False)
+        news, ranked_ids = search.filter_ranked(news, 'news', query, ranked=sort_by == 'relevance')
+        if ranked_ids is None:
+            news = news.filter(
+                Q(title__icontains=query) | Q(content__icontains=query)
+            )
+
+    return search_response(request, news, projections.NEWS_LIST, DATE_ORDERINGS, sort_by, ranked_ids)
 
 @csrf_exempt
+@versioned(*BOOK_VERSIONS)
+@cached(*BOOK_VERSIONS)
 def books_api(request):
     category = request.GET.get('category', 'all').lower()
     sort_by = request.GET.get('sort_by', 'newest')
@@ -265,45 +228,16 @@ def books_api(request):
     if category != 'all':
         books = books.filter(category__name__iexact=category)
 
-    if sort_by == 'oldest':
-        books = books.order_by('publication_date')
-    elif sort_by == 'alphabetical':
-        books = books.order_by('title')
-    else:
-        books = books.order_by('-publication_date')
-
-    book_list = [{
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'description': book.description,
-        'publication_date': book.publication_date.strftime('%Y-%m-%d') if book.publication_date else None,
-        'cover_image': request.build_absolute_uri(book.cover_image.url) if book.cover_image else '/static/images/default-book.jpg',
-        'pdf_file': request.build_absolute_uri(book.pdf_file.url) if book.pdf_file else None,
-        'views': getattr(book, 'views', 0),
-        'category': book.category.name if book.category else None
-    } for book in books]
-    return JsonResponse(book_list, safe=False)
+    return list_response(request, books, projections.BOOK_LIST, DATE_ORDERINGS, sort_by)
 
 @csrf_exempt
+@versioned(*BOOK_DETAIL_VERSIONS)
 def book_detail_api(request, book_id):
-    try:
-        book = Book.objects.get(id=book_id)
-        data = {
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'description': book.description,
-            'publication_date': book.publication_date.strftime('%Y-%m-%d') if book.publication_date else None,
-            'cover_image': request.build_absolute_uri(book.cover_image.url) if book.cover_image else '/static/images/default-book.jpg',
-            'pdf_file': request.build_absolute_uri(book.pdf_file.url) if book.pdf_file else None,
-            'views': getattr(book, 'views', 0)
-        }
-        return JsonResponse(data)
-    except Book.DoesNotExist:
-        return JsonResponse({'error': 'Book not found'}, status=404)
+    return detail_response(request, Book.objects.all(), book_id, projections.BOOK_DETAIL, 'Book not found')
 
 @csrf_exempt
+@versioned(*BOOK_VERSIONS)
+@cached(*BOOK_VERSIONS)
 def books_search_api(request):
     query = request.GET.get('query', '').lower()
     category = request.GET.get('category', 'all').lower()
@@ -314,62 +248,41 @@ def books_search_api(request):
     if category != 'all':
         books = books.filter(category__name__iexact=category)
 
+    ranked_ids = None
     if query:
-        books = books.filter(
-            Q(title__icontains=query) | Q(author__icontains=query) | Q(description__icontains=query)
-        )
-    
-    if sort_by == 'oldest':
-        books = books.order_by('publication_date')
-    elif sort_by == 'alphabetical':
-        books = books.order_by('title')
-    else:
-        books = books.order_by('-publication_date')
-    
-    book_list = [{
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'description': book.description,
-        'publication_date': book.publication_date.strftime('%Y-%m-%d') if book.publication_date else None,
-        'cover_image': request.build_absolute_uri(book.cover_image.url) if book.cover_image else '/static/images/default-book.jpg',
-        'pdf_file': request.build_absolute_uri(book.pdf_file.url) if book.pdf_file else None,
-        'category': book.category.name if book.category else None
-    } for book in books]
-    return JsonResponse(book_list, safe=False)
+        books, ranked_ids = search.filter_ranked(books, 'book', query, ranked=sort_by == 'relevance')
+        if ranked_ids is None:
+            books = books.filter(
+                Q(title__icontains=query) | Q(author__icontains=query) | Q(description__icontains=query)
+            )
+
+    return search_response(request, books, projections.BOOK_LIST, DATE_ORDERINGS, sort_by, ranked_ids)
+
+def comment_thread_response(request, queryset, comment_type, object_id):
+    """
+    The comment thread in ``queryset``, with its version in the
+    ``X-Comments-Version`` header; with ``?since=<version>``, only what
+    changed on the object after that version.
+    """
+    since = request.GET.get('since')
+    if since:
+        try:
+            return JsonResponse(sync.load_changes(comment_type, object_id, since))
+        except sync.InvalidVersion:
+            return JsonResponse({'error': 'Invalid since version'}, status=400)
+    version = sync.current_version()
+    response = JsonResponse(threads.load_thread(queryset, comment_type), safe=False)
+    response['X-Comments-Version'] = version
+    return response
 
 @csrf_exempt
 @require_http_methods(["GET", "POST", "PATCH"])
+@versioned(lambda article_id: versions.thread_key('blog', article_id), versions.USERS)
 def article_comments_api(request, article_id):
     if request.method == "GET":
         try:
             article = Article.objects.get(id=article_id)
-            comments = article.comments.filter(is_active=True, parent__isnull=True).prefetch_related(
-                models.Prefetch('replies', queryset=BlogComment.objects.filter(is_active=True).order_by('date'))
-            )
-            def serialize_comment_flat(comment):
-                admin_replies = CommentReply.objects.filter(
-                    comment_id=comment.id,
-                    comment_type='blog',
-                    is_active=True
-                ).order_by('date')
-                flat_user_replies = flatten_replies_for_api(comment)
-                return {
-                    'id': comment.id,
-                    'name': comment.user.username if comment.user else comment.name,
-                    'comment': comment.comment,
-                    'rating': comment.rating,
-                    'date': comment.date.strftime('%Y-%m-%d %H:%M'),
-                    'profile_image': comment.user.userprofile.profile_image.url if comment.user and hasattr(comment.user, 'userprofile') and comment.user.userprofile.profile_image else '/static/images/default-avatar.png',
-                    'replies': flat_user_replies,
-                    'admin_replies': [{
-                        'reply': r.reply,
-                        'admin_name': r.admin_name,
-                        'date': r.date.strftime('%Y-%m-%d %H:%M')
-                    } for r in admin_replies]
-                }
-            comments_list = [serialize_comment_flat(comment) for comment in comments]
-            return JsonResponse(comments_list, safe=False)
+            return comment_thread_response(request, BlogComment.objects.filter(article=article), 'blog', article.pk)
         except Article.DoesNotExist:
             return JsonResponse({'error': 'Article not found'}, status=404)
     elif request.method == "POST":
@@ -435,36 +348,12 @@ def article_comments_api(request, article_id):
 
 @csrf_exempt
 @require_http_methods(["GET", "POST", "PATCH"])
+@versioned(lambda review_id: versions.thread_key('bookreview', review_id), versions.USERS)
 def bookreview_comments_api(request, review_id):
     if request.method == "GET":
         try:
             review = BookReview.objects.get(id=review_id)
-            comments = review.comments.filter(is_active=True, parent__isnull=True).prefetch_related(
-                models.Prefetch('replies', queryset=BookReviewComment.objects.filter(is_active=True).order_by('date'))
-            )
-            def serialize_comment_flat(comment):
-                admin_replies = CommentReply.objects.filter(
-                    comment_id=comment.id,
-                    comment_type='bookreview',
-                    is_active=True
-                ).order_by('date')
-                flat_user_replies = flatten_replies_for_api(comment)
-                return {
-                    'id': comment.id,
-                    'name': comment.user.username if comment.user else comment.name,
-                    'comment': comment.comment,
-                    'rating': comment.rating,
-                    'date': comment.date.strftime('%Y-%m-%d %H:%M'),
-                    'profile_image': comment.user.userprofile.profile_image.url if comment.user and hasattr(comment.user, 'userprofile') and comment.user.userprofile.profile_image else '/static/images/default-avatar.png',
-                    'replies': flat_user_replies,
-                    'admin_replies': [{
-                        'reply': r.reply,
-                        'admin_name': r.admin_name,
-                        'date': r.date.strftime('%Y-%m-%d %H:%M')
-                    } for r in admin_replies]
-                }
-            comments_list = [serialize_comment_flat(comment) for comment in comments]
-            return JsonResponse(comments_list, safe=False)
+            return comment_thread_response(request, BookReviewComment.objects.filter(review=review), 'bookreview', review.pk)
         except BookReview.DoesNotExist:
             return JsonResponse({'error': 'Review not found'}, status=404)
     elif request.method == "POST":
@@ -536,36 +425,12 @@ def bookreview_comments_api(request, review_id):
 
 @csrf_exempt
 @require_http_methods(["GET", "POST", "PATCH"])
+@versioned(lambda news_id: versions.thread_key('news', news_id), versions.USERS)
 def news_comments_api(request, news_id):
     if request.method == "GET":
         try:
             news = News.objects.get(id=news_id)
-            comments = news.comments.filter(is_active=True, parent__isnull=True).prefetch_related(
-                models.Prefetch('replies', queryset=NewsComment.objects.filter(is_active=True).order_by('date'))
-            )
-            def serialize_comment_flat(comment):
-                admin_replies = CommentReply.objects.filter(
-                    comment_id=comment.id,
-                    comment_type='news',
-                    is_active=True
-                ).order_by('date')
-                flat_user_replies = flatten_replies_for_api(comment)
-                return {
-                    'id': comment.id,
-                    'name': comment.user.username if comment.user else comment.name,
-                    'comment': comment.comment,
-                    'rating': comment.rating,
-                    'date': comment.date.strftime('%Y-%m-%d %H:%M'),
-                    'profile_image': comment.user.userprofile.profile_image.url if comment.user and hasattr(comment.user, 'userprofile') and comment.user.userprofile.profile_image else '/static/images/default-avatar.png',
-                    'replies': flat_user_replies,
-                    'admin_replies': [{
-                        'reply': r.reply,
-                        'admin_name': r.admin_name,
-                        'date': r.date.strftime('%Y-%m-%d %H:%M')
-                    } for r in admin_replies]
-                }
-            comments_list = [serialize_comment_flat(comment) for comment in comments]
-            return JsonResponse(comments_list, safe=False)
+            return comment_thread_response(request, NewsComment.objects.filter(news=news), 'news', news.pk)
         except News.DoesNotExist:
             return JsonResponse({'error': 'News not found'}, status=404)
     elif request.method == "POST":
@@ -637,36 +502,12 @@ def news_comments_api(request, news_id):
 
 @csrf_exempt
 @require_http_methods(["GET", "POST", "PATCH"])
+@versioned(lambda book_id: versions.thread_key('book', book_id), versions.USERS)
 def book_comments_api(request, book_id):
     if request.method == "GET":
         try:
             book = Book.objects.get(id=book_id)
-            comments = book.comments.filter(is_active=True, parent__isnull=True).prefetch_related(
-                models.Prefetch('replies', queryset=BookComment.objects.filter(is_active=True).order_by('date'))
-            )
-            def serialize_comment_flat(comment):
-                admin_replies = CommentReply.objects.filter(
-                    comment_id=comment.id,
-                    comment_type='book',
-                    is_active=True
-                ).order_by('date')
-                flat_user_replies = flatten_replies_for_api(comment)
-                return {
-                    'id': comment.id,
-                    'name': comment.user.username if comment.user else comment.name,
-                    'comment': comment.comment,
-                    'rating': comment.rating,
-                    'date': comment.date.strftime('%Y-%m-%d %H:%M'),
-                    'profile_image': comment.user.userprofile.profile_image.url if comment.user and hasattr(comment.user, 'userprofile') and comment.user.userprofile.profile_image else '/static/images/default-avatar.png',
-                    'replies': flat_user_replies,
-                    'admin_replies': [{
-                        'reply': r.reply,
-                        'admin_name': r.admin_name,
-                        'date': r.date.strftime('%Y-%m-%d %H:%M')
-                    } for r in admin_replies]
-                }
-            comments_list = [serialize_comment_flat(comment) for comment in comments]
-            return JsonResponse(comments_list, safe=False)
+            return comment_thread_response(request, BookComment.objects.filter(book=book), 'book', book.pk)
         except Book.DoesNotExist:
             return JsonResponse({'error': 'Book not found'}, status=404)
     elif request.method == "POST":
@@ -740,54 +581,56 @@ def book_comments_api(request, book_id):
 def comment_replies_api(request):
     comment_id = request.GET.get('comment_id')
     comment_type = request.GET.get('comment_type')
-    replies = CommentReply.objects.filter(comment_id=comment_id, comment_type=comment_type).order_by('date')
+    if not comment_id or not comment_id.isdigit():
+        return JsonResponse({'replies': []})
+    replies = threads.admin_replies_for(comment_type, [int(comment_id)], include_hidden=True)
     reply_list = [{
         'id': reply.id,
         'reply': reply.reply,
         'admin_name': reply.admin_name,
         'date': reply.date.strftime('%Y-%m-%d %H:%M'),
         'is_active': reply.is_active
-    } for reply in replies]
+    } for reply in replies.get(int(comment_id), [])]
     return JsonResponse({'replies': reply_list})
 
+@require_http_methods(["GET"])
+async def comment_stream(request, comment_type, object_id):
+    """Server-Sent Events with live comment updates for one object."""
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI a stream would tie up a worker for good; 204 tells
+        # EventSource not to reconnect, and the page keeps working without it.
+        return HttpResponse(status=204)
+    model = COMMENT_TYPES[comment_type]
+    field = counters.COMMENT_MODELS[model._meta.label_lower][0]
+    target_model = model._meta.get_field(field).related_model
+    if not await target_model.objects.filter(pk=object_id).aexists():
+        return JsonResponse({'error': 'Not found'}, status=404)
+    response = StreamingHttpResponse(live.stream(live.channel_for(comment_type, object_id)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def comments_dashboard_context(request, default_scope='all'):
+    """Template context for one page of the comments dashboard."""
+    comments, next_cursor = dashboard.load_page(request, default_scope)
+    return {
+        'comments': comments,
+        'next_cursor': next_cursor,
+        'type_choices': CommentReply.COMMENT_TYPE_CHOICES,
+        'selected_type': request.GET.get('type', 'all'),
+        'selected_visibility': request.GET.get('visibility', 'all'),
+        'selected_scope': request.GET.get('scope', default_scope),
+        'selected_user': request.GET.get('user', ''),
+    }
+
 @staff_member_required
 def admin_comments_dashboard(request):
-    blog_comments = BlogComment.objects.all()
-    book_comments = BookComment.objects.all()
-    bookreview_comments = BookReviewComment.objects.all()
-    news_comments = NewsComment.objects.all()
-    all_comments = list(blog_comments) + list(book_comments) + list(bookreview_comments) + list(news_comments)
-    all_comments.sort(key=lambda c: c.date, reverse=True)
-
-    # Attach admin reply count and flat user reply count to each comment
-    for c in all_comments:
-        comment_type = None
-        if hasattr(c, 'article_id'):
-            comment_type = 'blog'
-        elif hasattr(c, 'book_id'):
-            comment_type = 'book'
-        elif hasattr(c, 'review_id'):
-            comment_type = 'bookreview'
-        elif hasattr(c, 'news_id'):
-            comment_type = 'news'
-        
-        if comment_type:
-            c.admin_reply_count = CommentReply.objects.filter(comment_type=comment_type, comment_id=c.id).count()
-        else:
-            c.admin_reply_count = 0
-        c.flat_user_reply_count = flatten_replies_count(c)
-
-    context = {
-        'comments': all_comments,
-    }
+    try:
+        context = comments_dashboard_context(request)
+    except InvalidCursor:
+        return redirect(request.path)
     return render(request, "admin/comments_changelist.html", context)
 
-def flatten_replies_count(comment):
-    count = comment.replies.count()
-    for reply in comment.replies.all():
-        count += flatten_replies_count(reply)
-    return count
-
 def staff_member_required_json(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
@@ -933,20 +776,13 @@ def get_user_replies(request):
     comment_id = request.GET.get('comment_id')
     comment_type = request.GET.get('comment_type')
 
-    model_map = {
-        'blog': BlogComment,
-        'book': BookComment,
-        'bookreview': BookReviewComment,
-        'news': NewsComment,
-    }
-
-    model = model_map.get(comment_type)
+    model = COMMENT_TYPES.get(comment_type)
     if not model or not comment_id:
         return JsonResponse({'error': 'Invalid parameters'}, status=400)
 
     try:
         parent_comment = model.objects.get(id=comment_id)
-        replies = flatten_replies_for_api(parent_comment)
+        replies = parent_comment.descendants().select_related('user').order_by('path')
         reply_list = [{
             'id': reply.id,
             'user': reply.user.username if reply.user else 'Anonymous',
@@ -969,14 +805,7 @@ def toggle_comment_visibility(request):
         comment_id = data.get('comment_id')
         comment_type = data.get('comment_type')
 
-        model_map = {
-            'blog': BlogComment,
-            'book': BookComment,
-            'bookreview': BookReviewComment,
-            'news': NewsComment,
-        }
-        
-        model = model_map.get(comment_type)
+        model = COMMENT_TYPES.get(comment_type)
         if not model or not comment_id:
             return JsonResponse({'success': False, 'error': 'Invalid parameters'}, status=400)
 
@@ -991,6 +820,8 @@ def toggle_comment_visibility(request):
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 @csrf_exempt
+@versioned(*ARTICLE_VERSIONS)
+@cached(*ARTICLE_VERSIONS)
 def blogs_api(request):
     category = request.GET.get('category', 'all')
     sort_by = request.GET.get('sort', 'newest')
@@ -999,58 +830,48 @@ def blogs_api(request):
     if category != 'all':
         blogs = blogs.filter(category__name__iexact=category)
 
-    if sort_by == 'oldest':
-        blogs = blogs.order_by('publication_date')
-    elif sort_by == 'alphabetical':
-        blogs = blogs.order_by('title')
-    else:
-        blogs = blogs.order_by('-publication_date')
-
-    blog_list = [{
-        'id': blog.id,
-        'title': blog.title,
-        'content': blog.content[:200],
-        'image_url': blog.image.url if blog.image else '/static/images/blog-default.jpg',
-        'category': blog.category.name if blog.category else '',
-    } for blog in blogs]
-    return JsonResponse(blog_list, safe=False)
+    return list_response(request, blogs, projections.BLOG_CARD, DATE_ORDERINGS, sort_by)
 
 @csrf_exempt
+@versioned(*REVIEW_VERSIONS)
+@cached(*REVIEW_VERSIONS)
 def bookreviews_list_api(request):
     category = request.GET.get('category', 'all')
     sort_by = request.GET.get('sort', 'newest')
 
     reviews = BookReview.objects.all()
     if category != 'all':
-        reviews = reviews.filter(book__category__iexact=category)
+        reviews = reviews.filter(book__category__name__iexact=category)
 
-    if sort_by == 'oldest':
-        reviews = reviews.order_by('review_date')
-    elif sort_by == 'alphabetical':
-        reviews = reviews.order_by('book__title')
-    else:
-        reviews = reviews.order_by('-review_date')
-
-    review_list = [{
-        'id': review.id,
-        'book_title': review.book.title,
-        'reviewer_name': review.reviewer_name,
-        'review_text': review.review_text[:200],
-        'rating': review.rating,
-        'review_date': review.review_date.isoformat(),
-        'category': review.book.category,
-        'image_url': review.image.url if review.image else '/static/images/blog-default.jpg',
-    } for review in reviews]
-    return JsonResponse(review_list, safe=False)
+    return list_response(request, reviews, projections.REVIEW_CARD, REVIEW_ORDERINGS, sort_by)
 
 @csrf_exempt
+@versioned(*FEED_VERSIONS)
+@cached(*FEED_VERSIONS)
+def feed_api(request):
+    """The latest articles, news and book reviews, newest first; ``?type=`` picks one kind."""
+    items = FeedItem.objects.all()
+    kind = request.GET.get('type', 'all')
+    if kind != 'all':
+        items = items.filter(kind=kind)
+    return list_response(request, items, projections.FEED, FEED_ORDERINGS, 'newest')
+
+@csrf_exempt
+@require_POST
+def track_views(request, kind, object_id):
+    """Count a page view; see ``view_counts`` for the buffering, bot filter and dedupe."""
+    try:
+        view_counts.record(request, kind, object_id)
+    except view_counts.InvalidKind:
+        return JsonResponse({'error': 'Unknown item type'}, status=404)
+    return HttpResponse(status=204)
+
+@csrf_exempt
+@versions.content_etag
 def books_suggestions_api(request):
     query = request.GET.get('q', '').strip()
-    suggestions = []
-    if query:
-        books = Book.objects.filter(title__icontains=query).order_by('title')[:8]
-        suggestions = list(books.values_list('title', flat=True))
-    return JsonResponse({'suggestions': suggestions})
+    titles = suggestions.suggest(query) if query else []
+    return JsonResponse({'suggestions': titles})
 
 @csrf_exempt
 @require_POST
@@ -1062,13 +883,7 @@ def delete_user_reply(request):
     comment_type = data.get('comment_type')
     if not reply_id or not comment_type:
         return JsonResponse({'success': False, 'error': 'Missing reply id or type.'}, status=400)
-    model_map = {
-        'blog': BlogComment,
-        'book': BookComment,
-        'bookreview': BookReviewComment,
-        'news': NewsComment,
-    }
-    model = model_map.get(comment_type)
+    model = COMMENT_TYPES.get(comment_type)
     if not model:
         return JsonResponse({'success': False, 'error': 'Invalid comment type.'}, status=400)
     try:
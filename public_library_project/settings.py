@@ -181,6 +181,54 @@ LOGIN_URL = '/login/'
 ACCOUNT_LOGIN_METHODS = {'email', 'username'}
 ACCOUNT_SIGNUP_FIELDS = ['email*', 'username*', 'password1*', 'password2*']
 
+# Length of the plain-text excerpts shown on list pages and list APIs.
+# Run "python manage.py render_markdown" after changing it.
+EXCERPT_LENGTH = int(os.getenv('EXCERPT_LENGTH', '200'))
+
+# 'api' holds the catalog API responses (library_admin.response_cache). Any
+# Django cache backend works: LocMem (per process), file-based, or Redis shared
+# by every worker, e.g. API_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# and API_CACHE_LOCATION=redis://localhost:6379/1.
+CACHES = {
+    # Also holds the generation of the book suggestions index
+    # (library_admin.suggestions): with several workers, a shared backend is
+    # what lets a book edit reach the other workers' copies.
+    'default': {
+        'BACKEND': os.getenv('DEFAULT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DEFAULT_CACHE_LOCATION', ''),
+    },
+    'api': {
+        'BACKEND': os.getenv('API_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('API_CACHE_LOCATION', 'api-responses'),
+        'TIMEOUT': int(os.getenv('API_CACHE_TIMEOUT', '600')),
+    },
+    # Anonymous public pages and their template fragments (public_site.page_cache).
+    'pages': {
+        'BACKEND': os.getenv('PAGE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('PAGE_CACHE_LOCATION', 'public-pages'),
+        'TIMEOUT': int(os.getenv('PAGE_CACHE_TIMEOUT', '3600')),
+    },
+    # Session generations (public_site.session_generations) and, when a shared
+    # backend is configured, the sessions themselves; see SESSION_ENGINE below.
+    # Entries expire with their sessions; an evicted one loses its unwritten changes.
+    # The per-process default makes revocations worker-local (check public_site.W002).
+    'sessions': {
+        'BACKEND': os.getenv('SESSION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('SESSION_CACHE_LOCATION', 'sessions'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '100000'))},
+    },
+}
+
+# Broker behind the live comment streams. The in-process default only reaches
+# streams served by the same process; with several ASGI workers use
+# 'comments.live.RedisBroker' (needs the redis package).
+COMMENT_STREAM_BROKER = os.getenv('COMMENT_STREAM_BROKER', 'comments.live.InProcessBroker')
+COMMENT_STREAM_REDIS_URL = os.getenv('COMMENT_STREAM_REDIS_URL', 'redis://localhost:6379/0')
+
+# Page views are counted in memory and written to the daily counts table every
+# this many seconds and at exit, per process (library_admin.view_counts).
+VIEW_COUNT_FLUSH_SECONDS = int(os.getenv('VIEW_COUNT_FLUSH_SECONDS', '60'))
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -193,8 +241,35 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', 'kaleemullahchanna786@gmail.com')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', 'tuzg tdxg jxhn xurv')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'Public Library Bagarji <kaleemullahchanna786@gmail.com>')
 
+# Account emails, OTP codes included, are queued in the outbox and only sent by
+# a running `manage.py send_outbox` worker, which gives up on an email after
+# OUTBOX_MAX_ATTEMPTS failed attempts. Queueing logs a warning while emails have
+# been due for more than OUTBOX_WARN_AFTER_SECONDS, e.g. with no worker running.
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '6'))
+OUTBOX_WARN_AFTER_SECONDS = int(os.getenv('OUTBOX_WARN_AFTER_SECONDS', '300'))
+
+# The worker keeps up to EMAIL_POOL_SIZE connections to the mail server open
+# and reopens one left idle for more than EMAIL_POOL_MAX_IDLE seconds
+# (public_site.mail_pool).
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', '2'))
+EMAIL_POOL_MAX_IDLE = int(os.getenv('EMAIL_POOL_MAX_IDLE', '60'))
+
 SESSION_COOKIE_NAME = 'publicsite_sessionid'
 
+# Sessions live in a table indexed by user (public_site.session_backend). With
+# a cache shared by every worker configured, e.g.
+# SESSION_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# SESSION_CACHE_LOCATION=redis://localhost:6379/2, they are read from that cache
+# and written behind to the table (public_site.cached_session_backend): changes
+# that keep the same signed-in user reach the table at most every
+# SESSION_WRITE_BEHIND_SECONDS, and the cache holds the only copy in between.
+# The per-process default cache would lose them between workers.
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', (
+    'public_site.cached_session_backend' if os.getenv('SESSION_CACHE_BACKEND') else 'public_site.session_backend'
+))
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_WRITE_BEHIND_SECONDS = int(os.getenv('SESSION_WRITE_BEHIND_SECONDS', '60'))
+
 CSRF_COOKIE_NAME = 'publicsite_csrftoken'
 
 X_FRAME_OPTIONS = 'SAMEORIGIN'
@@ -0,0 +1,118 @@
+"""
+Cached sessions with write-behind to the database.
+
+Like Django's ``cached_db`` engine, reads come from the ``sessions`` cache
+(``SESSION_CACHE_ALIAS``) and fall back to the ``UserSession`` table of
+``public_site.session_backend``. Unlike it, a save does not always write the
+table: changes that keep the same signed-in user are written at most every
+``SESSION_WRITE_BEHIND_SECONDS`` per session, and only to the cache in
+between. New sessions, sign-ins, sign-outs and deletions always reach the
+table at once, so ``UserSession.delete_for_user()`` sees every session of a
+user.
+
+The cache holds the only copy of the changes written behind, so it has to be
+shared by every worker (Redis, Memcached) and large enough not to evict live
+sessions; with a per-process LocMem cache, run a single process or set
+``SESSION_WRITE_BEHIND_SECONDS`` to 0. Expired rows are deleted by
+``python manage.py purge_sessions``; cache entries expire with their sessions.
+"""
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+
+from . import session_backend
+
+KEY_PREFIX = 'public_site.sessions:'
+WRITE_BEHIND_SECONDS = getattr(settings, 'SESSION_WRITE_BEHIND_SECONDS', 60)
+
+logger = logging.getLogger('django.contrib.sessions')
+
+
+def _user_id(data):
+    try:
+        return int(data.get(SESSION_KEY))
+    except (TypeError, ValueError):
+        return None
+
+
+class SessionStore(session_backend.SessionStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        self._cache = caches[settings.SESSION_CACHE_ALIAS]
+        # (time, user id) of the last write to the table, when known.
+        self._stored = None
+        super().__init__(session_key)
+
+    @property
+    def cache_key(self):
+        return self.cache_key_prefix + self._get_or_create_session_key()
+
+    @classmethod
+    def forget(cls, session_keys):
+        """Drop ``session_keys`` from the cache, after their rows were deleted."""
+        caches[settings.SESSION_CACHE_ALIAS].delete_many([cls.cache_key_prefix + key for key in session_keys])
+
+    def load(self):
+        try:
+            entry = self._cache.get(self.cache_key)
+        except Exception:
+            # Some backends raise on invalid keys; see the cached_db engine.
+            entry = None
+        if entry is not None:
+            data, self._stored = entry
+            return data
+        session = self._get_session_from_db()
+        if not session:
+            return {}
+        data = self.decode(session.session_data)
+        self._stored = (time.time(), session.user_id)
+        self._cache.set(self.cache_key, (data, self._stored), self.get_expiry_age(expiry=session.expire_date))
+        return data
+
+    def exists(self, session_key):
+        return bool(session_key) and (self.cache_key_prefix + session_key) in self._cache or super().exists(session_key)
+
+    def _write_due(self, data, must_create, now):
+        if must_create or self._stored is None:
+            return True
+        written_at, user_id = self._stored
+        return user_id != _user_id(data) or now - written_at >= WRITE_BEHIND_SECONDS
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        now = time.time()
+        if self._write_due(data, must_create, now):
+            super().save(must_create)
+            self._stored = (now, _user_id(data))
+        try:
+            self._cache.set(self.cache_key, (data, self._stored), self.get_expiry_age())
+        except Exception:
+            logger.exception("Error saving to cache (%s)", self._cache)
+
+    def delete(self, session_key=None):
+        super().delete(session_key)
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self._cache.delete(self.cache_key_prefix + session_key)
+
+    # The request cycle is synchronous; async callers share the same logic.
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    async def aexists(self, session_key):
+        return await sync_to_async(self.exists)(session_key)
+
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create)
+
+    async def adelete(self, session_key=None):
+        return await sync_to_async(self.delete)(session_key)
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+def _is_per_process(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND', '').endswith('.LocMemCache')
+
+
+@register(Tags.caches)
+def check_session_cache(app_configs, **kwargs):
+    """Write-behind sessions need a cache every worker shares."""
+    if settings.SESSION_ENGINE != 'public_site.cached_session_backend':
+        return []
+    if getattr(settings, 'SESSION_WRITE_BEHIND_SECONDS', 60) <= 0:
+        return []
+    if not _is_per_process(settings.SESSION_CACHE_ALIAS):
+        return []
+    return [Warning(
+        'Write-behind sessions are kept in a per-process LocMem cache.',
+        hint=(
+            'Session changes written behind are lost between workers. Configure a shared '
+            'SESSION_CACHE_BACKEND, set SESSION_WRITE_BEHIND_SECONDS=0, or run a single process.'
+        ),
+        id='public_site.W001',
+    )]
+
+
+@register(Tags.caches)
+def check_session_generation_cache(app_configs, **kwargs):
+    """Session revocations (public_site.session_generations) need a cache every worker shares."""
+    if not _is_per_process(settings.SESSION_CACHE_ALIAS):
+        return []
+    return [Warning(
+        'Session generations are kept in a per-process LocMem cache.',
+        hint=(
+            'Deleting or deactivating a user only signs their sessions out in the worker that made '
+            'the change. Configure a shared SESSION_CACHE_BACKEND, or run a single process.'
+        ),
+        id='public_site.W002',
+    )]
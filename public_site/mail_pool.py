@@ -0,0 +1,155 @@
+"""
+Pooled, long-lived connections of ``EMAIL_BACKEND``.
+
+``msg.send()`` opens a connection, which for SMTP means a TCP and TLS
+handshake and a login, sends one message and closes it again. A
+``ConnectionPool`` keeps up to ``size`` backend connections open between
+calls and lends them out: ``send_many()`` spreads a list of messages over as
+many of them as it can get, sending on each from its own thread.
+
+A connection idle for more than ``max_idle`` seconds is reopened before it is
+used, since SMTP servers drop quiet clients. When sending fails because the
+connection itself broke (the server hung up, a reset, a timeout), it is
+reopened and the message retried once; any other error, such as a refused
+recipient, belongs to that message alone. The outbox worker sends through the
+process's pool (``get_pool()``, sized by ``EMAIL_POOL_SIZE``).
+"""
+import queue
+import smtplib
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+# Errors after which a connection is no longer usable. Not OSError: every
+# SMTPException is one, including the replies refusing a single message.
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout)
+
+
+class PooledConnection:
+    def __init__(self, backend):
+        self.backend = backend
+        self.opened_at = None
+        self.last_used = 0.0
+
+    def open(self, max_idle):
+        if self.opened_at is not None and time.monotonic() - self.last_used > max_idle:
+            self.close()
+        if self.opened_at is None:
+            self.backend.open()
+            self.opened_at = self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.backend.close()
+        except Exception:
+            pass  # It is being thrown away either way.
+        self.opened_at = None
+
+    def send(self, message, max_idle):
+        """Send ``message``, reconnecting once if the connection broke."""
+        for retry in (False, True):
+            self.open(max_idle)
+            try:
+                if not self.backend.send_messages([message]):
+                    raise smtplib.SMTPException('The message was not accepted.')
+            except CONNECTION_ERRORS:
+                self.close()
+                if retry:
+                    raise
+            else:
+                self.last_used = time.monotonic()
+                return
+
+
+class ConnectionPool:
+    """Up to ``size`` open connections of ``backend`` (``EMAIL_BACKEND`` by default)."""
+
+    def __init__(self, size=None, max_idle=None, backend=None, **backend_kwargs):
+        self.size = max(1, size or getattr(settings, 'EMAIL_POOL_SIZE', 2))
+        self.max_idle = max_idle if max_idle is not None else getattr(settings, 'EMAIL_POOL_MAX_IDLE', 60)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._backend = backend
+        self._backend_kwargs = backend_kwargs
+
+    def acquire(self):
+        """Take an idle connection, create one if the pool is not full, or wait for one."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return PooledConnection(get_connection(self._backend, **self._backend_kwargs))
+        return self._idle.get()
+
+    def release(self, connection):
+        self._idle.put(connection)
+
+    def _send_chunk(self, messages):
+        connection = self.acquire()
+        try:
+            results = []
+            for message in messages:
+                try:
+                    connection.send(message, self.max_idle)
+                except Exception as error:
+                    results.append(error)
+                else:
+                    results.append(None)
+            return results
+        finally:
+            self.release(connection)
+
+    def send_many(self, messages):
+        """
+        Send ``messages`` over up to ``size`` connections. Returns one entry
+        per message, in order: ``None`` if it was sent, else the exception.
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+        workers = min(self.size, len(messages))
+        if workers == 1:
+            return self._send_chunk(messages)
+        chunks = [messages[i::workers] for i in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunk_results = list(executor.map(self._send_chunk, chunks))
+        results = [None] * len(messages)
+        for i, chunk in enumerate(chunk_results):
+            results[i::workers] = chunk
+        return results
+
+    def close(self):
+        """Close the idle connections; the pool opens new ones when used again."""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def send_many(messages):
+    """Send ``messages`` through the process's pool; see ``ConnectionPool.send_many``."""
+    return get_pool().send_many(messages)
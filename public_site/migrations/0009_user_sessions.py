@@ -0,0 +1,61 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:31
+
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def copy_sessions(apps, schema_editor):
+    """Carry the live sessions over from django_session, so nobody is signed out."""
+    user_session = apps.get_model('public_site', 'UserSession')
+    store = SessionStore()
+    sessions = []
+    rows = apps.get_model('sessions', 'Session').objects.filter(expire_date__gt=timezone.now())
+    for session in rows.iterator(chunk_size=2000):
+        user_id = store.decode(session.session_data).get(SESSION_KEY)
+        sessions.append(user_session(
+            session_key=session.session_key,
+            session_data=session.session_data,
+            expire_date=session.expire_date,
+            user_id=int(user_id) if str(user_id).isdigit() else None,
+        ))
+    user_session.objects.bulk_create(sessions, batch_size=2000)
+
+
+def restore_sessions(apps, schema_editor):
+    session = apps.get_model('sessions', 'Session')
+    session.objects.bulk_create(
+        [
+            session(session_key=row.session_key, session_data=row.session_data, expire_date=row.expire_date)
+            for row in apps.get_model('public_site', 'UserSession').objects.iterator(chunk_size=2000)
+        ],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('public_site', '0008_email_outbox'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSession',
+            fields=[
+                ('session_key', models.CharField(max_length=40, primary_key=True, serialize=False, verbose_name='session key')),
+                ('session_data', models.TextField(verbose_name='session data')),
+                ('expire_date', models.DateTimeField(db_index=True, verbose_name='expire date')),
+                ('user_id', models.IntegerField(db_index=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'session',
+                'verbose_name_plural': 'sessions',
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(copy_sessions, restore_sessions),
+    ]
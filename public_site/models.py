@@ -1,10 +1,14 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.auth.signals import user_logged_in
+from django.db import models, transaction
 import os
 from django.conf import settings
-from django.contrib.sessions.models import Session
-from django.db.models.signals import post_delete
+from django.contrib.sessions.base_session import AbstractBaseSession
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from library_admin import versions
+from . import checks  # noqa: F401 (registers the session cache checks)
+from . import session_generations
 
 # Create your models here.
 
@@ -41,13 +45,55 @@ class EmailOTP(models.Model):
     def __str__(self):
         return f"OTP for {self.user.username}"
 
-@receiver(post_delete, sender=User)
-def delete_user_sessions(sender, instance, **kwargs):
-    sessions = Session.objects.all()
-    for session in sessions:
-        data = session.get_decoded()
-        if data.get('_auth_user_id') == str(instance.id):
-            session.delete()
+class OutboxEmail(models.Model):
+    """An email waiting to be sent, or sent, by ``python manage.py send_outbox``; see ``public_site.outbox``."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    claimed_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} [{self.status}]"
+
+class UserSession(AbstractBaseSession):
+    """A session of ``SESSION_ENGINE = 'public_site.session_backend'``, indexed by its signed-in user."""
+    user_id = models.IntegerField(null=True, db_index=True)
+
+    @classmethod
+    def get_session_store_class(cls):
+        from .session_backend import SessionStore
+        return SessionStore
+
+    @classmethod
+    def delete_for_user(cls, user_id):
+        """Sign ``user_id`` out everywhere. Returns the number of sessions ended."""
+        from .cached_session_backend import SessionStore
+        sessions = cls.objects.filter(user_id=user_id)
+        session_keys = list(sessions.values_list('session_key', flat=True))
+        if not session_keys:
+            return 0
+        deleted = sessions.delete()[0]
+        SessionStore.forget(session_keys)
+        return deleted
 
 class AdminUser(User):
     class Meta:
@@ -60,3 +106,41 @@ class PublicUser(User):
         proxy = True
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+
+# Proxies send their own signals, e.g. when deleted from their admin pages.
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=AdminUser)
+@receiver(post_delete, sender=PublicUser)
+def delete_user_sessions(sender, instance, **kwargs):
+    # Bound now: the collector sets instance.pk to None before the commit.
+    user_id = instance.pk
+    UserSession.delete_for_user(user_id)
+    transaction.on_commit(lambda: session_generations.bump(user_id))
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=AdminUser)
+@receiver(post_save, sender=PublicUser)
+def revoke_inactive_user_sessions(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.is_active or (update_fields is not None and 'is_active' not in update_fields):
+        return
+    user_id = instance.pk
+    UserSession.delete_for_user(user_id)
+    transaction.on_commit(lambda: session_generations.bump(user_id))
+
+@receiver(user_logged_in)
+def remember_session_generation(sender, request, user, **kwargs):
+    session_generations.remember(request, user)
+
+# Comment threads show usernames and profile images.
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=AdminUser)
+@receiver(post_delete, sender=AdminUser)
+@receiver(post_save, sender=PublicUser)
+@receiver(post_delete, sender=PublicUser)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def bump_users_version(sender, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    versions.bump(versions.USERS)
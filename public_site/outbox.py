@@ -0,0 +1,122 @@
+"""
+Database-backed outbox for the account emails (OTP codes, verification).
+
+Views call ``enqueue()``, which only inserts an ``OutboxEmail`` row, so a slow
+or unreachable mail server never holds up a request. ``python manage.py
+send_outbox`` delivers them: each worker claims a batch of due emails and
+sends it over the long-lived connections of ``mail_pool``, so consecutive
+batches reuse the same SMTP sessions. Any Django backend works, including
+locmem and filebased ones.
+
+A claim is a lease: claimed rows are marked ``sending`` until ``LEASE`` from
+now, after which another worker may claim them again if their worker died. An
+email that fails is retried with exponential backoff and jitter, and marked
+``failed`` after ``MAX_ATTEMPTS``. Sent and failed emails hold codes, so the
+worker deletes them after ``RETENTION``.
+
+Without a running worker nothing is sent, OTP codes included: ``enqueue()``
+logs a warning while emails have been due for more than
+``OUTBOX_WARN_AFTER_SECONDS``.
+"""
+import logging
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import mail_pool
+from .models import OutboxEmail
+
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 6)
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+LEASE = timedelta(minutes=5)
+RETENTION = timedelta(days=1)
+WARN_AFTER = timedelta(seconds=getattr(settings, 'OUTBOX_WARN_AFTER_SECONDS', 300))
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(subject, body, to, html_body='', from_email=None):
+    """Queue an email for the outbox worker. ``to`` is a list of addresses."""
+    now = timezone.now()
+    if OutboxEmail.objects.filter(status__in=('pending', 'sending'), next_attempt_at__lt=now - WARN_AFTER).exists():
+        logger.warning(
+            "Queued emails have been due for over %d seconds; is 'python manage.py send_outbox' running?",
+            WARN_AFTER.total_seconds(),
+        )
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+        next_attempt_at=now,
+    )
+
+
+def backoff(attempts):
+    """Delay before retrying an email that failed ``attempts`` times."""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim(batch_size):
+    """Lease up to ``batch_size`` due emails to the caller and return them."""
+    now = timezone.now()
+    due = OutboxEmail.objects.filter(status__in=('pending', 'sending'), next_attempt_at__lte=now)
+    ids = list(due.order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    # Rows another worker claimed in between no longer match ``due``.
+    token = uuid.uuid4().hex
+    due.filter(pk__in=ids).update(status='sending', claimed_by=token, next_attempt_at=now + LEASE)
+    return list(OutboxEmail.objects.filter(pk__in=ids, claimed_by=token, status='sending').order_by('id'))
+
+
+def message_for(email):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email, email.to)
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _failed(email, error):
+    attempts = email.attempts + 1
+    changes = {'attempts': attempts, 'last_error': f"{type(error).__name__}: {error}"}
+    if attempts >= MAX_ATTEMPTS:
+        changes.update(status='failed')
+    else:
+        changes.update(status='pending', next_attempt_at=timezone.now() + backoff(attempts))
+    OutboxEmail.objects.filter(pk=email.pk, claimed_by=email.claimed_by).update(**changes)
+
+
+def send_batch(emails, pool=None):
+    """
+    Send claimed ``emails`` through ``pool`` (the process's connection pool by
+    default). Returns ``(sent, failed)``; failed emails are rescheduled or
+    given up on.
+    """
+    pool = pool or mail_pool.get_pool()
+    sent = []
+    for email, error in zip(emails, pool.send_many(message_for(email) for email in emails)):
+        if error is None:
+            sent.append(email.pk)
+        else:
+            _failed(email, error)
+    OutboxEmail.objects.filter(pk__in=sent).update(
+        status='sent', sent_at=timezone.now(), attempts=F('attempts') + 1, last_error='',
+    )
+    return len(sent), len(emails) - len(sent)
+
+
+def purge():
+    """Delete sent and failed emails older than ``RETENTION``. Returns how many."""
+    cutoff = timezone.now() - RETENTION
+    return OutboxEmail.objects.filter(
+        Q(status='sent', sent_at__lt=cutoff) | Q(status='failed', created_at__lt=cutoff)
+    ).delete()[0]
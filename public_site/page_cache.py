@@ -0,0 +1,151 @@
+"""
+Cache of the public HTML pages.
+
+Anonymous GETs of the views decorated with ``cached_page`` are stored whole,
+under the page, its normalized query parameters and the current versions of
+the tables it shows (``library_admin.versions``). A save bumps those versions,
+so pages built on the old ones are never asked for again and age out.
+
+Signed-in users get their own navbar and CSRF token, so their pages, and any
+page with pending flash messages or one that asked for a CSRF token, are
+always rendered. What they share with everyone else (the card lists, the
+category filters) is cached as ``{% cache %}`` fragments keyed by the same
+versions, passed to the templates as ``content_version``.
+
+Entries live in the ``pages`` cache. Admin edits call ``warm_after_commit``,
+which renders the default view of each page showing the edited model once the
+change commits, so the first visitor after an edit does not pay for it.
+"""
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse
+from django.urls import resolve, reverse
+from django.utils import translation
+
+from library_admin import versions
+
+CACHE_ALIAS = 'pages'
+
+# Query parameters the cached pages read; no other one changes a page.
+PARAMS = ('category', 'sort', 'page')
+
+# Pages rendered again after an admin edit to one of the tables they show.
+WARMED_PAGES = ('home', 'blogs', 'book_reviews', 'news')
+
+
+def get_cache():
+    return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else 'default']
+
+
+def content_version(request, keys):
+    """The version of ``keys`` for the page and fragment cache keys, read once per request."""
+    return versions.for_request(request, list(keys))[0]
+
+
+def cache_key(request, view_name, version):
+    params = sorted((name, value) for name in PARAMS for value in request.GET.getlist(name))
+    raw = f"{request.scheme}://{request.get_host()}{request.path}?{urlencode(params)}#{translation.get_language()}"
+    return f"page:{view_name}:{version}:{hashlib.sha256(raw.encode()).hexdigest()[:32]}"
+
+
+def _is_shared(request):
+    """Whether ``request`` gets the same page as every other anonymous visitor."""
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+def _is_storable(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # A template used {% csrf_token %}: the page carries this visitor's token.
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def cached_page(*keys):
+    """Cache the anonymous GETs of a page whose content only changes with ``keys``."""
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if not _is_shared(request):
+                return view(request, *args, **kwargs)
+            cache = get_cache()
+            key = cache_key(request, view.__name__, content_version(request, keys))
+            entry = cache.get(key)
+            if entry is not None:
+                content_type, content = entry
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Cache'] = 'HIT'
+                return response
+            response = view(request, *args, **kwargs)
+            if _is_storable(request, response):
+                cache.set(key, (response['Content-Type'], response.content))
+            response['X-Cache'] = 'MISS'
+            return response
+        inner.page_cache_keys = keys
+        return inner
+    return decorator
+
+
+class _WarmUpRequest(HttpRequest):
+    """An anonymous GET of ``path`` on ``host``, as a visitor without cookies sends it."""
+
+    def __init__(self, path, host, scheme):
+        super().__init__()
+        self.method = 'GET'
+        self.path = self.path_info = path
+        self.META['HTTP_HOST'] = host
+        self.user = AnonymousUser()
+        self._scheme = scheme
+
+    def _get_scheme(self):
+        return self._scheme
+
+
+def warm(host, scheme='http', models=None):
+    """
+    Render the default view of the ``WARMED_PAGES`` that show any of
+    ``models`` (all of them by default) into the cache, as an anonymous
+    visitor of ``host`` would see it. Returns the names of the pages rendered.
+    """
+    changed = None if models is None else {versions.model_key(model) for model in models}
+    warmed = []
+    for name in WARMED_PAGES:
+        path = reverse(name)
+        match = resolve(path)
+        keys = getattr(match.func, 'page_cache_keys', None)
+        if keys is None or (changed is not None and changed.isdisjoint(keys)):
+            continue
+        request = _WarmUpRequest(path, host, scheme)
+        request.resolver_match = match
+        # The language LocaleMiddleware gives a visitor without preferences.
+        with translation.override(translation.get_language_from_request(request)):
+            match.func(request, *match.args, **match.kwargs)
+        warmed.append(name)
+    return warmed
+
+
+def warm_after_commit(request, model):
+    """Warm the pages showing ``model`` once the admin ``request``'s changes commit."""
+    pending = request.__dict__.setdefault('_page_cache_warm', set())
+    if not pending:
+        def run():
+            models = set(pending)
+            pending.clear()
+            warm(request.get_host(), request.scheme, models)
+
+        # A failed warm-up only costs the next visitor a render.
+        transaction.on_commit(run, robust=True)
+    pending.add(model)
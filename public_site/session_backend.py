@@ -0,0 +1,26 @@
+"""
+Database sessions that record the signed-in user of each session.
+
+``UserSession`` rows carry the ``user_id`` of the session's data next to it,
+set on every save, so the sessions of a user are found with an index lookup
+instead of decoding every session (``UserSession.delete_for_user()``). Session
+data is signed and encoded exactly as by Django's ``db`` engine.
+"""
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+
+from .models import UserSession
+
+
+class SessionStore(DBStore):
+    @classmethod
+    def get_model_class(cls):
+        return UserSession
+
+    def create_model_instance(self, data):
+        obj = super().create_model_instance(data)
+        try:
+            obj.user_id = int(data.get(SESSION_KEY))
+        except (TypeError, ValueError):
+            obj.user_id = None
+        return obj
@@ -0,0 +1,53 @@
+"""
+Per-user session generations, to sign users out everywhere without a query.
+
+A user's generation is a random token in the session cache
+(``SESSION_CACHE_ALIAS``), replaced by ``bump()`` when the user is deleted or
+deactivated. Signing in copies the current token into the session, and
+``LogoutDeletedUserMiddleware`` signs out a session whose token is no longer
+the current one: one cache read per request with a signed-in session, and no
+database query.
+
+A user never bumped has no token, and every session of theirs is current. If
+the cache loses a token, or is per process and only the process that made
+the change sees it, the sessions it revoked are let through again, but they
+are not a way back in: the user's sessions were deleted along with the user,
+and authentication refuses deleted and inactive users anyway.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+
+SESSION_GENERATION_KEY = '_auth_user_generation'
+
+
+def get_cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def cache_key(user_id):
+    return f"session-generation:{user_id}"
+
+
+def current(user_id):
+    return get_cache().get(cache_key(user_id))
+
+
+def bump(user_id):
+    """Revoke every session ``user_id`` signed in with so far."""
+    get_cache().set(cache_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def remember(request, user):
+    """Stamp the freshly signed-in session of ``request`` with ``user``'s generation."""
+    request.session[SESSION_GENERATION_KEY] = current(user.pk)
+
+
+def is_revoked(session):
+    user_id = session.get(SESSION_KEY)
+    if user_id is None:
+        return False
+    token = current(user_id)
+    return token is not None and token != session.get(SESSION_GENERATION_KEY)
@@ -1,3 +1,237 @@
-from django.test import TestCase
-
-# Create your tests here.
+import smtplib
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import cached_session_backend, checks, mail_pool, outbox, session_generations
+from .middleware import LogoutDeletedUserMiddleware
+from .models import OutboxEmail, PublicUser, UserSession
+
+
+class FailingBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionRefusedError("Connection refused")
+
+
+class DroppingBackend(EmailBackend):
+    """Loses its connection after every two messages, like a server closing idle clients."""
+    opened = 0
+
+    def open(self):
+        DroppingBackend.opened += 1
+        self.remaining = 2
+
+    def send_messages(self, messages):
+        if not self.remaining:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.remaining -= 1
+        return super().send_messages(messages)
+
+
+class RefusingBackend(DroppingBackend):
+    """Refuses mail to one recipient, like a server answering 550 to RCPT TO."""
+
+    def send_messages(self, messages):
+        if "refused@example.com" in messages[0].to:
+            raise smtplib.SMTPRecipientsRefused({"refused@example.com": (550, b"No such user")})
+        return super().send_messages(messages)
+
+
+class OutboxTests(TestCase):
+    def test_queued_emails_are_sent_by_the_worker(self):
+        outbox.enqueue("Your OTP Code", "Code: 123456", ["reader@example.com"], html_body="<p>123456</p>")
+        self.assertEqual(mail.outbox, [])
+
+        call_command('send_outbox', '--once', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["reader@example.com"])
+        self.assertEqual(mail.outbox[0].alternatives[0][0], "<p>123456</p>")
+        self.assertEqual(OutboxEmail.objects.get().status, 'sent')
+        self.assertEqual(outbox.claim(10), [])
+
+    def test_failed_emails_are_retried_then_given_up_on(self):
+        email = outbox.enqueue("Your OTP Code", "Code: 123456", ["reader@example.com"])
+        failing = mail_pool.ConnectionPool(size=1, backend='public_site.tests.FailingBackend')
+        for attempt in range(1, outbox.MAX_ATTEMPTS + 1):
+            OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+            self.assertEqual(outbox.send_batch(outbox.claim(10), failing), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual(email.attempts, attempt)
+            self.assertIn("Connection refused", email.last_error)
+        self.assertEqual(email.status, 'failed')
+        self.assertEqual(mail.outbox, [])
+
+    def test_finished_emails_are_purged_and_stalled_ones_reported(self):
+        old = timezone.now() - outbox.RETENTION - timedelta(minutes=1)
+        sent = outbox.enqueue("Your OTP Code", "Code: 123456", ["reader@example.com"])
+        failed = outbox.enqueue("Your OTP Code", "Code: 654321", ["reader@example.com"])
+        OutboxEmail.objects.filter(pk=sent.pk).update(status='sent', sent_at=old)
+        OutboxEmail.objects.filter(pk=failed.pk).update(status='failed', created_at=old)
+        recent = outbox.enqueue("Your OTP Code", "Code: 111111", ["reader@example.com"])
+        self.assertEqual(outbox.purge(), 2)
+        self.assertEqual(list(OutboxEmail.objects.values_list('pk', flat=True)), [recent.pk])
+
+        OutboxEmail.objects.filter(pk=recent.pk).update(next_attempt_at=timezone.now() - outbox.WARN_AFTER * 2)
+        with self.assertLogs('public_site.outbox', 'WARNING') as logs:
+            outbox.enqueue("Your OTP Code", "Code: 222222", ["reader@example.com"])
+        self.assertIn("send_outbox", logs.output[0])
+
+
+class MailPoolTests(TestCase):
+    def test_pooled_connections_are_reused_and_reopened(self):
+        pool = mail_pool.ConnectionPool(size=1, backend='public_site.tests.DroppingBackend')
+        messages = [mail.EmailMessage(f"Message {i}", "", to=["reader@example.com"]) for i in range(6)]
+        DroppingBackend.opened = 0
+
+        self.assertEqual(pool.send_many(messages[:4]), [None] * 4)
+        self.assertEqual(DroppingBackend.opened, 2)
+        self.assertEqual(pool.send_many(messages[4:]), [None] * 2)
+        self.assertEqual(DroppingBackend.opened, 3)
+        self.assertEqual(sorted(message.subject for message in mail.outbox), [f"Message {i}" for i in range(6)])
+
+    def test_refused_messages_fail_alone_on_the_same_connection(self):
+        pool = mail_pool.ConnectionPool(size=1, backend='public_site.tests.RefusingBackend')
+        messages = [mail.EmailMessage("Refused", "", to=["refused@example.com"]), mail.EmailMessage("Sent", "", to=["reader@example.com"])]
+        DroppingBackend.opened = 0
+
+        refused, sent = pool.send_many(messages)
+        self.assertIsInstance(refused, smtplib.SMTPRecipientsRefused)
+        self.assertIsNone(sent)
+        self.assertEqual(DroppingBackend.opened, 1)
+        self.assertEqual([message.subject for message in mail.outbox], ["Sent"])
+
+
+class UserSessionTests(TestCase):
+    def setUp(self):
+        caches['sessions'].clear()
+
+    def test_deleting_a_user_ends_only_their_sessions(self):
+        reader, other = User.objects.create_user('reader'), User.objects.create_user('other')
+        for user in (reader, reader, other):
+            self.client_class().force_login(user)
+        self.client.get('/')  # An anonymous session is not stored at all.
+        self.assertEqual(
+            sorted(UserSession.objects.values_list('user_id', flat=True)), sorted([reader.pk, reader.pk, other.pk]),
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            ended = UserSession.delete_for_user(reader.pk)
+        self.assertEqual(ended, 2)
+        self.assertEqual(len(queries), 2)  # The keys to drop from the cache, then the delete.
+
+        other.delete()
+        self.assertFalse(UserSession.objects.exists())
+
+
+class SessionRevocationTests(TestCase):
+    def setUp(self):
+        caches['sessions'].clear()
+
+    def test_revoked_sessions_are_signed_out_without_a_user_query(self):
+        reader = User.objects.create_user('reader')
+        self.client.force_login(reader)
+        middleware = LogoutDeletedUserMiddleware(lambda request: HttpResponse())
+
+        def signed_in_request():
+            request = RequestFactory().get('/')
+            request.session = self.client.session
+            request.session.keys()  # Loaded once per request whatever the middleware does.
+            return request
+
+        request = signed_in_request()
+        with CaptureQueriesContext(connection) as queries:
+            middleware(request)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(request.session['_auth_user_id'], str(reader.pk))
+
+        request = signed_in_request()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Deactivated from the Users admin page.
+            public_user = PublicUser.objects.get(pk=reader.pk)
+            public_user.is_active = False
+            public_user.save()
+        self.assertFalse(UserSession.objects.exists())
+        middleware(request)
+        self.assertNotIn('_auth_user_id', request.session)
+
+        # Signing in again starts a new generation.
+        reader.is_active = True
+        reader.save()
+        self.client.force_login(reader)
+        request = signed_in_request()
+        middleware(request)
+        self.assertEqual(request.session['_auth_user_id'], str(reader.pk))
+
+    def test_deleting_a_user_in_a_transaction_revokes_their_sessions(self):
+        reader = User.objects.create_user('reader')
+        self.client.force_login(reader)
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        request.session.keys()  # A request in flight while the user is deleted.
+        user_id = reader.pk
+        # The admin delete view runs in a transaction too.
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            PublicUser.objects.get(pk=user_id).delete()
+        self.assertIsNotNone(session_generations.current(user_id))
+        self.assertIsNone(session_generations.current(None))
+        self.assertTrue(session_generations.is_revoked(request.session))
+
+    def test_a_per_process_generation_cache_is_reported(self):
+        shared = {**settings.CACHES, 'sessions': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        per_process = {**settings.CACHES, 'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=per_process):
+            self.assertEqual([warning.id for warning in checks.check_session_generation_cache(None)], ['public_site.W002'])
+        with override_settings(CACHES=shared):
+            self.assertEqual(checks.check_session_generation_cache(None), [])
+
+
+class CachedSessionTests(TestCase):
+    def setUp(self):
+        caches['sessions'].clear()
+
+    @override_settings(SESSION_ENGINE='public_site.cached_session_backend')
+    def test_session_changes_are_written_behind(self):
+        reader = User.objects.create_user('reader')
+        self.client.force_login(reader)
+        session_key = self.client.session.session_key
+        row = UserSession.objects.get(pk=session_key)
+        self.assertEqual(row.user_id, reader.pk)
+
+        session = cached_session_backend.SessionStore(session_key)
+        with CaptureQueriesContext(connection) as queries:
+            session['cart'] = [1, 2]
+            session.save()
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(cached_session_backend.SessionStore(session_key)['cart'], [1, 2])
+        self.assertNotIn('cart', UserSession.objects.get(pk=session_key).get_decoded())
+
+        # Signing out is written through at once.
+        session.flush()
+        self.assertFalse(UserSession.objects.filter(pk=session_key).exists())
+        self.assertFalse(cached_session_backend.SessionStore(session_key).exists(session_key))
+
+        # Without its cache entry, a session is read back from the table.
+        self.client.force_login(reader)
+        session_key = self.client.session.session_key
+        caches['sessions'].clear()
+        self.assertEqual(cached_session_backend.SessionStore(session_key)['_auth_user_id'], str(reader.pk))
+
+    def test_purge_deletes_only_expired_sessions(self):
+        self.client.force_login(User.objects.create_user('reader'))
+        UserSession.objects.bulk_create([
+            UserSession(session_key=f'expired{i}', session_data='', expire_date=timezone.now() - timedelta(days=1))
+            for i in range(5)
+        ])
+        call_command('purge_sessions', '--batch-size', '2', '--sleep', '0', stdout=StringIO())
+        self.assertEqual(list(UserSession.objects.values_list('pk', flat=True)), [self.client.session.session_key])
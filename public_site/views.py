@@ -1,6 +1,5 @@
 from django.shortcuts import render, get_object_or_404
-from library_admin.models import Book, Article, News, BookReview, Category
-import markdown
+from library_admin.models import Book, Article, FeedItem, News, BookReview, Category
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login as auth_login
 from django.urls import reverse
@@ -18,7 +17,7 @@ from django.contrib.auth.forms import PasswordChangeForm
 from django.views.decorators.csrf import csrf_exempt
 import os
 from django.conf import settings
-from django.core.mail import send_mail, EmailMultiAlternatives
+from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
@@ -31,35 +30,43 @@ from operator import attrgetter
 from django.utils import timezone
 import random
 from django.core.paginator import Paginator
+from django.utils.functional import SimpleLazyObject
+from library_admin import versions
 from library_admin.forms import BookRequestForm
+from . import outbox
+from .page_cache import cached_page, content_version
 
-# Create your views here.
+# Tables each cached page shows (see page_cache).
+HOME_VERSIONS = [versions.model_key(Article), versions.model_key(News), versions.model_key(BookReview), versions.model_key(Book)]
+BLOG_VERSIONS = [versions.model_key(Article), versions.model_key(Category)]
+NEWS_VERSIONS = [versions.model_key(News), versions.model_key(Category)]
+REVIEW_VERSIONS = [versions.model_key(BookReview), versions.model_key(Book), versions.model_key(Category)]
 
-def home(request):
-    # Fetch latest 5 items for each type
-    latest_blogs = Article.objects.order_by('-publication_date')[:5]
-    latest_news = News.objects.order_by('-publication_date')[:5]
-    latest_reviews = BookReview.objects.order_by('-review_date')[:5]
+# Cards shown per section of the home page.
+HOME_FEED_SIZE = 3
 
-    # Add extra fields for template compatibility
-    for item in latest_blogs:
-        item.type = 'blog'
-        item.image_url = item.image.url if item.image else '/static/images/blog-default.jpg'
-    for item in latest_news:
-        item.type = 'news'
-        item.image_url = item.image.url if item.image else '/static/images/blog-default.jpg'
-    for item in latest_reviews:
-        item.type = 'review'
-        item.book_title = item.book.title
-        item.reviewer_name = item.reviewer_name
+# Create your views here.
+
+def _with_image_urls(items):
+    # Called lazily from the templates, so a cached fragment skips the query.
+    items = list(items)
+    for item in items:
         item.image_url = item.image.url if item.image else '/static/images/blog-default.jpg'
+    return items
+
+@cached_page(*HOME_VERSIONS)
+def home(request):
+    # Latest items of each type, from the feed in one query
+    latest = SimpleLazyObject(lambda: FeedItem.latest(HOME_FEED_SIZE))
 
     return render(request, 'home.html', {
-        'latest_blogs': latest_blogs,
-        'latest_news': latest_news,
-        'latest_reviews': latest_reviews,
+        'latest_blogs': SimpleLazyObject(lambda: latest['blog']),
+        'latest_news': SimpleLazyObject(lambda: latest['news']),
+        'latest_reviews': SimpleLazyObject(lambda: latest['bookreview']),
+        'content_version': content_version(request, HOME_VERSIONS),
     })
 
+@cached_page(*BLOG_VERSIONS)
 def blogs(request):
     from library_admin.models import Article
     from django.core.paginator import Paginator
@@ -69,7 +76,7 @@ def blogs(request):
     sort_by = request.GET.get('sort', 'newest')
     
     # Get all blogs
-    blogs = Article.objects.all()
+    blogs = Article.objects.defer('content', 'content_html')
     
     # Apply category filter
     if category != 'all':
@@ -83,14 +90,10 @@ def blogs(request):
     else:  # newest
         blogs = blogs.order_by('-publication_date')
     
-    # Add image_url to each blog
-    for item in blogs:
-        item.image_url = item.image.url if item.image else '/static/images/blog-default.jpg'
-    
     # Pagination - 12 blogs per page
     paginator = Paginator(blogs, 12)
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = SimpleLazyObject(lambda: paginator.get_page(page_number))
     
     # Get all categories for the filter dropdown
     blog_categories = (
@@ -99,12 +102,14 @@ def blogs(request):
     )
     
     return render(request, 'blogs.html', {
-        'blogs': page_obj.object_list, 
+        'blogs': SimpleLazyObject(lambda: _with_image_urls(page_obj.object_list)),
         'page_obj': page_obj, 
         'blog_categories': blog_categories,
-        'django_api_url': request.build_absolute_uri('/').rstrip('/')
+        'django_api_url': request.build_absolute_uri('/').rstrip('/'),
+        'content_version': content_version(request, BLOG_VERSIONS),
     })
 
+@cached_page(*REVIEW_VERSIONS)
 def book_reviews(request):
     from library_admin.models import BookReview, Book
     from django.core.paginator import Paginator
@@ -114,7 +119,7 @@ def book_reviews(request):
     sort_by = request.GET.get('sort', 'newest')
     
     # Get all reviews
-    reviews = BookReview.objects.all()
+    reviews = BookReview.objects.select_related('book').defer('review_text', 'review_text_html')
     
     # Get categories for the filter dropdown (only active book categories)
     review_categories = Category.objects.filter(type='book', active=True, books__isnull=False).distinct()
@@ -131,20 +136,17 @@ def book_reviews(request):
     else:  # newest
         reviews = reviews.order_by('-review_date')
     
-    # Add image_url to each review
-    for item in reviews:
-        item.image_url = item.image.url if item.image else '/static/images/blog-default.jpg'
-    
     # Pagination - 12 reviews per page
     paginator = Paginator(reviews, 12)
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = SimpleLazyObject(lambda: paginator.get_page(page_number))
     
     return render(request, 'book_reviews.html', {
-        'reviews': page_obj.object_list, 
+        'reviews': SimpleLazyObject(lambda: _with_image_urls(page_obj.object_list)),
         'page_obj': page_obj, 
         'review_categories': review_categories,
-        'django_api_url': request.build_absolute_uri('/').rstrip('/')
+        'django_api_url': request.build_absolute_uri('/').rstrip('/'),
+        'content_version': content_version(request, REVIEW_VERSIONS),
     })
 
 def books(request):
@@ -181,6 +183,7 @@ def books(request):
         'book_request_success': book_request_success,
     })
 
+@cached_page(*NEWS_VERSIONS)
 def news(request):
     from library_admin.models import News
     from django.core.paginator import Paginator
@@ -190,7 +193,7 @@ def news(request):
     sort_by = request.GET.get('sort', 'newest')
     
     # Get all news
-    news_items = News.objects.all()
+    news_items = News.objects.defer('content', 'content_html')
     
     # Apply category filter
     if category != 'all':
@@ -207,7 +210,7 @@ def news(request):
     # Pagination - 12 news items per page
     paginator = Paginator(news_items, 12)
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = SimpleLazyObject(lambda: paginator.get_page(page_number))
     
     # Get all categories for the filter dropdown
     news_categories = (
@@ -216,10 +219,11 @@ def news(request):
     )
     
     return render(request, 'news.html', {
-        'news': page_obj.object_list, 
+        'news': SimpleLazyObject(lambda: page_obj.object_list),
         'page_obj': page_obj, 
         'news_categories': news_categories,
-        'django_api_url': request.build_absolute_uri('/').rstrip('/')
+        'django_api_url': request.build_absolute_uri('/').rstrip('/'),
+        'content_version': content_version(request, NEWS_VERSIONS),
     })
 
 def contact(request):
@@ -239,6 +243,7 @@ def contact(request):
             return render(request, 'contact.html', {'success': True})
     return render(request, 'contact.html')
 
+@cached_page()
 def about(request):
     return render(request, 'about.html')
 
@@ -375,9 +380,7 @@ def register(request):
         }
         html_content = render_to_string('account/otp_email.html', context)
         text_content = f"Hi {user.username},\n\nYour OTP code is: {otp_code}\n\nEnter this code on the website to verify your account."
-        msg = EmailMultiAlternatives(subject, text_content, from_email, [to_email])
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
+        outbox.enqueue(subject, text_content, [to_email], html_content, from_email)
         # Store registration info in session for OTP verification
         request.session['pending_username'] = username
         request.session['pending_password'] = password1
@@ -402,27 +405,25 @@ def activate_account(request, uidb64, token):
         return redirect('login')
 
 def blog_detail(request, blog_id):
-    blog = get_object_or_404(Article, id=blog_id)
-    blog.content = markdown.markdown(blog.content, extensions=["extra", "codehilite", "toc"])
+    blog = get_object_or_404(Article.objects.select_related('category').defer('content'), id=blog_id)
     # Get related blogs (e.g., same category, excluding current blog)
-    related_blogs = Article.objects.filter(category=blog.category).exclude(id=blog.id)[:6] if blog.category else Article.objects.exclude(id=blog.id)[:6]
+    related_blogs = Article.objects.defer('content', 'content_html')
+    related_blogs = related_blogs.filter(category=blog.category).exclude(id=blog.id)[:6] if blog.category else related_blogs.exclude(id=blog.id)[:6]
     return render(request, 'blog_detail.html', {'blog': blog, 'blog_id': blog_id, 'blogs': related_blogs})
 
 def book_detail(request, book_id):
-    book = get_object_or_404(Book, id=book_id)
-    book.description = markdown.markdown(book.description, extensions=["extra", "codehilite", "toc"])
+    book = get_object_or_404(Book.objects.select_related('category').defer('description'), id=book_id)
     return render(request, 'book_detail.html', {'book': book})
 
 def review_detail(request, review_id):
-    review = get_object_or_404(BookReview, id=review_id)
-    review.review_text = markdown.markdown(review.review_text, extensions=["extra", "codehilite", "toc"])
+    review = get_object_or_404(BookReview.objects.select_related('book').defer('review_text'), id=review_id)
     return render(request, 'book_review_detail.html', {'review': review, 'review_id': review_id})
 
 def news_detail(request, news_id):
-    news = get_object_or_404(News, id=news_id)
-    news.content = markdown.markdown(news.content, extensions=["extra", "codehilite", "toc"])
+    news = get_object_or_404(News.objects.select_related('category').defer('content'), id=news_id)
     return render(request, 'news_detail.html', {'news': news})
 
+@cached_page()
 def digital_resources(request):
     """Digital Resources page with information about online resources"""
     digital_resources_data = {
@@ -453,6 +454,7 @@ def digital_resources(request):
     }
     return render(request, 'digital_resources.html', {'resources': digital_resources_data})
 
+@cached_page()
 def community_programs(request):
     """Community Programs page with information about library programs"""
     programs_data = {
@@ -543,9 +545,7 @@ def verify_otp(request):
                     }
                     html_content = render_to_string('account/congrat_email.html', context)
                     text_content = f"Congratulations, {user.username}!\n\nYour account has been successfully verified. Welcome to the Public Library Bagarji community!\n\nA library is not a luxury but one of the necessities of life. — Henry Ward Beecher\nJoining a community of readers is joining a community of dreamers.\nHere, you gain access to knowledge, inspiration, and lifelong friendships.\n\nWe are excited to have you with us. Explore, learn, and grow with our vibrant community. Stay tuned for updates, events, and exclusive resources!\n\n© {timezone.now().year} Public Library Bagarji. All rights reserved."
-                    msg = EmailMultiAlternatives(subject, text_content, from_email, [to_email])
-                    msg.attach_alternative(html_content, "text/html")
-                    msg.send()
+                    outbox.enqueue(subject, text_content, [to_email], html_content, from_email)
                     # Clear session data
                     request.session.pop('pending_username', None)
                     request.session.pop('pending_password', None)
@@ -573,9 +573,7 @@ def verify_otp(request):
             }
             html_content = render_to_string('account/otp_email.html', context)
             text_content = f"Hi {user.username},\n\nYour OTP code is: {otp_code}\n\nEnter this code on the website to verify your account."
-            msg = EmailMultiAlternatives(subject, text_content, from_email, [to_email])
-            msg.attach_alternative(html_content, "text/html")
-            msg.send()
+            outbox.enqueue(subject, text_content, [to_email], html_content, from_email)
             messages.success(request, 'A new OTP code has been sent to your email.')
         except User.DoesNotExist:
             error = 'Invalid request.'